@@ -1,38 +1,151 @@
 # Copyright (C) 2008-2011 Dejan Muhamedagic <dmuhamedagic@suse.de>
 # See COPYING for license information.
 #
-# Cache stuff. A naive implementation.
+# Cache stuff.
+#
+# Cached values live in named regions. A region holds at most
+# maxsize entries and drops the least recently used one when it
+# is full. Entries expire ttl seconds after they were stored
+# (never if ttl is None). A region may also ask to be emptied on
+# events such as a CIB commit, see invalidate().
 
 import time
+import threading
+from . import ordereddict
+
+
+_regions = ordereddict.odict()
+_events = {}
+
+
+class Region(object):
+    '''
+    A named, size bounded cache. Safe to use from threads.
+    '''
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = ordereddict.odict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_cached(self, key):
+        '''
+        Is there a live entry for key? Counts as a hit or a
+        miss and marks the entry as recently used.
+        '''
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return False
+            if expires is not None and expires < time.time():
+                self.misses += 1
+                return False
+            self._entries[key] = (expires, value)
+            self.hits += 1
+            return True
+
+    def retrieve(self, key):
+        '''
+        The value stored for key, or None. Call is_cached()
+        first, which takes care of expiry.
+        '''
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry[1]
+
+    def store(self, key, value):
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, key=None):
+        '''
+        Drop the entry for key, or all entries.
+        '''
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            elif key in self._entries:
+                del self._entries[key]
+
+
+def region(name, maxsize=1024, ttl=None, invalidate_on=()):
+    '''
+    The named region, created on first use. invalidate_on
+    lists the events which empty the region.
+    '''
+    r = _regions.get(name)
+    if r is None:
+        r = _regions[name] = Region(name, maxsize, ttl)
+    for event in invalidate_on:
+        _events.setdefault(event, set()).add(name)
+    return r
+
 
+def invalidate(event):
+    '''
+    Something happened which makes cached data stale, such as
+    "cib-commit" or "agent-install". Empty all regions which
+    subscribed to the event.
+    '''
+    for name in _events.get(event, ()):
+        _regions[name].invalidate()
 
-_max_cache_age = 600  # seconds
-_stamp = time.time()
-_lists = {}
 
+def clear():
+    for r in _regions.itervalues():
+        r.invalidate()
 
-def _clear():
-    global _stamp
-    global _lists
-    _stamp = time.time()
-    _lists = {}
 
+def stats():
+    '''
+    List of (name, size, maxsize, ttl, hits, misses, evictions),
+    one per region.
+    '''
+    return [(r.name, len(r), r.maxsize, r.ttl, r.hits, r.misses, r.evictions)
+            for r in _regions.itervalues()]
 
-def is_cached(name):
-    if time.time() - _stamp > _max_cache_age:
-        _clear()
-    return name in _lists
 
+def memoize(function=None, maxsize=256, ttl=None, invalidate_on=()):
+    '''
+    Decorator to invoke a function once only for any argument.
+    Use either as @memoize or as @memoize(maxsize=..., ...).
+    '''
+    if function is None:
+        return lambda function: memoize(function, maxsize, ttl, invalidate_on)
+    r = region("%s.%s" % (function.__module__, function.__name__),
+               maxsize=maxsize, ttl=ttl, invalidate_on=invalidate_on)
 
-def store(name, lst):
-    _lists[name] = lst
-    return lst
+    def inner(*args):
+        if r.is_cached(args):
+            return r.retrieve(args)
+        return r.store(args, function(*args))
+    inner.__name__ = function.__name__
+    inner.__doc__ = function.__doc__
+    return inner
 
 
-def retrieve(name):
-    if is_cached(name):
-        return _lists[name]
-    return None
+# the default region for ad-hoc entries
+_default = region("default", ttl=600)
+is_cached = _default.is_cached
+store = _default.store
+retrieve = _default.retrieve
 
 
 # vim:ts=4:sw=4:et:
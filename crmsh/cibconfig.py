@@ -9,10 +9,10 @@ import re
 import fnmatch
 import time
 import collections
+from . import cache
 from . import config
 from . import options
 from . import constants
-from . import tmpfiles
 from . import clidisplay
 from . import idmgmt
 from . import schema
@@ -23,7 +23,7 @@ from . import ordereddict
 from . import orderedset
 from . import cibstatus
 from . import crm_gv
-from .ra import get_ra, get_properties_list, get_pe_meta, get_properties_meta
+from .ra import get_ra, get_properties_list, get_pe_meta, get_properties_meta, prefetch_meta
 from .msg import common_warn, common_err, common_debug, common_info, err_buf
 from .msg import common_error, constraint_norefobj_err, cib_parse_err, no_object_err
 from .msg import missing_obj_err, common_warning, update_err, unsupported_err, empty_cib_err
@@ -43,7 +43,7 @@ from .xmlutil import remove_id_used_attributes, get_top_cib_nodes
 from .xmlutil import merge_attributes, is_cib_element, sanity_check_meta
 from .xmlutil import is_simpleconstraint, is_template, rmnode, is_defaults, is_live_cib
 from .xmlutil import get_rsc_operations, delete_rscref, xml_equals, lookup_node, RscState
-from .xmlutil import cibtext2elem, is_related, check_id_ref
+from .xmlutil import cibtext2elem, is_related, related_ids, check_id_ref, cib_patch
 from .cliformat import get_score, nvpairs2list, abs_pos_score, cli_acl_roleref, nvpair_format
 from .cliformat import cli_nvpair, cli_acl_rule, rsc_set_constraint, get_kind, head_id_format
 from .cliformat import cli_operations, simple_rsc_constraint, cli_rule, cli_format
@@ -488,10 +488,23 @@ class CibObjectSet(object):
                 common_warning(msg)
         return rc
 
+    def _prefetch_meta(self, set_obj_all):
+        '''
+        Read the meta-data of all agents to be checked in one
+        go. The unique parameter check looks at all primitives.
+        '''
+        objs = self.obj_set
+        if any(o.obj_type == "primitive" for o in objs):
+            objs = set_obj_all.obj_set
+        nodes = [reduce_primitive(o.node) for o in objs
+                 if o.node is not None and (is_primitive(o.node) or is_template(o.node))]
+        prefetch_meta(get_ra(n) for n in nodes if n is not None)
+
     def semantic_check(self, set_obj_all):
         '''
         Test objects for sanity. This is about semantics.
         '''
+        self._prefetch_meta(set_obj_all)
         rc = self._check_unique_clash(set_obj_all)
         for obj in sorted(self.obj_set, key=lambda x: x.obj_id):
             rc |= obj.check_sanity()
@@ -555,13 +568,15 @@ class CibObjectSetCli(CibObjectSet):
         rc = True
         err_buf.start_tmp_lineno()
         comments = []
-        for cli_text in lines2cli(s):
-            err_buf.incr_lineno()
-            node = parse.parse(cli_text, comments=comments)
-            if node not in (False, None):
-                rc = rc and diff.add(node)
-            elif node is False:
-                rc = False
+        with utils.nogc():
+            with utils.timed("save: parse"):
+                for cli_text in lines2cli(s):
+                    err_buf.incr_lineno()
+                    node = parse.parse(cli_text, comments=comments)
+                    if node not in (False, None):
+                        rc = rc and diff.add(node)
+                    elif node is False:
+                        rc = False
         err_buf.stop_tmp_lineno()
 
         # we can't proceed if there was a syntax error, but we
@@ -569,7 +584,8 @@ class CibObjectSetCli(CibObjectSet):
         if not rc:
             return rc
 
-        rc = diff.apply(cib_factory, mode='cli', remove=remove, method=method)
+        with utils.nogc():
+            rc = diff.apply(cib_factory, mode='cli', remove=remove, method=method)
         if not rc:
             self._initialize()
         return rc
@@ -2129,6 +2145,11 @@ def default_id_for_obj(obj_type):
     return default_id_for_tag(backtrans.get(obj_type))
 
 
+def _is_glob(s):
+    "Does the id contain fnmatch wildcards?"
+    return any(c in s for c in "*?[")
+
+
 def can_migrate(node):
     return 'true' in node.xpath('.//nvpair[@name="allow-migrate"]/@value')
 
@@ -2177,25 +2198,18 @@ class CibDiff(object):
                 return obj.obj_type
         return None
 
-    def _is_node(self, nid):
-        for obj in self.objset.all_set:
-            if obj.obj_id == nid and obj.obj_type == 'node':
-                return True
-        return False
-
-    def _is_resource(self, nid):
-        for obj in self.objset.all_set:
-            if obj.obj_id == nid and obj.obj_type != 'node':
-                return True
-        return False
+    def _all_ids(self, nodes):
+        "Ids of all nodes (or of all other objects)."
+        return set(obj.obj_id for obj in self.objset.all_set
+                   if (obj.obj_type == 'node') == nodes)
 
     def _obj_nodes(self):
-        return orderedset.oset([n for n in self.objset.obj_ids
-                                if self._is_node(n)])
+        ids = self._all_ids(True)
+        return orderedset.oset([n for n in self.objset.obj_ids if n in ids])
 
     def _obj_resources(self):
-        return orderedset.oset([n for n in self.objset.obj_ids
-                                if self._is_resource(n)])
+        ids = self._all_ids(False)
+        return orderedset.oset([n for n in self.objset.obj_ids if n in ids])
 
     def _is_edit_valid(self, id_set, existing):
         '''
@@ -2250,6 +2264,34 @@ class CibDiff(object):
         return rc
 
 
+class _Journal(object):
+    '''
+    Undo journal of a CibFactory transaction. Only the object
+    lists are copied up front, everything else is saved just
+    before it gets changed.
+    '''
+    def __init__(self, factory):
+        self.cib_attrs = dict(factory.cib_attrs)
+        self.cib_objects = list(factory.cib_objects)
+        self.remove_queue = list(factory.remove_queue)
+        self.id_refs = dict(factory.id_refs)
+        self.children = {}  # element -> list of its children
+        self.elements = {}  # top element -> its copy
+        self.objects = {}   # object -> its attributes
+
+    def save_children(self, parent):
+        if parent not in self.children:
+            self.children[parent] = list(parent)
+
+    def merge(self, inner):
+        "Fold in the journal of a nested transaction."
+        for mine, theirs in ((self.children, inner.children),
+                             (self.elements, inner.elements),
+                             (self.objects, inner.objects)):
+            for k, v in theirs.iteritems():
+                mine.setdefault(k, v)
+
+
 class CibFactory(object):
     '''
     Juggle with CIB objects.
@@ -2263,7 +2305,6 @@ class CibFactory(object):
         self.last_commit_time = 0
         # internal (just not to produce silly messages)
         self._no_constraint_rm_msg = False
-        self._crm_diff_cmd = None
 
     def is_cib_sane(self):
         # try to initialize
@@ -2501,6 +2542,7 @@ class CibFactory(object):
             # reload the cib!
             t = time.time()
             common_debug("CIB commit successful at %s" % (t))
+            cache.invalidate("cib-commit")
             if is_live_cib():
                 self.last_commit_time = t
             self.reset()
@@ -2540,58 +2582,23 @@ class CibFactory(object):
         current_cib = read_cib(cibdump2elem)
         if current_cib is None:
             return False
-
-        # check if crm_diff supports --no-version
-        if self._crm_diff_cmd is None:
-            rc, out = utils.get_stdout("crm_diff --help")
-            if "--no-version" in out:
-                self._crm_diff_cmd = 'crm_diff --no-version'
-            else:
-                self._crm_diff_cmd = 'crm_diff'
-
         self._copy_cib_attributes(current_cib, self.cib_orig)
         current_cib = None  # don't need that anymore
-        # only bump epoch if we don't have support for --no-version
-        if not self._crm_diff_cmd.endswith('--no-version'):
-            # now increase the epoch by 1
-            self.bump_epoch()
         self._set_cib_attributes(self.cib_elem)
-        cib_s = etree.tostring(self.cib_orig, pretty_print=True)
-        tmpf = str2tmp(cib_s, suffix=".xml")
-        if not tmpf:
-            return False
-        tmpfiles.add(tmpf)
         cibadmin_opts = force and "-P --force" or "-P"
 
-        # produce a diff:
-        # dump_new_conf | crm_diff -o self.cib_orig -n -
+        # produce a diff; objects which weren't updated are the
+        # same in both cibs and need not be compared
         common_debug("Input: %s" % (etree.tostring(self.cib_elem)))
-        rc, cib_diff = filter_string("%s -o %s -n -" %
-                                     (self._crm_diff_cmd, tmpf),
-                                     etree.tostring(self.cib_elem))
-        if not cib_diff and (rc == 0):
+        unchanged = set(obj.node for obj in self.cib_objects if not obj.updated)
+        e = cib_patch(self.cib_orig, self.cib_elem, unchanged)
+        if e is None:
+            common_debug("cannot produce a patch, replacing the CIB")
+            return self._replace_cib(force)
+        if not e.findall("change"):
             # no diff = no action
             return True
-        elif not cib_diff:
-            common_err("crm_diff apparently failed to produce the diff (rc=%d)" % rc)
-            return False
-        if not self._crm_diff_cmd.endswith('--no-version'):
-            # skip the version information for source and target
-            # if we dont have support for --no-version
-            e = etree.fromstring(cib_diff)
-            for tag in e.xpath("./version/*[self::target or self::source]"):
-                tag.attrib.clear()
-            cib_diff = etree.tostring(e)
-        # for v1 diffs, fall back to non-patching if
-        # any containers are modified, else strip the digest
-        if "<diff" in cib_diff and "digest=" in cib_diff:
-            if not self.can_patch_v1():
-                return self._replace_cib(force)
-            e = etree.fromstring(cib_diff)
-            for tag in e.xpath("/diff"):
-                if "digest" in tag.attrib:
-                    del tag.attrib["digest"]
-            cib_diff = etree.tostring(e)
+        cib_diff = etree.tostring(e)
         common_debug("Diff: %s" % (cib_diff))
         rc = pipe_string("%s %s" % (cib_piped, cibadmin_opts),
                          cib_diff)
@@ -2600,23 +2607,6 @@ class CibFactory(object):
             return False
         return True
 
-    def can_patch_v1(self):
-        """
-        The v1 patch format cannot handle reordering,
-        so if there are any changes to any containers
-        or acl tags, don't patch.
-        """
-        def group_changed():
-            for obj in self.cib_objects:
-                if not obj.updated:
-                    continue
-                if obj.obj_type in constants.container_tags:
-                    return True
-                if obj.obj_type in ('user', 'role', 'acl_target', 'acl_group'):
-                    return True
-            return False
-        return not group_changed()
-
     #
     # initialize cib_objects from CIB
     #
@@ -2634,6 +2624,7 @@ class CibFactory(object):
         obj.node = node
         obj.set_id()
         self.cib_objects.append(obj)
+        self._index_add(obj)
         return obj
 
     def _populate(self):
@@ -2687,42 +2678,89 @@ class CibFactory(object):
         self.id_refs = {}        # dict of id-refs
         self.new_schema = False  # schema changed
         self._state = []
+        self._index_reset()
 
     def _push_state(self):
         '''
-        A rudimentary instance state backup. Just make copies of
-        all important variables.
-        idmgmt has to be backed up too.
+        Start a transaction. Instead of copying the whole CIB,
+        the parts about to change are saved as we go, see
+        _journal_elem() and _journal_obj().
+        idmgmt keeps its own journal.
         '''
-        self._state.append([copy.deepcopy(x)
-                            for x in (self.cib_elem,
-                                      self.cib_attrs,
-                                      self.cib_objects,
-                                      self.remove_queue,
-                                      self.id_refs)])
+        self._state.append(_Journal(self))
         idmgmt.push_state()
 
+    def _journal_elem(self, e):
+        '''
+        Element e or its children are about to change. Save
+        the top configuration element holding e (a resource, a
+        constraint, ...) and the list of its siblings.
+        '''
+        if not self._state or e is None:
+            return
+        journal = self._state[-1]
+        conf = self.cib_elem.find("configuration")
+        path = []
+        while e is not None and e is not conf:
+            path.append(e)
+            e = e.getparent()
+        if e is None:  # not part of the CIB
+            return
+        if len(path) < 2:  # configuration or one of its sections
+            journal.save_children(path[0] if path else conf)
+            return
+        top = path[-2]
+        if top not in journal.elements:
+            journal.save_children(path[-1])
+            journal.elements[top] = copy.deepcopy(top)
+
+    def _journal_obj(self, obj):
+        "Object obj and its parents are about to change."
+        while self._state and obj is not None:
+            journal = self._state[-1]
+            if obj not in journal.objects:
+                journal.objects[obj] = dict((k, isinstance(v, list) and list(v) or v)
+                                            for k, v in obj.__dict__.iteritems())
+            obj = obj.parent
+
+    def _get_topnode(self, tag):
+        self._journal_elem(self.cib_elem.find("configuration"))
+        node = get_topnode(self.cib_elem, tag)
+        self._journal_elem(node)
+        return node
+
     def _pop_state(self):
         try:
             common_debug("performing rollback from %s" % (self.cib_objects))
-            self.cib_elem, \
-                self.cib_attrs, self.cib_objects, \
-                self.remove_queue, self.id_refs = self._state.pop()
-        except KeyError:
+            journal = self._state.pop()
+        except IndexError:
             return False
-        # need to get addresses of all new objects created by
-        # deepcopy
+        # configuration first, it may have gained sections
+        for parent, children in sorted(journal.children.items(),
+                                       key=lambda x: x[0].tag != "configuration"):
+            parent[:] = [journal.elements.get(c, c) for c in children]
+        for obj, attrs in journal.objects.iteritems():
+            obj.__dict__.clear()
+            obj.__dict__.update(attrs)
+        self.cib_attrs, self.cib_objects, self.remove_queue, self.id_refs = \
+            journal.cib_attrs, journal.cib_objects, journal.remove_queue, journal.id_refs
+        # objects within restored copies need their new nodes
+        root = self.cib_elem
         for obj in self.cib_objects:
-            obj.node = self.find_xml_node(obj.xml_obj_type, obj.obj_id)
-            self._update_links(obj)
+            if obj.node is None or root not in obj.node.iterancestors():
+                obj.node = self.find_xml_node(obj.xml_obj_type, obj.obj_id)
+                self._update_links(obj)
+        self._index_reset()
         idmgmt.pop_state()
         return self.check_structure()
 
     def _drop_state(self):
         try:
-            self._state.pop()
-        except KeyError:
-            pass
+            journal = self._state.pop()
+        except IndexError:
+            journal = None
+        if journal and self._state:
+            self._state[-1].merge(journal)
         idmgmt.drop_state()
 
     def _clean_state(self):
@@ -2738,12 +2776,107 @@ class CibFactory(object):
         self._clean_state()
         idmgmt.clear()
 
+    #
+    # object index: id -> objects and, as Heartbeat nodes may
+    # have an id different from the uname, uname -> node objects
+    #
+    # and the reverse references: resource id -> constraints,
+    # tags and containers which (may) refer to it; these only
+    # ever grow while the object exists, so users have to check
+    # whether the reference is still there
+    #
+    def _index_reset(self):
+        "Drop the index, it is rebuilt on the next lookup."
+        self._ids = None
+        self._unames = None
+        self._index_keys = None
+        self._refs = None
+        self._ref_keys = None
+        self._index_seq = None
+        self._index_next = 0
+
+    def _index_build(self):
+        self._ids = {}
+        self._unames = {}
+        self._index_keys = {}
+        self._refs = {}
+        self._ref_keys = {}
+        self._index_seq = {}
+        self._index_next = 0
+        for obj in self.cib_objects:
+            self._index_add(obj)
+
+    def _index_add(self, obj):
+        if self._ids is None:
+            return
+        # objects are only ever appended to cib_objects
+        self._index_seq[obj] = self._index_next
+        self._index_next += 1
+        self._index_names(obj)
+        self._index_refs(obj)
+
+    def _index_names(self, obj):
+        uname = None
+        if obj.obj_type == "node" and obj.node is not None:
+            uname = obj.node.get("uname")
+        if obj.obj_id:
+            self._ids.setdefault(obj.obj_id, []).append(obj)
+        if uname:
+            self._unames.setdefault(uname, []).append(obj)
+        self._index_keys[obj] = (obj.obj_id, uname)
+
+    def _unindex_names(self, obj):
+        for d, key in zip((self._ids, self._unames), self._index_keys.pop(obj)):
+            if key in d:
+                d[key].remove(obj)
+                if not d[key]:
+                    del d[key]
+
+    def _index_refs(self, obj):
+        "Add the resources obj currently refers to."
+        if self._refs is None or obj.node is None:
+            return
+        keys = self._ref_keys.setdefault(obj, set())
+        for rsc_id in related_ids(obj.node) - keys:
+            self._refs.setdefault(rsc_id, set()).add(obj)
+            keys.add(rsc_id)
+
+    def _index_remove(self, obj):
+        if self._ids is None or obj not in self._index_keys:
+            return
+        self._unindex_names(obj)
+        for rsc_id in self._ref_keys.pop(obj, ()):
+            self._refs[rsc_id].discard(obj)
+            if not self._refs[rsc_id]:
+                del self._refs[rsc_id]
+        del self._index_seq[obj]
+
+    def _reindex(self, obj):
+        "The id, the uname or the references of the object may have changed."
+        if self._ids is None or obj not in self._index_keys:
+            return
+        self._unindex_names(obj)
+        self._index_names(obj)
+        self._index_refs(obj)
+
+    def _referrers(self, rsc_id):
+        "Objects which may refer to rsc_id, in the cib_objects order."
+        if self._refs is None:
+            self._index_build()
+        return sorted(self._refs.get(rsc_id, ()), key=self._index_seq.get)
+
     def find_objects(self, obj_id):
         "Find objects for id (can be a wildcard-glob)."
         def matchfn(x):
             return x and fnmatch.fnmatch(x, obj_id)
         if not self.is_cib_sane() or obj_id is None:
             return None
+        if not _is_glob(obj_id):
+            if self._ids is None:
+                self._index_build()
+            objs = list(self._ids.get(obj_id, []))
+            objs += [x for x in self._unames.get(obj_id, []) if x not in objs]
+            return objs
         objs = []
         for obj in self.cib_objects:
             if matchfn(obj.obj_id):
@@ -2852,12 +2985,18 @@ class CibFactory(object):
     #
     def find_container_child(self, node):
         "Find an object which may be the child in a container."
-        for obj in reversed(self.cib_objects):
-            if node.tag == "fencing-topology" and obj.xml_obj_type == "fencing-topology":
-                return obj
-            if node.tag == obj.node.tag and node.get("id") == obj.obj_id:
-                return obj
-        return None
+        if node.tag == "fencing-topology":
+            for obj in reversed(self.cib_objects):
+                if obj.xml_obj_type == "fencing-topology":
+                    return obj
+            return None
+        if self._ids is None:
+            self._index_build()
+        objs = [obj for obj in self._ids.get(node.get("id"), ())
+                if obj.node.tag == node.tag]
+        if not objs:
+            return None
+        return max(objs, key=self._index_seq.get)
 
     def find_xml_node(self, tag, ident, strict=True):
         "Find a xml node of this type with this id."
@@ -3170,8 +3309,14 @@ class CibFactory(object):
                            (obj_id, child_id))
                 rc = False
             c_dict[child_id] = 1
-        for other in [x for x in self.cib_objects
-                      if x != obj and is_container(x.node)]:
+        # only the containers referring to one of the children
+        # can share it
+        others = set()
+        for child in obj.children:
+            others.update(self._referrers(child.obj_id))
+        for other in sorted(others, key=self._index_seq.get):
+            if other == obj or not is_container(other.node):
+                continue
             shared_obj = set(obj.children) & set(other.children)
             if shared_obj:
                 common_err("%s contained in both %s and %s" %
@@ -3237,12 +3382,15 @@ class CibFactory(object):
             obj = self.new_object(obj_type, pset_id)
             if not obj:
                 return None
-            topnode = get_topnode(self.cib_elem, obj.parent_type)
+            topnode = self._get_topnode(obj.parent_type)
             obj.node = etree.SubElement(topnode, node.tag)
             obj.origin = "user"
             obj.node.set('id', pset_id)
             topnode.append(obj.node)
             self.cib_objects.append(obj)
+            self._index_add(obj)
+        self._journal_elem(obj.node)
+        self._journal_obj(obj)
         copy_nvpairs(obj.node, node)
         obj.set_updated()
         return obj
@@ -3263,6 +3411,8 @@ class CibFactory(object):
         node, obj_type, obj_id = postprocess_cli(node, id_hint=rsc_obj.obj_id)
 
         del node.attrib['rsc']
+        self._journal_elem(rsc_obj.node)
+        self._journal_obj(rsc_obj)
         return rsc_obj.add_operation(node)
 
     def create_from_cli(self, cli):
@@ -3322,7 +3472,10 @@ class CibFactory(object):
             if newnode.getparent() is not None:
                 newnode.getparent().remove(newnode)
             return True  # the new and the old versions are equal
+        self._journal_elem(oldnode)
+        self._journal_obj(obj)
         obj.node = newnode
+        self._reindex(obj)
         common_debug("update CIB element: %s" % str(obj))
         if oldnode.getparent() is not None:
             oldnode.getparent().replace(oldnode, newnode)
@@ -3338,12 +3491,15 @@ class CibFactory(object):
 
     def merge_from_cli(self, obj, node):
         common_debug("merge_from_cli: %s %s" % (obj.obj_type, etree.tostring(node)))
+        self._journal_elem(obj.node)
+        self._journal_obj(obj)
         if obj.obj_type in constants.nvset_cli_names:
             rc = merge_attributes(obj.node, node, "nvpair")
         else:
             rc = merge_nodes(obj.node, node)
         if rc:
             obj.set_updated()
+            self._reindex(obj)
         return True
 
     def _cli_set_update(self, edit_d, mk_set, upd_set, del_set, method):
@@ -3378,48 +3534,54 @@ class CibFactory(object):
                 del_objs.append(x)
 
         # delete constraints and containers first in case objects are moved elsewhere
-        if not self.delete(*del_constraints):
-            common_debug("delete %s failed" % (list(del_set)))
-            return False
-        if not self.delete(*del_containers):
-            common_debug("delete %s failed" % (list(del_set)))
-            return False
-
-        for cli in processing_sort([edit_d[x] for x in mk_set]):
-            obj = self.create_from_cli(cli)
-            if not obj:
-                common_debug("create_from_cli '%s' failed" %
-                             (etree.tostring(cli, pretty_print=True)))
+        with utils.timed("_cli_set_update: delete %d" % len(del_set)):
+            if not self.delete(*del_constraints):
+                common_debug("delete %s failed" % (list(del_set)))
                 return False
-            test_l.append(obj)
-
-        for ident in upd_set:
-            if edit_d[ident].tag == 'node':
-                obj = self.find_node(ident)
-            else:
-                obj = self.find_resource(ident)
-            if not obj:
-                common_debug("%s not found!" % (ident))
-                return False
-            node, _, _ = postprocess_cli(edit_d[ident], oldnode=obj.node)
-            if node is None:
-                common_debug("postprocess_cli failed: %s" % (ident))
-                return False
-            if not self.update_from_cli(obj, node, method):
-                common_debug("update_from_cli failed: %s, %s, %s" %
-                             (obj, etree.tostring(node), method))
+            if not self.delete(*del_containers):
+                common_debug("delete %s failed" % (list(del_set)))
                 return False
-            test_l.append(obj)
 
-        if not self.delete(*reversed(del_objs)):
-            common_debug("delete %s failed" % (list(del_set)))
-            return False
+        with utils.timed("_cli_set_update: create %d" % len(mk_set)):
+            for cli in processing_sort([edit_d[x] for x in mk_set]):
+                obj = self.create_from_cli(cli)
+                if not obj:
+                    common_debug("create_from_cli '%s' failed" %
+                                 (etree.tostring(cli, pretty_print=True)))
+                    return False
+                test_l.append(obj)
+
+        with utils.timed("_cli_set_update: update %d" % len(upd_set)):
+            for ident in upd_set:
+                if edit_d[ident].tag == 'node':
+                    obj = self.find_node(ident)
+                else:
+                    obj = self.find_resource(ident)
+                if not obj:
+                    common_debug("%s not found!" % (ident))
+                    return False
+                node, _, _ = postprocess_cli(edit_d[ident], oldnode=obj.node)
+                if node is None:
+                    common_debug("postprocess_cli failed: %s" % (ident))
+                    return False
+                if not self.update_from_cli(obj, node, method):
+                    common_debug("update_from_cli failed: %s, %s, %s" %
+                                 (obj, etree.tostring(node), method))
+                    return False
+                test_l.append(obj)
+
+        with utils.timed("_cli_set_update: delete"):
+            if not self.delete(*reversed(del_objs)):
+                common_debug("delete %s failed" % (list(del_set)))
+                return False
         rc = True
-        for obj in test_l:
-            if not self.test_element(obj):
-                common_debug("test_element failed for %s" % (obj))
-                rc = False
-        return rc & self.check_structure()
+        with utils.timed("_cli_set_update: test %d" % len(test_l)):
+            for obj in test_l:
+                if not self.test_element(obj):
+                    common_debug("test_element failed for %s" % (obj))
+                    rc = False
+            rc &= self.check_structure()
+        return rc
 
     def _xml_set_update(self, edit_d, mk_set, upd_set, del_set):
         '''
@@ -3482,6 +3644,7 @@ class CibFactory(object):
         new_children_ids = get_rsc_children_ids(obj.node)
         if not new_children_ids:
             return True
+        self._journal_obj(obj)
         old_children = [x for x in obj.children if x.parent == obj]
         new_children = [self.find_resource(x) for x in new_children_ids]
         new_children = [c for c in new_children if c is not None]
@@ -3496,7 +3659,10 @@ class CibFactory(object):
 
     def _relink_child_to_top(self, obj):
         'Relink a child to the top node.'
-        get_topnode(self.cib_elem, obj.parent_type).append(obj.node)
+        self._journal_elem(obj.node)
+        self._journal_obj(obj)
+        self._get_topnode(obj.parent_type).append(obj.node)
+        obj.set_updated()
         obj.parent = None
 
     def _are_children_orphans(self, obj):
@@ -3524,6 +3690,8 @@ class CibFactory(object):
             if newnode is None:
                 common_err("Child found in children list but not in node: %s, %s" % (obj, child))
                 return False
+            self._journal_elem(oldnode)
+            self._journal_obj(child)
             child.node = newnode
             if child.children:  # and children of children
                 if not self._update_children(child):
@@ -3547,6 +3715,7 @@ class CibFactory(object):
         Update the structure links for the object (obj.children,
         obj.parent). Update also the XML, if necessary.
         '''
+        self._journal_obj(obj)
         obj.children = []
         if obj.obj_type not in constants.container_tags:
             return
@@ -3556,6 +3725,8 @@ class CibFactory(object):
                 if not child:
                     missing_obj_err(c)
                     continue
+                self._journal_elem(child.node)
+                self._journal_obj(child)
                 child.parent = obj
                 obj.children.append(child)
                 if c != child.node:
@@ -3566,7 +3737,7 @@ class CibFactory(object):
         assert node is not None
         obj.node = node
         obj.set_id()
-        pnode = get_topnode(self.cib_elem, obj.parent_type)
+        pnode = self._get_topnode(obj.parent_type)
         common_debug("_add_element: append child %s to %s" % (obj.obj_id, pnode.tag))
         if not self._adjust_children(obj):
             return None
@@ -3578,6 +3749,7 @@ class CibFactory(object):
         self._update_links(obj)
         obj.origin = "user"
         self.cib_objects.append(obj)
+        self._index_add(obj)
         return obj
 
     def _add_children(self, obj_type, node):
@@ -3628,19 +3800,27 @@ class CibFactory(object):
     def _remove_obj(self, obj):
         "Remove a cib object."
         common_debug("remove object %s" % str(obj))
+        self._journal_elem(obj.node)
+        self._journal_obj(obj)
         for child in obj.children:
             # just relink, don't remove children
             self._relink_child_to_top(child)
         if obj.parent:  # remove obj from its parent, if any
             obj.parent.children.remove(obj)
+            # the parent's XML changed, it has to be in the patch
+            obj.parent.set_updated()
         idmgmt.remove_xml(obj.node)
         rmnode(obj.node)
         self._add_to_remove_queue(obj)
         self.cib_objects.remove(obj)
+        self._index_remove(obj)
         for c_obj in self.related_constraints(obj):
+            self._journal_elem(c_obj.node)
+            self._journal_obj(c_obj)
             if is_simpleconstraint(c_obj.node) and obj.children:
                 # the first child inherits constraints
                 rename_rscref(c_obj, obj.obj_id, obj.children[0].obj_id)
+                self._reindex(c_obj)
             deleted = False
             if delete_rscref(c_obj, obj.obj_id):
                 deleted = True
@@ -3657,13 +3837,13 @@ class CibFactory(object):
             return is_constraint(obj2.node) and rsc_constraint(obj.obj_id, obj2.node)
         if not is_resource(obj.node):
             return []
-        return [x for x in self.cib_objects if related_constraint(x)]
+        return [x for x in self._referrers(obj.obj_id) if related_constraint(x)]
 
     def related_elements(self, obj):
         "Both constraints, groups, tags, ..."
         if not is_resource(obj.node):
             return []
-        return [x for x in self.cib_objects if is_related(obj.obj_id, x.node)]
+        return [x for x in self._referrers(obj.obj_id) if is_related(obj.obj_id, x.node)]
 
     def _redirect_children_constraints(self, obj):
         '''
@@ -3671,7 +3851,10 @@ class CibFactory(object):
         '''
         for child in obj.children:
             for c_obj in self.related_constraints(child):
+                self._journal_elem(c_obj.node)
+                self._journal_obj(c_obj)
                 rename_rscref(c_obj, child.obj_id, obj.obj_id)
+                self._reindex(c_obj)
         # drop useless constraints which may have been created above
         for c_obj in self.related_constraints(obj):
             if silly_constraint(c_obj.node, obj.obj_id):
@@ -3690,8 +3873,7 @@ class CibFactory(object):
                 c_list.append(obj2)
         return c_list
 
-    def _check_running_primitives(self, prim_l):
-        rscstat = RscState()
+    def _check_running_primitives(self, prim_l, rscstat):
         for prim in prim_l:
             if not rscstat.can_delete(prim.obj_id):
                 common_err("resource %s is running, can't delete it" % prim.obj_id)
@@ -3738,9 +3920,10 @@ class CibFactory(object):
                 continue
             if is_template(obj.node):
                 prim_l = self.template_primitives(obj)
+                skip, arg_ids = set(l), set(args)
                 prim_l = [x for x in prim_l
-                          if x not in l and x.obj_id not in args]
-                if not self._check_running_primitives(prim_l):
+                          if x not in skip and x.obj_id not in arg_ids]
+                if not self._check_running_primitives(prim_l, rscstat):
                     rc = False
                     continue
                 for prim in prim_l:
@@ -3776,9 +3959,19 @@ class CibFactory(object):
         if not obj.can_be_renamed():
             return False
         for c_obj in self.related_constraints(obj):
+            self._journal_elem(c_obj.node)
+            self._journal_obj(c_obj)
             rename_rscref(c_obj, old_id, new_id)
+            self._reindex(c_obj)
+        self._journal_elem(obj.node)
+        self._journal_obj(obj)
         rename_id(obj.node, old_id, new_id)
         obj.obj_id = new_id
+        self._reindex(obj)
+        parent = obj.parent
+        while parent:  # containers hold the renamed node
+            self._reindex(parent)
+            parent = parent.parent
         idmgmt.rename(old_id, new_id)
         # FIXME: (bnc#901543)
         # for each child node; if id starts with "%(old_id)s-" and
@@ -3818,6 +4011,7 @@ class CibFactory(object):
                 if obj.obj_type != "node":
                     print >> sys.stderr, str(obj)
             self.cib_objects = []
+            self._index_reset()
         return True
 
     def erase_nodes(self):
@@ -49,6 +49,11 @@ def level(level_class):
 
     This is a bit awkward, but given how decorators work,
     it's the best I could think of.
+
+    level_class is either the class or its name in the form
+    'module.Class' (module relative to crmsh). Named levels
+    are imported only once entered or completed, which keeps
+    the startup of crm short.
     '''
     def inner(fn):
         # check signature of given level function
@@ -328,7 +333,7 @@ Examples:
             else:
                 info = context.current_level().get_child(path)
                 if not info or not info.level:
-                    common_debug("children: %s" % (self._children))
+                    common_debug("children: %s" % (self.children()))
                     context.fatal_error("%s not found in %s" % (path, context.current_level()))
                 context.enter_level(info.level)
         else:
@@ -371,7 +376,7 @@ Examples:
         '''
         return tab completions
         '''
-        return self._children.keys()
+        return self.children().keys()
 
     def get_child(self, child):
         '''
@@ -384,9 +389,9 @@ Examples:
         '''
         from . import options
         if options.shell_completion:
-            return self._children.get(child)
+            return self.children().get(child)
         else:
-            return fuzzy_get(self._children, child)
+            return fuzzy_get(self.children(), child)
 
     def is_sublevel(self, child):
         '''
@@ -396,8 +401,10 @@ Examples:
         return sub and sub.type == 'level'
 
     @classmethod
-    def children(self):
-        return self._children
+    def children(cls):
+        if '_children' not in cls.__dict__:
+            cls.init_ui()
+        return cls._children
 
     @classmethod
     def init_ui(cls):
@@ -493,12 +500,24 @@ class ChildInfo(object):
         self.long_help = maybe('_long_help', None)
         self.skill_level = maybe('_skill_level', 0)
         self.wait = maybe('_wait', False)
-        self.level = maybe('_level', None)
+        self._level = maybe('_level', None)
         self.completer = maybe('_completer', None)
         self.parent = parent
-        self.children = {}
+
+    @property
+    def level(self):
+        "The level class, imported on first use"
+        if isinstance(self._level, basestring):
+            modname, clsname = self._level.rsplit('.', 1)
+            module = __import__('crmsh.' + modname, fromlist=[clsname])
+            self._level = getattr(module, clsname)
+        return self._level
+
+    @property
+    def children(self):
         if self.type == 'level' and self.level:
-            self.children = self.level.init_ui()
+            return self.level.children()
+        return {}
 
     def complete(self, context, args):
         '''
@@ -3,9 +3,19 @@
 
 # Helper completers
 
+import time
+from . import cache
+from . import utils
 from . import xmlutil
 
 
+# the CIB is read once for all completers and kept until it
+# changes (see _cib_snapshot); if the CIB version can't be read
+# cheaply, it is kept for a little while
+_cib_ttl = 10
+_snapshots = cache.region("completion-cib", maxsize=16, invalidate_on=("cib-commit",))
+
+
 def choice(lst):
     '''
     Static completion from a list
@@ -44,21 +54,48 @@ def join(*fns):
 booleans = choice(['yes', 'no', 'true', 'false', 'on', 'off'])
 
 
+def _cib_snapshot(status=False):
+    '''
+    Ids of the resources and primitives and the node names of
+    the CIB in use. Read again only if the configuration
+    changed (admin_epoch, epoch) or after our commit. Status
+    updates only change num_updates, which is ignored unless
+    status is set: the remote nodes are found in the status.
+    '''
+    cib_in_use = utils.get_cib_in_use()
+    version = xmlutil.cib_version()
+    if _snapshots.is_cached(cib_in_use):
+        t, cached_version, tables = _snapshots.retrieve(cib_in_use)
+        n = 3 if status else 2
+        if version is not None and cached_version is not None and \
+                version[:n] == cached_version[:n]:
+            return tables
+        if version is None and time.time() - t <= _cib_ttl:
+            return tables
+    tables = {"resources": [], "primitives": [], "nodes": []}
+    cib = xmlutil.cibdump2elem()
+    if cib is not None:
+        rsc_el = cib.find("configuration/resources")
+        if rsc_el is not None:
+            for x in xmlutil.get_interesting_nodes(rsc_el, []):
+                if xmlutil.is_resource(x):
+                    tables["resources"].append(x.get("id"))
+                if xmlutil.is_primitive(x):
+                    tables["primitives"].append(x.get("id"))
+        tables["nodes"] = xmlutil.listnodes(cib)
+    _snapshots.store(cib_in_use, (time.time(), version, tables))
+    return tables
+
+
 def resources(args):
-    cib_el = xmlutil.resources_xml()
-    if cib_el is None:
-        return []
-    nodes = xmlutil.get_interesting_nodes(cib_el, [])
-    return [x.get("id") for x in nodes if xmlutil.is_resource(x)]
+    return _cib_snapshot()["resources"]
 
 
 def primitives(args):
-    cib_el = xmlutil.resources_xml()
-    if cib_el is None:
-        return []
-    nodes = xmlutil.get_interesting_nodes(cib_el, [])
-    return [x.get("id") for x in nodes if xmlutil.is_primitive(x)]
+    return _cib_snapshot()["primitives"]
+
 
-nodes = call(xmlutil.listnodes)
+def nodes(args):
+    return _cib_snapshot(status=True)["nodes"]
 
 shadows = call(xmlutil.listshadows)
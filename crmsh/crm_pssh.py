@@ -16,10 +16,12 @@ import glob
 
 from parallax.manager import Manager, FatalError
 from parallax.task import Task
+from parallax.callbacks import DefaultCallbacks
 from parallax import Options
 
 from .msg import common_err, common_debug, common_warn
 from . import config
+from . import sshpool
 
 
 _DEFAULT_TIMEOUT = 60
@@ -67,6 +69,40 @@ def show_output(odir, hosts, desc):
             print ''.join(out_l)
 
 
+def show_errors(errors, hosts):
+    '''
+    Display stderr kept in memory (see stream_pssh).
+    '''
+    for host in hosts:
+        if errors.get(host):
+            print "%s stderr:" % (host)
+            print errors[host]
+
+
+def _ssh_options(opts):
+    "The ssh -o options used to connect to the nodes"
+    return ['PasswordAuthentication=no',
+            'SendEnv=PSSH_NODENUM',
+            'StrictHostKeyChecking=no'] + list(getattr(opts, 'options', []))
+
+
+def _ssh_cmd(host, cmdline, opts, pool_options):
+    user = ""
+    port = ""
+    cmd = ['ssh', host]
+    for opt in _ssh_options(opts) + pool_options:
+        cmd += ['-o', opt]
+    if user:
+        cmd += ['-l', user]
+    if port:
+        cmd += ['-p', port]
+    if hasattr(opts, 'extra'):
+        cmd.extend(opts.extra)
+    if cmdline:
+        cmd.append(cmdline)
+    return cmd
+
+
 def do_pssh(l, opts):
     '''
     Adapted from psshlib. Perform command across list of hosts.
@@ -77,27 +113,11 @@ def do_pssh(l, opts):
     if opts.errdir and not os.path.exists(opts.errdir):
         os.makedirs(opts.errdir)
     manager = Manager(opts)
-    user = ""
-    port = ""
     hosts = []
+    pool_options = sshpool.ssh_options([host for host, _ in l], _ssh_options(opts))
     for host, cmdline in l:
-        cmd = ['ssh', host,
-               '-o', 'PasswordAuthentication=no',
-               '-o', 'SendEnv=PSSH_NODENUM',
-               '-o', 'StrictHostKeyChecking=no']
-        if hasattr(opts, 'options'):
-            for opt in opts.options:
-                cmd += ['-o', opt]
-        if user:
-            cmd += ['-l', user]
-        if port:
-            cmd += ['-p', port]
-        if hasattr(opts, 'extra'):
-            cmd.extend(opts.extra)
-        if cmdline:
-            cmd.append(cmdline)
         hosts.append(host)
-        t = Task(host, port, user, cmd,
+        t = Task(host, "", "", _ssh_cmd(host, cmdline, opts, pool_options),
                  stdin=opts.input_stream,
                  verbose=opts.verbose,
                  quiet=opts.quiet,
@@ -114,36 +134,109 @@ def do_pssh(l, opts):
         return False
 
 
-def examine_outcome(l, opts, statuses):
+class _StreamTask(Task):
+    '''
+    A task which hands its stdout to consumer chunk by chunk,
+    as it arrives, and None at the end. stderr is kept in
+    errorbuffer.
+
+    parallax writes the output through the task's writer,
+    which is the task itself here.
+    '''
+    def __init__(self, host, cmd, consumer, opts):
+        Task.__init__(self, host, "", "", cmd,
+                      stdin=opts.input_stream,
+                      verbose=opts.verbose,
+                      quiet=True,
+                      default_user=opts.default_user)
+        self.consumer = consumer
+
+    def start(self, nodenum, iomap, writer, askpass_socket=None):
+        Task.start(self, nodenum, iomap, None, askpass_socket)
+        self.writer = self
+        self.outfile, self.errfile = "stdout", "stderr"
+
+    def write(self, name, data):
+        if name == "stdout":
+            self.consumer(data)
+        else:
+            self.errorbuffer += data
+
+    def close(self, name):
+        if name == "stdout":
+            self.consumer(None)
+
+
+def stream_pssh(l, consumers, opts):
+    '''
+    Perform command across list of hosts and pass the output
+    of each host to its consumer as it arrives, see _StreamTask.
+    l = [(host, command), ...]
+    consumers = {host: function(chunk), ...}
+    Returns the list of exit codes (or False) and the stderr
+    of each host.
+    '''
+    manager = Manager(limit=opts.limit, timeout=opts.timeout,
+                      callbacks=DefaultCallbacks())
+    pool_options = sshpool.ssh_options([host for host, _ in l], _ssh_options(opts))
+    tasks = []
+    for host, cmdline in l:
+        t = _StreamTask(host, _ssh_cmd(host, cmdline, opts, pool_options),
+                        consumers[host], opts)
+        tasks.append(t)
+        manager.add_task(t)
+    try:
+        statuses = manager.run()
+    except FatalError:
+        common_err("SSH to nodes failed")
+        statuses = False
+    for t in tasks:
+        if t.outfile:  # interrupted
+            t.close_stdout(manager.iomap)
+    errors = dict((t.host, t.errorbuffer) for t in tasks)
+    if statuses is False:
+        show_errors(errors, [t.host for t in tasks])
+    return statuses, errors
+
+
+def examine_outcome(l, opts, statuses, errors=None):
     '''
     A custom function to show stderr in case there were issues.
     Not suited for callers who want better control of output or
-    per-host processing.
+    per-host processing. errors is the stderr of each host
+    if it was not written to opts.errdir.
     '''
     hosts = [x[0] for x in l]
+
+    def show_stderr():
+        if errors is None:
+            show_output(opts.errdir, hosts, "stderr")
+        else:
+            show_errors(errors, hosts)
     if min(statuses) < 0:
         # At least one process was killed.
         common_err("ssh process was killed")
-        show_output(opts.errdir, hosts, "stderr")
+        show_stderr()
         return False
     # The any builtin was introduced in Python 2.5 (so we can't use it yet):
     # elif any(x==255 for x in statuses):
     for status in statuses:
         if status == 255:
             common_warn("ssh processes failed")
-            show_output(opts.errdir, hosts, "stderr")
+            show_stderr()
             return False
     for status in statuses:
         if status not in (0, _EC_LOGROT):
             common_warn("some ssh processes failed")
-            show_output(opts.errdir, hosts, "stderr")
+            show_stderr()
             return False
     return True
 
 
-def next_loglines(a, outdir, errdir, from_time):
+def next_loglines(a, from_time, consumers):
     '''
     pssh to nodes to collect new logs.
+    consumers: see stream_pssh
     '''
     l = []
     for node, rptlog, logfile, nextpos in a:
@@ -154,18 +247,19 @@ def next_loglines(a, outdir, errdir, from_time):
         else:
             cmdline = "perl -e 'exit(%d) if (stat(\"%s\"))[7]<%d' && tail -c +%d %s" % (
                 _EC_LOGROT, logfile, nextpos-1, nextpos, logfile)
-        opts = parse_args(outdir, errdir)
         l.append([node, cmdline])
-    statuses = do_pssh(l, opts)
+    opts = parse_args(None, None)
+    statuses, errors = stream_pssh(l, consumers, opts)
     if statuses:
-        return examine_outcome(l, opts, statuses)
+        return examine_outcome(l, opts, statuses, errors)
     else:
         return False
 
 
-def next_peinputs(node_pe_l, outdir, errdir):
+def next_peinputs(node_pe_l, consumers):
     '''
-    pssh to nodes to collect new logs.
+    pssh to nodes to collect new PE inputs (as tar archives).
+    consumers: see stream_pssh
     '''
     pe_dir = config.path.pe_state_dir
     vardir = os.path.dirname(pe_dir)
@@ -174,14 +268,14 @@ def next_peinputs(node_pe_l, outdir, errdir):
         red_pe_l = [os.path.join("pengine", os.path.basename(x)) for x in pe_l]
         cmdline = "tar -C %s -chf - %s" % (vardir, ' '.join(red_pe_l))
         common_debug("getting new PE inputs %s from %s" % (red_pe_l, node))
-        opts = parse_args(outdir, errdir)
         l.append([node, cmdline])
     if not l:
         # is this a failure?
         return True
-    statuses = do_pssh(l, opts)
+    opts = parse_args(None, None)
+    statuses, errors = stream_pssh(l, consumers, opts)
     if statuses:
-        return examine_outcome(l, opts, statuses)
+        return examine_outcome(l, opts, statuses, errors)
     else:
         return False
 
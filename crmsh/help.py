@@ -11,7 +11,11 @@ file. In that file, there are help for
  - commands in levels
 
 The help file is lazily loaded when the first
-request for help is made.
+request for help is made. Only the short help
+texts and the locations of the long ones are
+loaded, from an index built at install time
+(see write_index) or else by scanning the file.
+The long help texts are read when displayed.
 
 All help is in the following form in the manual:
 [[cmdhelp_<level>_<cmd>,<short help text>]]
@@ -27,6 +31,7 @@ Help for the level itself is like this:
 
 import os
 import re
+import json
 from .utils import page_string
 from .msg import common_err
 from . import config
@@ -68,15 +73,36 @@ class HelpFilter(object):
 
 
 class HelpEntry(object):
-    def __init__(self, short_help, long_help='', alias_for=None, generated=False):
+    def __init__(self, short_help, long_help='', alias_for=None, generated=False, source=None):
         if short_help:
             self.short = short_help[0].upper() + short_help[1:]
         else:
             self.short = 'Help'
-        self.long = long_help
+        self._long = long_help
+        # (offset, length) of the long help in the help file
+        self._source = source
         self.alias_for = alias_for
         self.generated = generated
 
+    @property
+    def long(self):
+        if self._source is not None:
+            self._long = _read_help_text(*self._source) + self._long
+            self._source = None
+        return self._long
+
+    @long.setter
+    def long(self, long_help):
+        self._long = long_help
+        self._source = None
+
+    def append(self, text):
+        "Append to the long help, without reading it"
+        self._long += text
+
+    def as_alias(self, alias_for):
+        return HelpEntry(self.short, self._long, alias_for, self.generated, self._source)
+
     def is_alias(self):
         return self.alias_for is not None
 
@@ -146,6 +172,8 @@ def help_overview():
     s += "Available commands:\n\n"
 
     for title, command in _COMMANDS.get('root', {}).iteritems():
+        if title.startswith('_'):
+            continue
         if not command.is_alias():
             s += '\t' + _titleline(title, command.short)
     s += "\n"
@@ -273,73 +301,144 @@ def add_help(entry, topic=None, level=None, command=None):
             _LEVELS[level] = entry
 
 
+def _help_file():
+    return os.getenv("CRM_HELP_FILE") or HELP_FILE
+
+
+def _index_file(helpfile):
+    return helpfile + '.idx'
+
+
+def _parse_header(line):
+    '''
+    Returns (type, level, name, short help) for the
+    [[...]] header line of an entry.
+    '''
+    line = line[2:-3]  # strip [[ and ]]\n
+    info, short_help = line.split(',', 1)
+    info = info.split('_')
+    if info[0] == 'topics':
+        return 'topic', '', info[-1], short_help.strip()
+    elif info[0] == 'cmdhelp':
+        if len(info) == 2:
+            return 'level', '', info[1], short_help.strip()
+        elif len(info) >= 3:
+            return 'command', info[1], '_'.join(info[2:]), short_help.strip()
+    return '', '', '', short_help.strip()
+
+
+def index_help(helpfile):
+    '''
+    Returns the entries of the help file as a list of
+    (type, level, name, short help, offset, length), where
+    offset and length locate the long help in the file.
+    '''
+    entries = []
+    entry = None
+    pos = 0
+    for line in open(helpfile):
+        if line.startswith('[['):
+            if entry is not None:
+                entries.append(entry + [pos - entry[-1]])
+            entry = list(_parse_header(line)) + [pos + len(line)]
+        elif entry is not None and line.startswith('===') and pos > entry[-1]:
+            entries.append(entry + [pos - entry[-1]])
+            entry = None
+        pos += len(line)
+    if entry is not None:
+        entries.append(entry + [pos - entry[-1]])
+    return [e for e in entries if e[0]]
+
+
+def write_index(helpfile):
+    '''
+    Save the index of the help file next to it. Done when
+    installing, the index is used as long as the help file
+    has the same size and modification time.
+    '''
+    st = os.stat(helpfile)
+    f = open(_index_file(helpfile), 'w')
+    json.dump({'source': [st.st_size, st.st_mtime], 'entries': index_help(helpfile)}, f)
+    f.close()
+
+
+def _read_index(helpfile):
+    "The saved index of the help file, or None"
+    try:
+        st = os.stat(helpfile)
+        index = json.load(open(_index_file(helpfile)))
+        if index['source'] == [st.st_size, st.st_mtime]:
+            # json gives unicode, the help file is read as str
+            return [[x.encode('utf-8') if isinstance(x, unicode) else x for x in e]
+                    for e in index['entries']]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _read_help_text(offset, length):
+    '''
+    Read a long help text from the help file, with
+    <<...>> references replaced by their description.
+    '''
+    try:
+        f = open(_help_file())
+        f.seek(offset)
+        text = f.read(length)
+        f.close()
+    except IOError, msg:
+        common_err("Help text not found! %s" % (msg))
+        return ''
+    text = ''.join(_REFERENCE_RE.sub(r'\1', line) for line in text.splitlines(True))
+    if text.startswith('=='):
+        text = text.split('\n', 1)[1]
+    return text.rstrip()
+
+
 def _load_help():
     '''
-    Lazily load and parse crm.8.adoc.
+    Lazily load the crm.8.adoc index.
     '''
     global _LOADED
     if _LOADED:
         return
     _LOADED = True
 
-    def parse_header(line):
-        'returns a new entry'
-        entry = {'type': '', 'name': '', 'short': '', 'long': ''}
-        line = line[2:-3]  # strip [[ and ]]\n
-        info, short_help = line.split(',', 1)
-        entry['short'] = short_help.strip()
-        info = info.split('_')
-        if info[0] == 'topics':
-            entry['type'] = 'topic'
-            entry['name'] = info[-1]
-        elif info[0] == 'cmdhelp':
-            if len(info) == 2:
-                entry['type'] = 'level'
-                entry['name'] = info[1]
-            elif len(info) >= 3:
-                entry['type'] = 'command'
-                entry['level'] = info[1]
-                entry['name'] = '_'.join(info[2:])
-
-        return entry
+    def load_levels():
+        "levels are loaded lazily, but their help is needed now"
+        def load(lvl):
+            for info in lvl.children().itervalues():
+                if info.level:
+                    load(info.level)
+        from .ui_root import Root
+        load(Root)
 
     def process(entry):
         'writes the entry into topics/levels/commands'
-        short_help = entry['short']
-        long_help = entry['long']
-        if long_help.startswith('=='):
-            long_help = long_help.split('\n', 1)[1]
-        helpobj = HelpEntry(short_help, long_help.rstrip())
-        name = entry['name']
-        if entry['type'] == 'topic':
+        entry_type, lvl, name, short_help, offset, length = entry
+        helpobj = HelpEntry(short_help, source=(offset, length))
+        if entry_type == 'topic':
             _TOPICS[name] = helpobj
-        elif entry['type'] == 'level':
+        elif entry_type == 'level':
             _LEVELS[name] = helpobj
-        elif entry['type'] == 'command':
-            lvl = entry['level']
+        elif entry_type == 'command':
             if lvl not in _COMMANDS:
                 _COMMANDS[lvl] = odict()
             _COMMANDS[lvl][name] = helpobj
 
-    def filter_line(line):
-        '''clean up an input line
-         - <<...>> references -> short description
-        '''
-        return _REFERENCE_RE.sub(r'\1', line)
-
     def append_cmdinfos():
         "append command information to level descriptions"
         for lvlname, level in _LEVELS.iteritems():
             if lvlname in _COMMANDS:
-                level.long += "\n\nCommands:\n"
+                level.append("\n\nCommands:\n")
                 for cmdname, cmd in sorted(_COMMANDS[lvlname].iteritems(), key=lambda x: x[0]):
                     if cmdname in _hidden_commands or cmdname.startswith('_'):
                         continue
-                    level.long += "\t" + _titleline(cmdname, cmd.short)
-                level.long += "\n"
+                    level.append("\t" + _titleline(cmdname, cmd.short))
+                level.append("\n")
                 for cmdname, cmd in sorted(_COMMANDS[lvlname].iteritems(), key=lambda x: x[0]):
                     if cmdname in _hidden_commands:
-                        level.long += "\t" + _titleline(cmdname, cmd.short)
+                        level.append("\t" + _titleline(cmdname, cmd.short))
 
     def fixup_root_commands():
         "root commands appear as levels"
@@ -362,7 +461,7 @@ def _load_help():
             if alias in _COMMANDS[lvlname]:
                 return
             info = _COMMANDS[lvlname][command]
-            _COMMANDS[lvlname][alias] = HelpEntry(info.short, info.long, (alias, command))
+            _COMMANDS[lvlname][alias] = info.as_alias((alias, command))
 
         def add_aliases_for_level(lvl):
             for name, info in lvl.children().iteritems():
@@ -378,23 +477,14 @@ def _load_help():
         _TOPICS["Overview"] = help_overview()
         _TOPICS["Topics"] = help_topics()
 
+    load_levels()
     try:
-        name = os.getenv("CRM_HELP_FILE") or HELP_FILE
-        helpfile = open(name, 'r')
-        entry = None
-        for line in helpfile:
-            if line.startswith('[['):
-                if entry is not None:
-                    process(entry)
-                entry = parse_header(line)
-            elif entry is not None and line.startswith('===') and entry['long']:
-                process(entry)
-                entry = None
-            elif entry is not None:
-                entry['long'] += filter_line(line)
-        if entry is not None:
+        name = _help_file()
+        entries = _read_index(name)
+        if entries is None:
+            entries = index_help(name)
+        for entry in entries:
             process(entry)
-        helpfile.close()
         append_cmdinfos()
         fixup_root_commands()
         fixup_help_aliases()
@@ -5,7 +5,7 @@
 import os
 import time
 import re
-import glob
+import subprocess
 import ConfigParser
 
 from . import config
@@ -68,26 +68,71 @@ def read_log_info(log):
     return '', -1
 
 
-def append_newlogs(outdir, to_update):
+class LogAppender(object):
     '''
-    Append new logs fetched from nodes.
-    Update <log>.info with new next pos
+    Append the new log fetched from a node to the report log
+    as it arrives (see crm_pssh.stream_pssh). At the end,
+    update <log>.info with the new next pos.
     '''
-    if not os.path.isdir(outdir):
-        return
-    for node, rptlog, logfile, nextpos in to_update:
-        fl = glob.glob("%s/*%s*" % (outdir, node))
-        if not fl:
-            continue
-        utils.append_file(rptlog, fl[0])
-
-        newpos = nextpos + os.stat(fl[0]).st_size
+    def __init__(self, rptlog, logfile, nextpos):
+        self.rptlog = rptlog
+        self.logfile = logfile
+        self.pos = nextpos
+        self.f = None
+        self.failed = False
+
+    def __call__(self, chunk):
+        if self.failed:
+            return
+        try:
+            if chunk is None:
+                self._close()
+                return
+            if self.f is None:
+                self.f = open(self.rptlog, "a")
+            self.f.write(chunk)
+            self.pos += len(chunk)
+        except IOError, msg:
+            common_err("append to %s: %s" % (self.rptlog, msg))
+            self.failed = True
+
+    def _close(self):
+        if self.f is not None:
+            self.f.close()
         try:
-            f = open(rptlog + ".info", "w")
-            f.write("%s %d\n" % (logfile, newpos))
+            f = open(self.rptlog + ".info", "w")
+            f.write("%s %d\n" % (self.logfile, self.pos))
             f.close()
         except IOError, msg:
-            common_err("couldn't the update %s.info: %s" % (rptlog, msg))
+            common_err("couldn't the update %s.info: %s" % (self.rptlog, msg))
+
+
+class Untar(object):
+    '''
+    Extract a tar archive fetched from a node into a directory
+    as it arrives (see crm_pssh.stream_pssh). rc is the exit
+    code of tar, -1 if nothing arrived.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.proc = None
+        self.rc = -1
+
+    def __call__(self, chunk):
+        if self.proc is None:
+            if chunk is None:
+                return
+            self.proc = subprocess.Popen(["tar", "-C", self.directory, "-x"],
+                                         stdin=subprocess.PIPE)
+        try:
+            if chunk is None:
+                self.proc.stdin.close()
+                self.rc = self.proc.wait()
+            elif not self.proc.stdin.closed:
+                self.proc.stdin.write(chunk)
+        except IOError, msg:
+            common_err("extract to %s: %s" % (self.directory, msg))
+            self.proc.stdin.close()
 
 
 def rpt_pe2t_str(rpt_pe_file):
@@ -131,8 +176,6 @@ class Report(object):
                   "RED")
     session_sub = "session"
     report_cache_dir = os.path.join(config.path.cache, 'history-%s' % (utils.getuser()))
-    outdir = os.path.join(report_cache_dir, "psshout")
-    errdir = os.path.join(report_cache_dir, "pssherr")
 
     def __init__(self):
         # main source attributes
@@ -329,35 +372,6 @@ class Report(object):
                     break
         return l
 
-    def unpack_new_peinputs(self, node, pe_l):
-        '''
-        Untar PE inputs fetched from nodes.
-        '''
-        if not os.path.isdir(self.outdir):
-            return
-        fl = glob.glob("%s/*%s*" % (self.outdir, node))
-        if not fl:
-            return -1
-        u_dir = os.path.join(self.loc, node)
-        return utils.pipe_cmd_nosudo("tar -C %s -x < %s" % (u_dir, fl[0]))
-
-    def read_new_log(self, node):
-        '''
-        Get a list of log lines.
-        The log is put in self.outdir/node by parallax.
-        '''
-        if not os.path.isdir(self.outdir):
-            return []
-        fl = glob.glob("%s/*%s*" % (self.outdir, node))
-        if not fl:
-            return []
-        try:
-            f = open(fl[0])
-        except IOError, msg:
-            common_err("open %s: %s" % (fl[0], msg))
-            return []
-        return f.readlines()
-
     def update_live_report(self, next_loglines, next_peinputs):
         '''
         Update the existing live report, if it's older than
@@ -379,13 +393,12 @@ class Report(object):
             common_info("No updatable logs found (missing .info for logs)")
             return False
 
-        utils.rmdir_r(self.outdir)
-        utils.rmdir_r(self.errdir)
         self.last_live_update = time.time()
 
         end_time = self._str_dt(self.get_rpt_dt(self.to_dt, "bottom"))
-        rc1 = next_loglines(to_update, self.outdir, self.errdir, end_time)
-        append_newlogs(self.outdir, to_update)
+        logs = dict((node, LogAppender(rptlog, logf, pos))
+                    for node, rptlog, logf, pos in to_update)
+        rc1 = next_loglines(to_update, end_time, logs)
 
         # read new logs
         # find any missing pefiles
@@ -394,13 +407,13 @@ class Report(object):
         # unpack missing pefiles
         # node_pe_l: [(node, [pefile ...]) ...]
         node_pe_l = self.logparser.scan(mode='refresh')
-        rc2 = next_peinputs(node_pe_l, self.outdir, self.errdir)
+        untar = dict((node, Untar(os.path.join(self.loc, node)))
+                     for node, pe_l in node_pe_l)
+        rc2 = next_peinputs(node_pe_l, untar)
         unpack_rc = 0
         for node, pe_l in node_pe_l:
-            unpack_rc |= self.unpack_new_peinputs(node, pe_l)
+            unpack_rc |= untar[node].rc
         rc2 |= (unpack_rc == 0)
-        utils.rmdir_r(self.outdir)
-        utils.rmdir_r(self.errdir)
 
         return rc1 and rc2
 
@@ -4,33 +4,44 @@
 # Make sure that ids are unique.
 
 from . import constants
-import copy
 from .msg import common_error, id_used_err
 from . import xmlutil
 
 _id_store = {}
-_state = []
+_state = []  # undo journals, one per open transaction
 ok = True  # error var
 
 
 def push_state():
-    _state.append(copy.deepcopy(_id_store))
+    _state.append([])
+
+
+def _journal(node_id):
+    "Remember whether node_id was in use before changing it."
+    if _state:
+        _state[-1].append((node_id, node_id in _id_store))
 
 
 def pop_state():
     try:
-        global _id_store
-        _id_store = _state.pop()
-        return True
+        journal = _state.pop()
     except IndexError:
         return False
+    for node_id, used in reversed(journal):
+        if used:
+            _id_store[node_id] = 1
+        else:
+            _id_store.pop(node_id, None)
+    return True
 
 
 def drop_state():
     try:
-        _state.pop()
-    except KeyError:
-        pass
+        journal = _state.pop()
+    except IndexError:
+        return
+    if _state:
+        _state[-1].extend(journal)
 
 
 def clean_state():
@@ -133,6 +144,7 @@ def id_in_use(obj_id):
 def save(node_id):
     if not node_id:
         return
+    _journal(node_id)
     _id_store[node_id] = 1
 
 
@@ -148,12 +160,10 @@ def rename(old_id, new_id):
 
 
 def remove(node_id):
-    if not node_id:
+    if not node_id or node_id not in _id_store:
         return
-    try:
-        del _id_store[node_id]
-    except KeyError:
-        pass
+    _journal(node_id)
+    del _id_store[node_id]
 
 
 def clear():
@@ -1,13 +1,20 @@
 # Copyright (C) 2016 Kristoffer Gronlund <kgronlund@suse.com>
 # See COPYING for license information.
 
+import bisect
 import bz2
 import gzip
+import heapq
 import re
 import os
-import sys
 import collections
+import hashlib
 import json
+import mmap
+import multiprocessing
+import sre_constants
+import sre_parse
+import struct
 import time
 
 from . import msg as crmlog
@@ -15,12 +22,37 @@ from . import xmlutil
 from . import logtime
 from . import utils
 from . import log_patterns
+from . import ordereddict
 
 
-_METADATA_FILENAME = "__meta.json"
+_METADATA_FILENAME = "__meta.idx"
 _METADATA_CACHE_AGE = (60.0 * 60.0)
 # Update this when changing the metadata format
-_METADATA_VERSION = 1
+_METADATA_VERSION = 4
+_METADATA_MAGIC = "crmlogix"
+# magic, version, length of the JSON header
+_METADATA_PREAMBLE = struct.Struct("<8sII")
+_INT64 = struct.Struct("<q")
+_UINT16 = struct.Struct("<H")
+_UINT64 = struct.Struct("<Q")
+# Number of bytes at the start of each log used to
+# detect if the log has been replaced since the last scan
+_HEAD_CHECKSUM_SIZE = 4096
+# Scan logs in parallel worker processes only if there
+# is at least this much log data to scan
+_PARALLEL_SCAN_MIN_SIZE = 4 * 1024 * 1024
+# Shortest literal string worth checking for before
+# trying a regular expression on a log line
+_KEYWORD_MIN_LEN = 3
+# Record the timestamp and offset of every Nth line of
+# each log, to find the start of a timeframe in the log
+_TS_INDEX_INTERVAL = 1000
+# Bytes of log lines to read at a time in get_logs
+_READ_BLOCK_SIZE = 64 * 1024
+
+
+def _is_compressed(logfile):
+    return logfile.endswith(".bz2") or logfile.endswith(".gz")
 
 
 def _open_logfile(logfile):
@@ -39,6 +71,14 @@ def _open_logfile(logfile):
         return None
 
 
+def _head_checksum(log, length):
+    """
+    Checksum of the first length bytes of the log.
+    """
+    log.seek(0)
+    return hashlib.sha1(log.read(length)).hexdigest()
+
+
 def _transition_start_re():
     """
     Return regular expression matching transition start.
@@ -107,6 +147,82 @@ def _run_graph_msg_actions(msg):
     return d
 
 
+def _required_literals(seq):
+    """
+    Returns a tuple of literal strings of which at least
+    one is present in any string matched by the given
+    parsed (sre_parse) regular expression, or None.
+    Picks the tuple with the longest shortest string.
+    """
+    candidates = []
+    run = []
+    for op, av in seq:
+        if op == sre_constants.LITERAL and av < 128:
+            run.append(chr(av))
+            continue
+        if run:
+            candidates.append((''.join(run),))
+            run = []
+        if op == sre_constants.SUBPATTERN:
+            sub = _required_literals(av[-1])
+            if sub:
+                candidates.append(sub)
+        elif op == sre_constants.BRANCH:
+            alts = []
+            for alt in av[1]:
+                sub = _required_literals(alt)
+                if not sub:
+                    break
+                alts.extend(sub)
+            else:
+                candidates.append(tuple(alts))
+    if run:
+        candidates.append((''.join(run),))
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: min(len(k) for k in c))
+
+
+def _keywords(rx):
+    """
+    Literal strings to look for in a line before trying
+    the compiled regex rx on it (see _has_keyword).
+    None if there are no usable keywords.
+    """
+    if rx.flags & re.IGNORECASE:
+        return None
+    kws = _required_literals(sre_parse.parse(rx.pattern))
+    if not kws or min(len(k) for k in kws) < _KEYWORD_MIN_LEN:
+        return None
+    return kws
+
+
+def _has_keyword(line, keywords):
+    if keywords is None:
+        return True
+    for kw in keywords:
+        if kw in line:
+            return True
+    return False
+
+
+def _event_matcher(eventre):
+    """
+    eventre: {etype -> [compiled regex]}
+
+    Groups the regexes by the keywords that must be present
+    in a line for them to match, so that each keyword is
+    looked for once per line and most regexes never run.
+
+    Returns [(keywords, [(etype, regex) ...]) ...]
+    """
+    groups = ordereddict.odict()
+    for etype, erx in eventre.iteritems():
+        for rx in erx or []:
+            groups.setdefault(_keywords(rx), []).append((etype, rx))
+    return groups.items()
+
+
 def mk_re_list(patt_l, repl):
     'Build a list of regular expressions, replace "%%" with repl'
     l = []
@@ -191,25 +307,251 @@ class Transition(object):
         else:
             print "[unfinished])"
 
-    def to_dict(self):
+    def to_row(self):
         """
-        Serialize to dict (for cache)
+        Serialize to list (for cache)
         """
-        o = {"tags": list(self.tags)}
-        for k in self.__slots__:
-            if k in ("loc", "tags"):
-                continue
-            o[k] = getattr(self, k)
-        return o
+        return [self.dc, self.start_ts, self.trans_num, self.pe_file, self.pe_num,
+                self.end_ts, self.end_state, self.end_actions, sorted(self.tags)]
 
     @classmethod
-    def from_dict(cls, loc, obj):
-        t = Transition(loc, None, None, None, None, None)
-        for k, v in obj.iteritems():
-            setattr(t, k, set(v) if k == "tags" else v)
+    def from_row(cls, loc, row):
+        t = Transition(loc, *row[:5])
+        t.end_ts, t.end_state, t.end_actions = row[5:8]
+        t.tags = set(row[8])
         return t
 
 
+_TRANS_START, _TRANS_END = 0, 1
+
+
+class _LogScan(object):
+    """
+    Partial transition and event tables for a single log.
+    Transitions are referred to by transition string, and
+    resolved when the tables are merged by LogParser.
+    """
+    def __init__(self, logidx, startpos):
+        self.logidx = logidx
+        self.startpos = startpos
+        self.endpos = 0
+        # transition left open at endpos
+        self.open_trans = None
+        # transition starts and ends in log order:
+        # [(_TRANS_START, id, (dc, start_ts, trans_num, pe_file, pe_num, pe_orig)) ...]
+        # [(_TRANS_END, id, (end_ts, end_state, end_actions)) ...]
+        self.ops = []
+        # transition id -> set of tags
+        self.tags = collections.defaultdict(set)
+        # {etype -> [(sortkey, fileid, spos)]}
+        self.events = collections.defaultdict(list)
+        # [(timestamp, spos)] for every _TS_INDEX_INTERVAL lines
+        self.tsindex = []
+
+
+def _scan_logfile(filename, logidx, spos, open_trans, matcher):
+    """
+    Scan a single log starting at offset spos.
+    Used directly or in a worker process.
+
+    open_trans: id of the transition left open at spos, if any
+    matcher: event regexes, see _event_matcher
+
+    Returns a _LogScan.
+    """
+    scan = _LogScan(logidx, spos)
+    log = _open_logfile(filename)
+    if log is None:
+        return scan
+    tsp = logtime.TimestampParser()
+    startre = _transition_start_re()
+    endre = _transition_end_re()
+    start_kw = _keywords(startre)
+    end_kw = _keywords(endre)
+
+    DEFAULT, IN_TRANSITION = 0, 1
+    transition = open_trans
+    state = IN_TRANSITION if transition is not None else DEFAULT
+
+    log.seek(spos)
+    crmlog.common_debug("parsing %s from %d" % (filename, spos))
+    lineno = 0
+    line = "a"
+    while line != '':
+        spos = log.tell()
+        line = log.readline()
+        if lineno % _TS_INDEX_INTERVAL == 0 and line:
+            ts = tsp.ts(line)
+            if ts is not None:
+                scan.tsindex.append((ts, spos))
+        lineno += 1
+        m = _has_keyword(line, start_kw) and startre.search(line)
+        if m:
+            # m.groups() is (transnum1, pefile1, penum1, transnum2, pefile2, penum2) where
+            # it matched either 1 or 2
+            t1, p1, n1, t2, p2, n2 = m.groups()
+            if t1 is not None:
+                trans_num, pe_file, pe_num = t1, p1, n1
+            else:
+                trans_num, pe_file, pe_num = t2, p2, n2
+            pe_orig = pe_file
+            pe_file = os.path.basename(pe_orig)
+            ts, dc = tsp.ts_node(line)
+            if ts is None or dc is None:
+                continue
+            transition = trans_str(dc, pe_file)
+            scan.ops.append((_TRANS_START, transition, (dc, ts, trans_num, pe_file, pe_num, pe_orig)))
+            state = IN_TRANSITION
+            continue
+        if state == IN_TRANSITION:
+            m = _has_keyword(line, end_kw) and endre.search(line)
+            if m:
+                trans_num, pe_file, pe_num, state = m.groups()
+                pe_file = os.path.basename(pe_file)
+                ts, dc = tsp.ts_node(line)
+                if ts is None or dc is None:
+                    continue
+                scan.ops.append((_TRANS_END, trans_str(dc, pe_file), (ts, state, _run_graph_msg_actions(line))))
+                state = DEFAULT
+
+        # events
+        for keywords, erx in matcher:
+            # inlined _has_keyword(), this is the hot loop
+            if keywords is not None:
+                for kw in keywords:
+                    if kw in line:
+                        break
+                else:
+                    continue
+            for etype, rx in erx:
+                m = rx.search(line)
+                if m:
+                    ts = tsp.ts(line)
+                    if ts is None:
+                        continue
+                    crmlog.common_debug("+Event %s: %s" % (etype, ", ".join(m.groups())))
+                    sk = (long(ts) << 32) + long(spos)
+                    scan.events[etype].append((sk, logidx, spos))
+                    if transition is not None:
+                        for t in m.groups():
+                            if t:
+                                scan.tags[transition].add(t.lower())
+
+        if state == DEFAULT:
+            transition = None
+
+    log.close()
+    scan.endpos = spos
+    scan.open_trans = transition
+    return scan
+
+
+def _scan_logfile_job(args):
+    return _scan_logfile(*args)
+
+
+def _read_timestamped(log, logidx):
+    """
+    Yields (timestamp, logidx, line) for the lines of
+    a log from the current position, reading and parsing
+    a block of lines at a time.
+    """
+    tsp = logtime.TimestampParser()
+    while True:
+        block = log.readlines(_READ_BLOCK_SIZE)
+        if not block:
+            break
+        for ts, line in zip(tsp.parse_lines(block), block):
+            yield ts, logidx, line
+
+
+def _align8(n):
+    return (n + 7) & ~7
+
+
+class _EventColumns(object):
+    """
+    Read-only sequence of (sortkey, fileid, spos) events,
+    backed by the columns of one event type in the
+    memory-mapped metadata index (see _write_index).
+    """
+    __slots__ = ('buf', 'count', 'sk_off', 'file_off', 'pos_off')
+
+    def __init__(self, buf, offset, count):
+        self.buf = buf
+        self.count = count
+        self.sk_off = offset
+        self.file_off = offset + 8 * count
+        self.pos_off = self.file_off + _align8(2 * count)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return (_INT64.unpack_from(self.buf, self.sk_off + 8 * i)[0],
+                _UINT16.unpack_from(self.buf, self.file_off + 2 * i)[0],
+                _UINT64.unpack_from(self.buf, self.pos_off + 8 * i)[0])
+
+    def __iter__(self):
+        for i in xrange(self.count):
+            yield self[i]
+
+
+def _write_index(f, header, events):
+    """
+    Write the metadata index:
+
+    preamble (magic, version, header length)
+    JSON header
+    for each event type, aligned to 8 bytes:
+      sort keys (int64), file ids (uint16), offsets (uint64)
+
+    The header lists the count and data offset
+    of each event type under "events".
+    """
+    offset = 0
+    header["events"] = {}
+    for etype, logs in events.iteritems():
+        header["events"][etype] = [len(logs), offset]
+        offset += 16 * len(logs) + _align8(2 * len(logs))
+    hdr = json.dumps(header, separators=(',', ':'))
+    f.write(_METADATA_PREAMBLE.pack(_METADATA_MAGIC, _METADATA_VERSION, len(hdr)))
+    f.write(hdr)
+    f.write("\0" * (_align8(f.tell()) - f.tell()))
+    for etype, logs in events.iteritems():
+        n = len(logs)
+        f.write(struct.pack("<%dq" % n, *[e[0] for e in logs]))
+        f.write(struct.pack("<%dH" % n, *[e[1] for e in logs]))
+        f.write("\0" * (_align8(2 * n) - 2 * n))
+        f.write(struct.pack("<%dQ" % n, *[e[2] for e in logs]))
+
+
+def _read_index(buf):
+    """
+    Read the metadata index written by _write_index
+    from a buffer (usually memory-mapped).
+
+    Returns (header, {etype -> _EventColumns}),
+    or None if the version doesn't match.
+    """
+    magic, version, hdrlen = _METADATA_PREAMBLE.unpack_from(buf, 0)
+    if magic != _METADATA_MAGIC or version != _METADATA_VERSION:
+        return None
+    start = _METADATA_PREAMBLE.size
+    header = json.loads(buf[start:start + hdrlen])
+    base = _align8(start + hdrlen)
+    events = {}
+    for etype, (count, offset) in header["events"].iteritems():
+        if base + offset + 16 * count + _align8(2 * count) > len(buf):
+            raise ValueError("truncated event index")
+        events[etype] = _EventColumns(buf, base + offset, count)
+    return header, events
+
+
 class CibInfo(object):
     def __init__(self, report_path):
         self.filename = utils.file_find_by_name(report_path, "cib.xml")
@@ -258,8 +600,6 @@ class LogParser(object):
     Used by the history explorer.
     Given a report directory, generates log metadata.
 
-    TODO:
-
     This information is then written to a file called %(_METADATA_FILENAME),
     and the next time the history explorer is started, we skip the
     analysis and load the metadata directly.
@@ -279,6 +619,8 @@ class LogParser(object):
 
         self.events = {}
         self.transitions = []
+        # per log: end of last scan (see _file_state)
+        self.filestate = []
 
         self.from_ts = None
         self.to_ts = None
@@ -291,12 +633,13 @@ class LogParser(object):
         """
         mode = 'refresh':
         Re-read logs that may have new data appended.
-        Right now this re-scans all the log data.
-        TODO: Only scan new data by tracking the previous
-        end of each file and scanning from there. Retain
-        previous data and just add new transitions / events.
+        Only the data appended since the previous scan is
+        parsed, and new transitions / events are merged
+        into the existing data. Logs that have been rotated,
+        truncated or replaced are re-scanned from the start.
 
         Returns list of pefiles missing from report. [(node, [pefile ...]) ...]
+        For 'refresh', only pefiles of new transitions are listed.
 
         mode = 'force':
         Completely re-parse (ignore cache)
@@ -313,117 +656,72 @@ class LogParser(object):
 
         mode: None, 'refresh' or 'force'
 
-        TODO: Load/save metadata when already generated.
-        TODO: scan each logfile in a separate thread?
+        Each log is scanned separately into partial tables
+        (in parallel if there is enough data), which are
+        then merged.
         """
 
         if mode not in ('refresh', 'force') and self._load_cache():
             return []
 
-        missing_pefiles = []
-
-        # {etype -> [(sortkey, msg)]}
-        # TODO: store (sortkey, fileid, spos) instead?
-        self.events = collections.defaultdict(list)
+        incremental = mode == 'refresh' and self._can_refresh()
+        if incremental:
+            # events may be read-only columns from the cache
+            self.events = collections.defaultdict(list, ((etype, list(logs))
+                                                         for etype, logs in self.events.iteritems()))
+        else:
+            # {etype -> [(sortkey, fileid, spos)]}
+            self.events = collections.defaultdict(list)
+            self.transitions = []
+            self.filestate = [None] * len(self.filenames)
 
-        self.transitions = []
+        missing_pefiles = []
+        new_transitions = []
 
         # trans_num:pe_num -> Transition()
-        transitions_map = {}
-
-        startre = _transition_start_re()
-        endre = _transition_end_re()
+        transitions_map = dict((str(t), t) for t in self.transitions)
 
         eventre = {}
         eventre["node"] = self._build_re("node", self.cib.nodes)
         eventre["resource"] = self._build_re("resource", self.cib.match_resources())
         eventre["quorum"] = self._build_re("quorum", [])
         eventre["events"] = self._build_re("events", [])
-
-        DEFAULT, IN_TRANSITION = 0, 1
-        state = DEFAULT
-        transition = None
-
-        for logidx, (filename, log) in enumerate(zip(self.filenames, self.fileobjs)):
-            log.seek(0)
-            crmlog.common_debug("parsing %s" % (filename))
-            line = "a"
-            while line != '':
-                spos = log.tell()
-                line = log.readline()
-                m = startre.search(line)
-                if m:
-                    # m.groups() is (transnum1, pefile1, penum1, transnum2, pefile2, penum2) where
-                    # it matched either 1 or 2
-                    t1, p1, n1, t2, p2, n2 = m.groups()
-                    if t1 is not None:
-                        trans_num, pe_file, pe_num = t1, p1, n1
-                    else:
-                        trans_num, pe_file, pe_num = t2, p2, n2
-                    pe_orig = pe_file
-                    pe_file = os.path.basename(pe_orig)
-                    ts, dc = logtime.syslog_ts_node(line)
-                    if ts is None or dc is None:
-                        continue
-                    id_ = trans_str(dc, pe_file)
-                    transition = transitions_map.get(id_)
-                    if transition is None:
-                        transition = Transition(self.loc, dc, ts, trans_num, pe_file, pe_num)
-                        self.transitions.append(transition)
-                        transitions_map[id_] = transition
-                        crmlog.common_debug("{Transition: %s" % (transition))
-
-                        if not os.path.isfile(transition.path()):
-                            missing_pefiles.append((dc, pe_orig))
-                    else:
-                        crmlog.common_debug("~Transition: %s old(%s, %s) new(%s, %s)" %
-                                            (transition, transition.trans_num, transition.pe_file, trans_num, pe_file))
-                    state = IN_TRANSITION
+        matcher = _event_matcher(eventre)
+
+        jobs = []
+        for logidx, filename in enumerate(self.filenames):
+            spos, open_trans = 0, None
+            if incremental:
+                spos = self._resume_offset(logidx)
+                if spos is None:
+                    crmlog.common_debug("%s: no new data" % (filename))
                     continue
-                if state == IN_TRANSITION:
-                    m = endre.search(line)
-                    if m:
-                        trans_num, pe_file, pe_num, state = m.groups()
-                        pe_file = os.path.basename(pe_file)
-                        ts, dc = logtime.syslog_ts_node(line)
-                        if ts is None or dc is None:
-                            continue
-                        transition = transitions_map.get(trans_str(dc, pe_file))
-                        if transition is None:
-                            # transition end without previous begin...
-                            crmlog.common_debug("Found transition end without start: %s: %s - %s:%s" % (ts, filename, trans_num, pe_file))
-                        else:
-                            transition.end_state = state
-                            transition.end_ts = ts
-                            transition.end_actions = _run_graph_msg_actions(line)
-                            crmlog.common_debug("}Transition: %s %s" % (transition, state))
-                        state = DEFAULT
-
-                # events
-                for etype, erx in eventre.iteritems():
-                    for rx in erx:
-                        m = rx.search(line)
-                        if m:
-                            ts = logtime.syslog_ts(line)
-                            if ts is None:
-                                continue
-                            crmlog.common_debug("+Event %s: %s" % (etype, ", ".join(m.groups())))
-                            sk = (long(ts) << 32) + long(spos)
-                            self.events[etype].append((sk, logidx, spos))
-                            if transition is not None:
-                                for t in m.groups():
-                                    if t:
-                                        transition.tags.add(t.lower())
-
-                if state == DEFAULT:
-                    transition = None
-
+                if spos == 0:
+                    crmlog.common_debug("%s: rotated or truncated, scanning from start" % (filename))
+                    self._reopen(logidx)
+                    self._drop_events(logidx)
+                else:
+                    open_trans = self.filestate[logidx]["open"]
+            jobs.append((filename, logidx, spos, open_trans, matcher))
+
+        # merge in log order, so that transitions found in
+        # several logs are resolved as if scanned one by one
+        for scan in self._run_scans(jobs):
+            self._merge_scan(scan, transitions_map, new_transitions, missing_pefiles)
+            tsindex = scan.tsindex
+            if scan.startpos > 0:
+                tsindex = self.filestate[scan.logidx]["tsindex"] + tsindex
+            self.filestate[scan.logidx] = self._file_state(scan.logidx, scan.endpos, scan.open_trans, tsindex)
+
+        # the new data is mostly appended in order, so
+        # sorting here is close to a linear merge
         self.transitions.sort(key=lambda t: t.start_ts)
         for etype, logs in self.events.iteritems():
             logs.sort(key=lambda e: e[0])
+        new_transitions = set(new_transitions)
         empties = []
         for i, t in enumerate(self.transitions):
-            if i == 0:
+            if i == 0 or t not in new_transitions:
                 continue
             if t.empty(self.transitions[i - 1]):
                 empties.append(t)
@@ -436,6 +734,141 @@ class LogParser(object):
             missing_pefiles = list(rdict.items())
         return missing_pefiles
 
+    def _run_scans(self, jobs):
+        """
+        Scan logs, in worker processes (one per log) if there
+        is enough data to make it worthwhile.
+        jobs: list of arguments to _scan_logfile
+
+        Returns list of _LogScan, in the order of jobs.
+        """
+        size = 0
+        for filename, _, spos, _, _ in jobs:
+            try:
+                size += os.path.getsize(filename) - spos
+            except OSError:
+                pass
+        if len(jobs) > 1 and size >= _PARALLEL_SCAN_MIN_SIZE:
+            try:
+                nprocs = min(len(jobs), multiprocessing.cpu_count())
+                if nprocs > 1:
+                    crmlog.common_debug("scanning %d logs using %d processes" % (len(jobs), nprocs))
+                    pool = multiprocessing.Pool(nprocs)
+                    try:
+                        # get() with a timeout so that the scan
+                        # can be interrupted
+                        return pool.map_async(_scan_logfile_job, jobs).get(60 * 60 * 24)
+                    finally:
+                        pool.terminate()
+                        pool.join()
+            except (OSError, NotImplementedError) as e:
+                crmlog.common_debug("parallel log scan failed: %s" % (e))
+        return [_scan_logfile(*job) for job in jobs]
+
+    def _merge_scan(self, scan, transitions_map, new_transitions, missing_pefiles):
+        """
+        Merge partial tables from scanning a single log.
+        New transitions are added to self.transitions and
+        new_transitions, missing pefiles to missing_pefiles.
+        """
+        for op, id_, args in scan.ops:
+            transition = transitions_map.get(id_)
+            if op == _TRANS_START:
+                if transition is not None:
+                    crmlog.common_debug("~Transition: %s old(%s, %s) new(%s, %s)" %
+                                        (transition, transition.trans_num, transition.pe_file, args[2], args[3]))
+                    continue
+                dc, ts, trans_num, pe_file, pe_num, pe_orig = args
+                transition = Transition(self.loc, dc, ts, trans_num, pe_file, pe_num)
+                self.transitions.append(transition)
+                new_transitions.append(transition)
+                transitions_map[id_] = transition
+                crmlog.common_debug("{Transition: %s" % (transition))
+
+                if not os.path.isfile(transition.path()):
+                    missing_pefiles.append((dc, pe_orig))
+            elif transition is None:
+                # transition end without previous begin...
+                crmlog.common_debug("Found transition end without start: %s: %s - %s" %
+                                    (args[0], self.filenames[scan.logidx], id_))
+            else:
+                transition.end_ts, transition.end_state, transition.end_actions = args
+                crmlog.common_debug("}Transition: %s %s" % (transition, transition.end_state))
+        for id_, tags in scan.tags.iteritems():
+            transition = transitions_map.get(id_)
+            if transition is not None:
+                transition.tags.update(tags)
+        for etype, events in scan.events.iteritems():
+            self.events[etype].extend(events)
+
+    def _can_refresh(self):
+        """
+        True if there is previous scan data to refresh.
+        """
+        if not any(self.filestate) and not self._load_cache(check_age=False):
+            return False
+        return [st and st["filename"] for st in self.filestate] == self.filenames
+
+    def _resume_offset(self, logidx):
+        """
+        Returns the offset to resume scanning the given
+        log from on refresh:
+        None if the log is unchanged since the last scan,
+        0 if it was rotated, truncated or replaced,
+        otherwise the end offset of the last scan.
+        """
+        state, filename = self.filestate[logidx], self.filenames[logidx]
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return 0
+        if st.st_ino != state["inode"]:
+            return 0
+        if _is_compressed(filename):
+            # appending to a compressed log does not happen,
+            # any change means it is a different log
+            return None if st.st_size == state["size"] else 0
+        if st.st_size < state["offset"]:
+            return 0
+        if _head_checksum(self.fileobjs[logidx], state["headlen"]) != state["head"]:
+            return 0
+        if st.st_size == state["offset"]:
+            return None
+        return state["offset"]
+
+    def _file_state(self, logidx, offset, open_trans, tsindex):
+        """
+        Record where the scan of the given log ended,
+        so that refresh can continue from there.
+        open_trans: id of the transition open at offset
+        tsindex: [(timestamp, offset)], see _seek_offset
+        """
+        filename = self.filenames[logidx]
+        st = os.stat(filename)
+        headlen = min(offset, _HEAD_CHECKSUM_SIZE)
+        return {
+            "filename": filename,
+            "inode": st.st_ino,
+            "size": st.st_size,
+            "offset": offset,
+            "headlen": headlen,
+            "head": _head_checksum(self.fileobjs[logidx], headlen),
+            "open": open_trans,
+            "tsindex": tsindex,
+        }
+
+    def _reopen(self, logidx):
+        if self.fileobjs[logidx] is not None:
+            self.fileobjs[logidx].close()
+        self.fileobjs[logidx] = _open_logfile(self.filenames[logidx])
+
+    def _drop_events(self, logidx):
+        """
+        Forget events found in the given log
+        """
+        for etype, logs in self.events.items():
+            self.events[etype] = [e for e in logs if e[1] != logidx]
+
     def set_timeframe(self, from_t, to_t):
         """
         from_t, to_t: timestamps or datetime objects
@@ -443,6 +876,22 @@ class LogParser(object):
         self.from_ts = logtime.make_time(from_t)
         self.to_ts = logtime.make_time(to_t)
 
+    def _seek_offset(self, logidx):
+        """
+        Offset to start reading the given log from, for
+        the current timeframe. Looks up the start of the
+        timeframe in the timestamp index of the log, one
+        index point early to allow for lines slightly out
+        of order.
+        """
+        if not self.from_ts or logidx >= len(self.filestate) or not self.filestate[logidx]:
+            return 0
+        tsindex = self.filestate[logidx]["tsindex"]
+        i = bisect.bisect_left([ts for ts, _ in tsindex], self.from_ts) - 2
+        if i < 0:
+            return 0
+        return tsindex[i][1]
+
     def get_logs(self, nodes=None):
         """
         Generator which yields a list of log messages limited by the
@@ -450,35 +899,40 @@ class LogParser(object):
 
         The log lines are printed in order, by reading from
         all files at once and always printing the line with
-        the lowest timestamp
+        the lowest timestamp. Each file is read starting
+        near the beginning of the current timeframe.
         """
 
         def include_log(logfile):
             return not nodes or os.path.basename(os.path.dirname(logfile)) in nodes
 
-        for f in self.fileobjs:
-            f.seek(0)
-
-        lines = [[None, f.readline(), f] for f in self.fileobjs]
-        for i, line in enumerate(lines):
-            if not line[1]:
-                line[0], line[2] = sys.float_info.max, None
-            else:
-                line[0] = logtime.syslog_ts(line[1])
+        logs = []
+        for i, f in enumerate(self.fileobjs):
+            f.seek(self._seek_offset(i))
+            logs.append(_read_timestamped(f, i))
 
-        while any(f is not None for _, _, f in lines):
-            x = min(lines, key=lambda v: v[0])
-            if x[2] is None:
+        # ordered by (timestamp, file index)
+        for ts, _, line in heapq.merge(*logs):
+            if self.to_ts and ts > self.to_ts:
                 break
-            if self.to_ts and x[0] > self.to_ts:
+            if not (self.from_ts and ts < self.from_ts):
+                yield line
+
+    def _events_in_timeframe(self, etype):
+        """
+        Yields (fileid, spos) for the events of the given type,
+        skipping those before the timeframe by the sort keys.
+        Events are sorted by (timestamp << 32) + spos.
+        """
+        logs = self.events.get(etype, [])
+        lo = 0
+        if self.from_ts:
+            lo = bisect.bisect_left(logs, (long(self.from_ts) << 32,))
+        for i in xrange(lo, len(logs)):
+            sk, f, pos = logs[i]
+            if self.to_ts and (sk - pos) >> 32 > self.to_ts:
                 break
-            if not (self.from_ts and x[0] < self.from_ts):
-                yield x[1]
-            x[1] = x[2].readline()
-            if not x[1]:
-                x[0], x[2] = sys.float_info.max, None
-            else:
-                x[0] = logtime.syslog_ts(x[1])
+            yield f, pos
 
     def get_events(self, event=None, nodes=None, resources=None):
         """
@@ -487,7 +941,7 @@ class LogParser(object):
         nodes: optional list of nodes
         resources: optional list of resources
 
-        TODO: ordering, time limits
+        TODO: ordering
         """
         if event is not None:
             eventlogs = [event]
@@ -516,21 +970,23 @@ class LogParser(object):
         if event == "resource" and resources is not None and rxes is not None:
             crmlog.common_debug("resource %s rxes: %s" % (", ".join(resources), ", ".join(r.pattern for r in rxes)))
 
+        tsps = collections.defaultdict(logtime.TimestampParser)
+
         if rxes is not None:
             for log in eventlogs:
-                for _, f, pos in self.events.get(log, []):
+                for f, pos in self._events_in_timeframe(log):
                     self.fileobjs[f].seek(pos)
                     msg = self.fileobjs[f].readline()
                     if any(rx.search(msg) for rx in rxes):
-                        ts = logtime.syslog_ts(msg)
+                        ts = tsps[f].ts(msg)
                         if not (self.from_ts and ts < self.from_ts) and not (self.to_ts and ts > self.to_ts):
                             yield msg
         else:
             for log in eventlogs:
-                for _, f, pos in self.events.get(log, []):
+                for f, pos in self._events_in_timeframe(log):
                     self.fileobjs[f].seek(pos)
                     msg = self.fileobjs[f].readline()
-                    ts = logtime.syslog_ts(msg)
+                    ts = tsps[f].ts(msg)
                     if not (self.from_ts and ts < self.from_ts) and not (self.to_ts and ts > self.to_ts):
                         yield msg
 
@@ -570,11 +1026,11 @@ class LogParser(object):
     def to_dict(self):
         """
         Serialize self to dict (including transition objects)
+        Events are stored separately, see _write_index.
         """
         o = {
-            "version": _METADATA_VERSION,
-            "events": self.events,
-            "transitions": [t.to_dict() for t in self.transitions],
+            "transitions": [t.to_row() for t in self.transitions],
+            "files": self.filestate,
             "cib": {
                 "nodes": self.cib.nodes,
                 "primitives": self.cib.primitives,
@@ -588,11 +1044,8 @@ class LogParser(object):
         """
         Load from dict
         """
-        if "version" not in obj or obj["version"] != _METADATA_VERSION:
-            return False
-        self.events = obj["events"]
-        self.transitions = [Transition.from_dict(self.loc, t) for t in obj["transitions"]]
-        return True
+        self.transitions = [Transition.from_row(self.loc, t) for t in obj["transitions"]]
+        self.filestate = obj["files"]
 
     def _metafile(self):
         return os.path.join(self.loc, _METADATA_FILENAME)
@@ -609,27 +1062,35 @@ class LogParser(object):
         """
         fn = self._metafile()
         try:
-            with open(fn, 'wb') as f:
-                json.dump(self.to_dict(), f, indent=2)
-                crmlog.common_debug("Transition metadata saved to %s" % (fn))
-        except IOError as e:
+            # replace the file, it may be mapped by _load_cache
+            with utils.atomic_write(fn, mode='wb', prefix=_METADATA_FILENAME) as f:
+                _write_index(f, self.to_dict(), self.events)
+            crmlog.common_debug("Transition metadata saved to %s" % (fn))
+        except (IOError, OSError) as e:
             crmlog.common_debug("Could not update metadata cache: %s" % (e))
 
-    def _load_cache(self):
+    def _load_cache(self, check_age=True):
         """
         Load state from cache file
+        The events are not read until used.
+        check_age: ignore the cache if older than _METADATA_CACHE_AGE
         """
         fn = self._metafile()
-        if os.path.isfile(fn) and time.time() - os.stat(fn).st_mtime < _METADATA_CACHE_AGE:
-            try:
-                with open(fn, 'rb') as f:
-                    try:
-                        if not self.from_dict(json.load(f)):
-                            return False
-                        crmlog.common_debug("Transition metadata loaded from %s" % (fn))
-                        return True
-                    except ValueError as e:
-                        crmlog.common_debug("Failed to load metadata: %s" % (e))
-            except IOError as e:
+        if not os.path.isfile(fn):
+            return False
+        if check_age and time.time() - os.stat(fn).st_mtime >= _METADATA_CACHE_AGE:
+            return False
+        try:
+            with open(fn, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            index = _read_index(buf)
+            if index is None:
                 return False
+            header, events = index
+            self.from_dict(header)
+            self.events = collections.defaultdict(list, events)
+            crmlog.common_debug("Transition metadata loaded from %s" % (fn))
+            return True
+        except (IOError, EnvironmentError, ValueError, KeyError, struct.error) as e:
+            crmlog.common_debug("Failed to load metadata: %s" % (e))
         return False
@@ -61,60 +61,132 @@ _syslog2node_formats = (re.compile(r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\
                         re.compile(r'^(\d{4}-\d{2}-\d{2}T\S+)\s+(?:\[\d+\])?\s*([\S]+)'),
                         re.compile(r'^([a-zA-Z]{2,4}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})\s+(?:\[\d+\])?\s*([\S]+)'),
                         re.compile(r'^(\d{4}\/\d{2}\/\d{2}_\d{2}:\d{2}:\d{2})'))
+_FMT_RFC3339, _FMT_ISO, _FMT_SYSLOG, _FMT_HB = range(len(_syslog2node_formats))
 
-_syslog_ts_prev = None
 
-
-def syslog_ts(s):
-    """
-    Finds the timestamp in the given line
-    Returns as floating point, seconds
+class TimestampParser(object):
     """
-    global _syslog_ts_prev
-    fmt1, fmt2, fmt3, fmt4 = _syslog2node_formats
-
-    # RFC3339
-    m = fmt1.match(s)
-    if m:
-        year, month, day, hour, minute, second, ms, tzsgn, tzh, tzm, _ = m.groups()
-        ts = time.mktime((int(year), int(month), int(day), int(hour), int(minute), int(second), 0, 0, -1))
-        if tzsgn == '+':
-            ts += (3600.0 * float(tzh) + 60.0 * float(tzm))
-        else:
-            ts -= (3600.0 * float(tzh) + 60.0 * float(tzm))
-        if ms:
-            ts += float("0.%s" % ms)
-        _syslog_ts_prev = ts
-        return _syslog_ts_prev
-
-    m = fmt2.match(s)
-    if m:
-        _syslog_ts_prev = utils.parse_to_timestamp(m.group(1))
-        return _syslog_ts_prev
-
-    m = fmt3.match(s)
-    if m:
-        if YEAR is None:
-            set_year()
-        tstr = YEAR + ' ' + m.group(1)
+    Finds the timestamp (and node) in log lines.
 
-        dt = datetime.datetime.strptime(tstr, '%Y %b %d %H:%M:%S')
-        from dateutil import tz
-        ts = utils.total_seconds(dt - tz.tzlocal().utcoffset(dt) - datetime.datetime(1970, 1, 1))
-        _syslog_ts_prev = ts
-        return _syslog_ts_prev
+    The format found in a line is tried first for the next
+    line, so use one parser per log. Converting the part of
+    the timestamp up to the second is memoized, since
+    consecutive lines usually share it.
 
-    m = fmt4.match(s)
-    if m:
-        tstr = m.group(1).replace('_', ' ')
-        _syslog_ts_prev = utils.parse_to_timestamp(tstr)
-        return _syslog_ts_prev
+    Lines without a timestamp get the timestamp (and node)
+    of the previous line.
+    """
 
-    crmlog.common_debug("malformed line: %s" % s)
-    return _syslog_ts_prev
+    def __init__(self):
+        self.fmt = None
+        self.prev_ts = None
+        self.prev_node = None
+        self._memo_key = None
+        self._memo_ts = None
+
+    def _match(self, s):
+        """
+        Returns (format, match), or (None, None)
+        """
+        # lines in the RFC3339 format also match the ISO
+        # format, but are converted differently
+        if self.fmt is not None and self.fmt != _FMT_ISO:
+            m = _syslog2node_formats[self.fmt].match(s)
+            if m:
+                return self.fmt, m
+        for fmt, rx in enumerate(_syslog2node_formats):
+            m = rx.match(s)
+            if m:
+                self.fmt = fmt
+                return fmt, m
+        return None, None
+
+    def _seconds(self, fmt, m):
+        """
+        Timestamp of the matched line, without fractions
+        of a second for the RFC3339 format.
+        """
+        if fmt == _FMT_RFC3339:
+            key = m.group(1, 2, 3, 4, 5, 6, 8, 9, 10)
+        elif fmt == _FMT_SYSLOG:
+            key = (YEAR, m.group(1))
+        else:
+            key = m.group(1)
+        key = (fmt, key)
+        if key == self._memo_key:
+            return self._memo_ts
+
+        if fmt == _FMT_RFC3339:
+            year, month, day, hour, minute, second, tzsgn, tzh, tzm = key[1]
+            ts = time.mktime((int(year), int(month), int(day), int(hour), int(minute), int(second), 0, 0, -1))
+            if tzsgn == '+':
+                ts += (3600.0 * float(tzh) + 60.0 * float(tzm))
+            else:
+                ts -= (3600.0 * float(tzh) + 60.0 * float(tzm))
+        elif fmt == _FMT_ISO:
+            ts = utils.parse_to_timestamp(m.group(1))
+        elif fmt == _FMT_SYSLOG:
+            if YEAR is None:
+                set_year()
+            tstr = YEAR + ' ' + m.group(1)
+            dt = datetime.datetime.strptime(tstr, '%Y %b %d %H:%M:%S')
+            from dateutil import tz
+            ts = utils.total_seconds(dt - tz.tzlocal().utcoffset(dt) - datetime.datetime(1970, 1, 1))
+        else:
+            tstr = m.group(1).replace('_', ' ')
+            ts = utils.parse_to_timestamp(tstr)
+
+        self._memo_key, self._memo_ts = key, ts
+        return ts
+
+    def ts(self, s):
+        """
+        Finds the timestamp in the given line
+        Returns as floating point, seconds
+        """
+        fmt, m = self._match(s)
+        if m is None:
+            crmlog.common_debug("malformed line: %s" % s)
+            return self.prev_ts
+        ts = self._seconds(fmt, m)
+        if fmt == _FMT_RFC3339 and m.group(7):
+            ts += float("0.%s" % m.group(7))
+        self.prev_ts = ts
+        return ts
+
+    def ts_node(self, s):
+        """
+        Returns (timestamp, node) from a syslog log line
+        """
+        fmt, m = self._match(s)
+        if m is None:
+            crmlog.common_debug("malformed line: %s" % s)
+            return self.prev_ts, self.prev_node
+        self.prev_ts = self._seconds(fmt, m)
+        if fmt == _FMT_RFC3339:
+            self.prev_node = m.group(11)
+        elif fmt != _FMT_HB:
+            self.prev_node = m.group(2)
+        return self.prev_ts, self.prev_node
+
+    def parse_lines(self, lines):
+        """
+        Returns the list of timestamps of the given lines
+        """
+        ts = self.ts
+        return [ts(s) for s in lines]
+
+
+# used for lines from any log
+_parser = TimestampParser()
 
 
-_syslog_node_prev = None
+def syslog_ts(s):
+    """
+    Finds the timestamp in the given line
+    Returns as floating point, seconds
+    """
+    return _parser.ts(s)
 
 
 def syslog2node(s):
@@ -130,89 +202,46 @@ def syslog2node(s):
     RFC5424 (2):
     <TS> [<PID>] <node> ...
     '''
-    global _syslog_node_prev
-
     fmt1, fmt2, fmt3, _ = _syslog2node_formats
     m = fmt1.match(s)
     if m:
-        _syslog_node_prev = m.group(11)
-        return _syslog_node_prev
+        _parser.prev_node = m.group(11)
+        return _parser.prev_node
 
     m = fmt2.match(s)
     if m:
-        _syslog_node_prev = m.group(2)
-        return _syslog_node_prev
+        _parser.prev_node = m.group(2)
+        return _parser.prev_node
 
     m = fmt3.match(s)
     if m:
-        _syslog_node_prev = m.group(2)
-        return _syslog_node_prev
+        _parser.prev_node = m.group(2)
+        return _parser.prev_node
 
     try:
         # strptime defaults year to 1900 (sigh)
         time.strptime(' '.join(s.split()[0:3]),
                       "%b %d %H:%M:%S")
-        _syslog_node_prev = s.split()[3]
-        return _syslog_node_prev
+        _parser.prev_node = s.split()[3]
+        return _parser.prev_node
     except ValueError:  # try the rfc5424
         ls = s.split()
         if not ls:
-            return _syslog_node_prev
+            return _parser.prev_node
         rfc5424 = s.split()[0]
         if 'T' in rfc5424:
             try:
                 utils.parse_to_timestamp(rfc5424)
-                _syslog_node_prev = s.split()[1]
-                return _syslog_node_prev
+                _parser.prev_node = s.split()[1]
+                return _parser.prev_node
             except Exception:
-                return _syslog_node_prev
+                return _parser.prev_node
         else:
-            return _syslog_node_prev
+            return _parser.prev_node
 
 
 def syslog_ts_node(s):
     """
     Returns (timestamp, node) from a syslog log line
     """
-    global _syslog_ts_prev
-    global _syslog_node_prev
-    fmt1, fmt2, fmt3, fmt4 = _syslog2node_formats
-
-    # RFC3339
-    m = fmt1.match(s)
-    if m:
-        year, month, day, hour, minute, second, ms, tzsgn, tzh, tzm, node = m.groups()
-        ts = time.mktime((int(year), int(month), int(day), int(hour), int(minute), int(second), 0, 0, -1))
-        if tzsgn == '+':
-            ts += (3600.0 * float(tzh) + 60.0 * float(tzm))
-        else:
-            ts -= (3600.0 * float(tzh) + 60.0 * float(tzm))
-        _syslog_ts_prev = ts
-        _syslog_node_prev = node
-        return _syslog_ts_prev, node
-
-    m = fmt2.match(s)
-    if m:
-        _syslog_ts_prev, _syslog_node_prev = utils.parse_to_timestamp(m.group(1)), m.group(2)
-        return _syslog_ts_prev, _syslog_node_prev
-
-    m = fmt3.match(s)
-    if m:
-        if YEAR is None:
-            set_year()
-        tstr = YEAR + ' ' + m.group(1)
-
-        dt = datetime.datetime.strptime(tstr, '%Y %b %d %H:%M:%S')
-        from dateutil import tz
-        ts = utils.total_seconds(dt - tz.tzlocal().utcoffset(dt) - datetime.datetime(1970, 1, 1))
-        _syslog_ts_prev, _syslog_node_prev = ts, m.group(2)
-        return _syslog_ts_prev, _syslog_node_prev
-
-    m = fmt4.match(s)
-    if m:
-        tstr = m.group(1).replace('_', ' ')
-        _syslog_ts_prev = utils.parse_to_timestamp(tstr)
-        return _syslog_ts_prev, _syslog_node_prev
-
-    crmlog.common_debug("malformed line: %s" % s)
-    return _syslog_ts_prev, _syslog_node_prev
+    return _parser.ts_node(s)
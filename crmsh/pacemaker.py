@@ -2,9 +2,13 @@
 # See COPYING for license information.
 
 import os
-import tempfile
 import copy
+import hashlib
 from lxml import etree
+from . import cache
+from . import config
+from . import userdir
+from . import utils
 
 
 class PacemakerError(Exception):
@@ -65,6 +69,32 @@ def subset_select(sub_set, optional):
     return True
 
 
+def schema_cache_dir():
+    return os.path.join(config.path.cache, "rng-%s" % userdir.getuser())
+
+
+_validators = cache.region("relaxng", maxsize=16)
+
+
+def relaxng(schema_f):
+    '''
+    The compiled Relax-NG validator for schema_f. Compiling
+    takes a while, so validators are kept for as long as the
+    file doesn't change.
+    '''
+    try:
+        key = (schema_f, os.stat(schema_f).st_mtime)
+    except OSError, msg:
+        raise PacemakerError("Failed to parse the Relax-NG schema: " + str(msg))
+    if _validators.is_cached(key):
+        return _validators.retrieve(key)
+    try:
+        schema = etree.RelaxNG(file=schema_f)
+    except etree.Error, msg:
+        raise PacemakerError("Failed to parse the Relax-NG schema: " + str(msg))
+    return _validators.store(key, schema)
+
+
 def CrmSchema(cib_elem, local_dir):
     return RngSchema(cib_elem, local_dir)
 
@@ -80,9 +110,9 @@ class Schema(object):
             self.get_schema_fn = read_schema_local
 
         self.local_dir = local_dir
-        self.refresh(cib_elem)
         self.schema_str_docs = {}
         self.schema_filename = None
+        self.refresh(cib_elem)
 
     def update_schema(self):
         'defined in subclasses'
@@ -106,57 +136,45 @@ class Schema(object):
             schema_f = os.path.join(self.local_dir, self.schema_filename)
         else:
             try:
-                tmp_f = self.tmp_schema_f()
+                schema_f = self.expanded_schema_f()
             except EnvironmentError, msg:
                 raise PacemakerError("Cannot expand the Relax-NG schema: " + str(msg))
-            if tmp_f is None:
+            if schema_f is None:
                 raise PacemakerError("Cannot expand the Relax-NG schema")
-            else:
-                schema_f = tmp_f
 
-        try:
-            cib_elem = etree.fromstring(etree.tostring(new_cib_elem))
-        except etree.Error, msg:
-            raise PacemakerError("Failed to parse the CIB XML: " + str(msg))
-
-        try:
-            schema = etree.RelaxNG(file=schema_f)
-
-        except etree.Error, msg:
-            raise PacemakerError("Failed to parse the Relax-NG schema: " + str(msg))
+        schema = relaxng(schema_f)
         try:
             etree.clear_error_log()
         except:
             pass
 
-        is_valid = schema.validate(cib_elem)
+        is_valid = schema.validate(new_cib_elem)
         if not is_valid:
             for error_entry in schema.error_log:
                 detail_msg += error_entry.level_name + ": " + error_entry.message + "\n"
 
-        if not self.is_local:
-            try:
-                delete_dir(os.path.dirname(tmp_f))
-            except:
-                pass
-
         return (is_valid, detail_msg)
 
-    def tmp_schema_f(self):
-        tmp_dir = tempfile.mkdtemp()
-        for schema_doc_name in self.schema_str_docs:
-            schema_doc_filename = os.path.join(tmp_dir, schema_doc_name)
-            fd = os.open(schema_doc_filename, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0644)
-
-            schema_doc_str = self.schema_str_docs[schema_doc_name]
-
-            os.write(fd, schema_doc_str)
-            os.close(fd)
-
-        if self.schema_filename in self.schema_str_docs:
-            return os.path.join(tmp_dir, self.schema_filename)
-        else:
+    def expanded_schema_f(self):
+        '''
+        Write the schema documents to a directory in the cache
+        named after their digest, so that it is done only once
+        for any set of documents.
+        '''
+        if self.schema_filename not in self.schema_str_docs:
             return None
+        digest = hashlib.md5()
+        for name in sorted(self.schema_str_docs):
+            digest.update(name + "\0" + self.schema_str_docs[name] + "\0")
+        schema_dir = os.path.join(schema_cache_dir(), digest.hexdigest())
+        schema_f = os.path.join(schema_dir, self.schema_filename)
+        if not os.path.isfile(schema_f):
+            # the schema file goes last: once it is there, so are
+            # the documents it includes
+            for name in sorted(self.schema_str_docs, key=lambda n: n == self.schema_filename):
+                with utils.atomic_write(os.path.join(schema_dir, name), prefix=".rng") as f:
+                    f.write(self.schema_str_docs[name])
+        return schema_f
 
     def get_sub_elems_by_obj(self, obj, sub_set='a'):
         '''defined in subclasses'''
@@ -245,6 +263,18 @@ class RngSchema(Schema):
                 return (grammar, elem_node)
         return None
 
+    def elem_names(self):
+        "Names of all elements in the schema."
+        names = set()
+        for grammar, _ in self.rng_docs.values():
+            for elem_node in grammar.xpath(self.expr, name="element"):
+                if elem_node.get("name"):
+                    names.add(elem_node.get("name"))
+        return sorted(names)
+
+    def schema_files(self):
+        return [os.path.join(self.local_dir, f) for f in sorted(self.rng_docs)]
+
     def rng_xpath(self, xpath, namespaces=None):
         return [grammar.xpath(xpath, namespaces=namespaces)
                 for grammar, _ in self.rng_docs.values()]
@@ -2,7 +2,6 @@
 # Copyright (C) 2013-2016 Kristoffer Gronlund <kgronlund@suse.com>
 # See COPYING for license information.
 
-import shlex
 import re
 import inspect
 from lxml import etree
@@ -42,9 +41,91 @@ _TAG_RE = re.compile(r"([a-zA-Z_][^\s:]*):?$")
 _ROLE2_RE = re.compile(r"role=(.+)$", re.IGNORECASE)
 _TARGET_RE = re.compile(r'([^:]+):$')
 _TARGET_ATTR_RE = re.compile(r'attr:([\w-]+)=([\w-]+)$', re.IGNORECASE)
+_SCORE_VALUE_RE = re.compile(r'^[+-]?(inf(inity)?|INF(INITY)?|[0-9]+)$')
+_INFINITY_RE = re.compile(r'inf(inity)?|INF(INITY)?')
+_KEYWORD_RE = re.compile(r'[\w-]+$')
 TERMINATORS = ('params', 'meta', 'utilization', 'operations', 'op', 'rule', 'attributes')
 
 
+# string patterns given to try_match(), compiled once
+_patterns = {}
+_bykey_patterns = {}
+
+
+def _compile_pattern(rx):
+    '''
+    Returns (keyword, regex). A plain word is matched as a
+    keyword (case insensitive), anything else is compiled to a
+    regex which has to match the whole token.
+    '''
+    p = _patterns.get(rx)
+    if p is None:
+        if _KEYWORD_RE.match(rx):
+            p = (rx.lower(), None)
+        else:
+            p = (None, re.compile(rx if rx.endswith('$') else rx + '$', re.IGNORECASE))
+        _patterns[rx] = p
+    return p
+
+
+# one piece of a shell-like token, see split()
+_SPLIT_RE = re.compile(r'''([ \t\r\n]+)|'([^']*)'|"((?:[^"\\]|\\.)*)"|\\(.)|([^ \t\r\n'"\\]+)''', re.S)
+_DQ_ESCAPE_RE = re.compile(r'\\(["\\])')
+_DQ_UNFINISHED_RE = re.compile(r'"(?:[^"\\]|\\.)*\\\Z', re.S)
+
+
+def split(s):
+    '''
+    Split s like shlex.split() does (POSIX mode, no comments),
+    only much faster: whole runs of characters are taken at once
+    instead of reading the string one character at a time.
+    '''
+    tokens = []
+    token = None
+    pos, end = 0, len(s)
+    while pos < end:
+        m = _SPLIT_RE.match(s, pos)
+        if m is None:
+            if s[pos] == '\\' or _DQ_UNFINISHED_RE.match(s, pos):
+                raise ValueError("No escaped character")
+            raise ValueError("No closing quotation")
+        pos = m.end()
+        space, squoted, dquoted, escaped, plain = m.groups()
+        if space is not None:
+            if token is not None:
+                tokens.append(token)
+                token = None
+            continue
+        if token is None:
+            token = ''
+        if squoted is not None:
+            token += squoted
+        elif dquoted is not None:
+            token += _DQ_ESCAPE_RE.sub(r'\1', dquoted)
+        elif escaped is not None:
+            token += escaped
+        else:
+            token += plain
+    if token is not None:
+        tokens.append(token)
+    return tokens
+
+
+class _KeywordMatch(object):
+    '''
+    The match object of a keyword: group 0 is the token.
+    '''
+    __slots__ = ('_tok',)
+
+    def __init__(self, tok):
+        self._tok = tok
+
+    def group(self, idx=0):
+        if idx != 0:
+            raise IndexError("no such group")
+        return self._tok
+
+
 class ParseError(Exception):
     '''
     Raised by parsers when parsing fails.
@@ -54,6 +135,8 @@ class ParseError(Exception):
 
 
 class Validation(object):
+    _node_type_optional = {}  # by schema
+
     def resource_roles(self):
         'returns list of valid resource roles'
         return schema.rng_attr_values('resource_set', 'role')
@@ -121,11 +204,16 @@ class Validation(object):
             return False
 
     def node_type_optional(self):
-        ns = {'t': 'http://relaxng.org/ns/structure/1.0'}
-        path = '//t:element[@name="nodes"]'
-        path = path + '//t:element[@name="node"]/t:optional/t:attribute[@name="type"]'
-        has_optional = schema.rng_xpath(path, namespaces=ns)
-        return len(has_optional) > 0
+        vname = schema.validate_name()
+        if vname not in self._node_type_optional:
+            ns = {'t': 'http://relaxng.org/ns/structure/1.0'}
+            path = '//t:element[@name="nodes"]'
+            path = path + '//t:element[@name="node"]/t:optional/t:attribute[@name="type"]'
+            has_optional = schema.rng_xpath(path, namespaces=ns)
+            if not has_optional:  # no schema (yet)
+                return False
+            self._node_type_optional[vname] = len(has_optional) > 0
+        return self._node_type_optional[vname]
 
 
 validator = Validation()
@@ -182,9 +270,11 @@ class BaseParser(object):
         if not tok:
             return None
         if isinstance(rx, basestring):
-            if not rx.endswith('$'):
-                rx = rx + '$'
-            self._lastmatch = re.match(rx, tok, re.IGNORECASE)
+            kw, rx = _compile_pattern(rx)
+            if kw is not None:
+                self._lastmatch = _KeywordMatch(tok) if tok.lower() == kw else None
+            else:
+                self._lastmatch = rx.match(tok)
         else:
             self._lastmatch = rx.match(tok)
         if self._lastmatch is not None:
@@ -255,8 +345,11 @@ class BaseParser(object):
         matches string of p=v | p tokens, but only if p is in valid_keys
         Returns list of <nvpair> tags
         """
-        _KEY_RE = re.compile(r'(%s)=(.+)$' % '|'.join(valid_keys))
-        _NOVAL_RE = re.compile(r'(%s)$' % '|'.join(valid_keys))
+        keys = '|'.join(valid_keys)
+        if keys not in _bykey_patterns:
+            _bykey_patterns[keys] = (re.compile(r'(%s)=(.+)$' % keys),
+                                     re.compile(r'(%s)$' % keys))
+        _KEY_RE, _NOVAL_RE = _bykey_patterns[keys]
         ret = []
         while True:
             if self.try_match(_KEY_RE):
@@ -575,8 +668,8 @@ class BaseParser(object):
     def validate_score(self, score, noattr=False):
         if not noattr and score in olist(constants.score_types):
             return ["score", constants.score_types[score.lower()]]
-        elif re.match("^[+-]?(inf(inity)?|INF(INITY)?|[0-9]+)$", score):
-            score = re.sub("inf(inity)?|INF(INITY)?", "INFINITY", score)
+        elif _SCORE_VALUE_RE.match(score):
+            score = _INFINITY_RE.sub("INFINITY", score)
             return ["score", score]
         if noattr:
             # orders have the special kind attribute
@@ -1599,7 +1692,7 @@ def parse(s, comments=None):
                 common_err(e)
                 return False
         else:
-            s = shlex.split(s)
+            s = split(s)
     # but there shouldn't be any newlines (?)
     while '\n' in s:
         s.remove('\n')
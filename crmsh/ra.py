@@ -4,6 +4,8 @@
 import os
 import subprocess
 import copy
+import urllib
+from multiprocessing.pool import ThreadPool
 from lxml import etree
 import re
 import glob
@@ -11,6 +13,7 @@ from . import cache
 from . import constants
 from . import config
 from . import options
+from . import ordereddict
 from . import userdir
 from . import utils
 from .utils import stdout2list, is_program, is_process, add_sudo
@@ -23,6 +26,12 @@ from .msg import common_debug, common_err, common_warn, common_info
 #
 lrmadmin_prog = "lrmadmin"
 
+# agent lists and meta-data, refetched after agents get installed
+_ra_cache = cache.region("ra", maxsize=512, ttl=600, invalidate_on=("agent-install",))
+
+# meta-data reads running in parallel, see prefetch_meta()
+_prefetch_threads = 8
+
 
 class RaLrmd(object):
     '''
@@ -200,7 +209,7 @@ def crm_resource_support():
     return s != ""
 
 
-@utils.memoize
+@cache.memoize(invalidate_on=("agent-install",))
 def ra_if():
     if crm_resource_support():
         common_debug("Using crm_resource for agent discovery")
@@ -216,21 +225,21 @@ def ra_classes():
     '''
     List of RA classes.
     '''
-    if cache.is_cached("ra_classes"):
-        return cache.retrieve("ra_classes")
+    if _ra_cache.is_cached("ra_classes"):
+        return _ra_cache.retrieve("ra_classes")
     l = ra_if().classes()
     l.sort()
-    return cache.store("ra_classes", l)
+    return _ra_cache.store("ra_classes", l)
 
 
 def ra_providers(ra_type, ra_class="ocf"):
     'List of providers for a class:type.'
     ident = "ra_providers-%s-%s" % (ra_class, ra_type)
-    if cache.is_cached(ident):
-        return cache.retrieve(ident)
+    if _ra_cache.is_cached(ident):
+        return _ra_cache.retrieve(ident)
     l = ra_if().providers(ra_type, ra_class)
     l.sort()
-    return cache.store(ident, l)
+    return _ra_cache.store(ident, l)
 
 
 def ra_providers_all(ra_class="ocf"):
@@ -238,11 +247,11 @@ def ra_providers_all(ra_class="ocf"):
     List of providers for a class.
     '''
     ident = "ra_providers_all-%s" % ra_class
-    if cache.is_cached(ident):
-        return cache.retrieve(ident)
+    if _ra_cache.is_cached(ident):
+        return _ra_cache.retrieve(ident)
     ocf = os.path.join(os.environ["OCF_ROOT"], "resource.d")
     if os.path.isdir(ocf):
-        return cache.store(ident, sorted(s for s in os.listdir(ocf)
+        return _ra_cache.store(ident, sorted(s for s in os.listdir(ocf)
                                          if os.path.isdir(os.path.join(ocf, s))))
     return []
 
@@ -254,8 +263,8 @@ def ra_types(ra_class="ocf", ra_provider=""):
     if not ra_class:
         ra_class = "ocf"
     ident = "ra_types-%s-%s" % (ra_class, ra_provider)
-    if cache.is_cached(ident):
-        return cache.retrieve(ident)
+    if _ra_cache.is_cached(ident):
+        return _ra_cache.retrieve(ident)
 
     if not ra_provider:
         def include(ra):
@@ -263,32 +272,32 @@ def ra_types(ra_class="ocf", ra_provider=""):
     else:
         def include(ra):
             return ra_provider in ra_providers(ra, ra_class)
-    return cache.store(ident, sorted(list(set(ra for ra in ra_if().types(ra_class) if include(ra)))))
+    return _ra_cache.store(ident, sorted(list(set(ra for ra in ra_if().types(ra_class) if include(ra)))))
 
 
-@utils.memoize
+@cache.memoize
 def get_pe_meta():
     return RAInfo("pengine", "metadata")
 
 
-@utils.memoize
+@cache.memoize
 def get_crmd_meta():
     info = RAInfo("crmd", "metadata")
     info.exclude_from_completion(constants.crmd_metadata_do_not_complete)
     return info
 
 
-@utils.memoize
+@cache.memoize
 def get_stonithd_meta():
     return RAInfo("stonithd", "metadata")
 
 
-@utils.memoize
+@cache.memoize
 def get_cib_meta():
     return RAInfo("cib", "metadata")
 
 
-@utils.memoize
+@cache.memoize
 def get_properties_meta():
     meta = copy.deepcopy(get_crmd_meta())
     meta.add_ra_params(get_pe_meta())
@@ -296,7 +305,7 @@ def get_properties_meta():
     return meta
 
 
-@utils.memoize
+@cache.memoize
 def get_properties_list():
     try:
         return get_properties_meta().params().keys()
@@ -317,6 +326,74 @@ def prog_meta(prog):
     return []
 
 
+def _agent_file(ra_class, ra_type, ra_provider):
+    '''
+    The file implementing the agent, if we know where it lives.
+    '''
+    if ra_class in constants.meta_progs:
+        return is_program(ra_class)
+    if ra_class == "ocf":
+        return os.path.join(config.path.ocf_root, "resource.d", ra_provider, ra_type)
+    if ra_class == "stonith" and ra_type.startswith("fence_"):
+        return "/usr/sbin/%s" % ra_type
+    if ra_class == "nagios":
+        return os.path.join(config.path.nagios_plugins, "check_%s" % ra_type)
+    if ra_class == "lsb":
+        return os.path.join("/etc/init.d", ra_type)
+    return None
+
+
+def _agent_stamp(ra_class, ra_type, ra_provider):
+    '''
+    Path, mtime and size of the agent file. Cached meta-data
+    is valid only as long as the stamp doesn't change.
+    '''
+    f = _agent_file(ra_class, ra_type, ra_provider)
+    if not f:
+        return None
+    try:
+        st = os.stat(f)
+    except OSError:
+        return None
+    return "%r %d %s\n" % (st.st_mtime, st.st_size, f)
+
+
+def _meta_cache_dir():
+    return os.path.join(config.path.cache, "ra-meta-%s" % utils.getuser())
+
+
+def _meta_cache_file(agent):
+    return os.path.join(_meta_cache_dir(), urllib.quote(agent, safe=":") + ".xml")
+
+
+def _load_cached_meta(agent, stamp):
+    '''
+    Meta-data of the agent from the on-disk cache, or None if
+    it's not there or the agent changed since.
+    '''
+    try:
+        with open(_meta_cache_file(agent)) as f:
+            if f.readline() != stamp:
+                return None
+            return f.read()
+    except IOError:
+        return None
+
+
+def _save_cached_meta(agent, stamp, meta):
+    '''
+    Store the meta-data of the agent in the on-disk cache.
+    The file is replaced atomically, so that concurrent crm
+    processes never see a partial entry.
+    '''
+    try:
+        with utils.atomic_write(_meta_cache_file(agent), prefix=".ra-meta") as f:
+            f.write(stamp)
+            f.write(meta)
+    except (IOError, OSError), e:
+        common_debug("cannot cache meta-data for %s: %s" % (agent, e))
+
+
 def get_nodes_text(n, tag):
     try:
         return n.findtext(tag).strip()
@@ -441,8 +518,8 @@ class RAInfo(object):
         dictionary of attributes/values are values. Cached too.
         '''
         ident = "ra_params-%s" % self.ra_string()
-        if cache.is_cached(ident):
-            return cache.retrieve(ident)
+        if _ra_cache.is_cached(ident):
+            return _ra_cache.retrieve(ident)
         if self.mk_ra_node() is None:
             return None
         d = {}
@@ -459,7 +536,7 @@ class RAInfo(object):
                 "type": typ,
                 "default": default,
             }
-        return cache.store(ident, d)
+        return _ra_cache.store(ident, d)
 
     def completion_params(self):
         '''
@@ -478,8 +555,8 @@ class RAInfo(object):
         dictionary of attributes/values are values. Cached too.
         '''
         ident = "ra_actions-%s" % self.ra_string()
-        if cache.is_cached(ident):
-            return cache.retrieve(ident)
+        if _ra_cache.is_cached(ident):
+            return _ra_cache.retrieve(ident)
         if self.mk_ra_node() is None:
             return None
         d = {}
@@ -505,7 +582,7 @@ class RAInfo(object):
                 if norole_op not in d:
                     d2[norole_op] = d[op]
         d.update(d2)
-        return cache.store(ident, d)
+        return _ra_cache.store(ident, d)
 
     def reqd_params_list(self):
         '''
@@ -640,21 +717,42 @@ class RAInfo(object):
         Returns an etree xml object.
         '''
         sid = "ra_meta-%s" % self.ra_string()
-        if cache.is_cached(sid):
-            return cache.retrieve(sid)
-        if self.ra_class in constants.meta_progs:
-            l = prog_meta(self.ra_class)
-        else:
-            l = ra_if().meta(self.ra_class, self.ra_type, self.ra_provider)
-        if not l:
+        if _ra_cache.is_cached(sid):
+            return _ra_cache.retrieve(sid)
+        xml = self._read_meta()
+        if xml is None:
             return None
+        self.debug("read and cached meta-data")
+        return _ra_cache.store(sid, xml)
+
+    def _read_meta(self):
+        '''
+        Read the meta-data from the on-disk cache or from the
+        agent. Doesn't look at the in-memory cache.
+        The regression tests expect every crm run to call the
+        agent, so the on-disk cache is not used there.
+        '''
+        stamp = None
+        if not options.regression_tests:
+            stamp = _agent_stamp(self.ra_class, self.ra_type, self.ra_provider)
+        s = stamp and _load_cached_meta(self.ra_string(), stamp)
+        fresh = not s
+        if fresh:
+            if self.ra_class in constants.meta_progs:
+                l = prog_meta(self.ra_class)
+            else:
+                l = ra_if().meta(self.ra_class, self.ra_type, self.ra_provider)
+            if not l:
+                return None
+            s = '\n'.join(l)
         try:
-            xml = etree.fromstring('\n'.join(l))
+            xml = etree.fromstring(s)
         except Exception:
             self.error("Cannot parse meta-data XML")
             return None
-        self.debug("read and cached meta-data")
-        return cache.store(sid, xml)
+        if stamp and fresh:
+            _save_cached_meta(self.ra_string(), stamp, s)
+        return xml
 
     def meta_pretty(self):
         '''
@@ -763,6 +861,36 @@ class RAInfo(object):
         return "Operations' defaults (advisory minimum):\n\n" + '\n'.join(l)
 
 
+def prefetch_meta(agents):
+    '''
+    Read the meta-data of all agents (RAInfo instances) which
+    is not cached yet. Every agent read costs a fork or two,
+    so run them in a bounded pool of threads.
+    The regression tests expect the agent calls in order, so
+    nothing is prefetched there.
+    '''
+    if options.regression_tests:
+        return
+    todo = ordereddict.odict()
+    for agent in agents:
+        sid = "ra_meta-%s" % agent.ra_string()
+        if sid not in todo and not _ra_cache.is_cached(sid):
+            todo[sid] = agent
+    if len(todo) < 2:
+        return
+    ra_if()  # pick the interface before going parallel
+    pool = ThreadPool(min(len(todo), _prefetch_threads))
+    try:
+        xmls = pool.map(RAInfo._read_meta, todo.values())
+    finally:
+        pool.close()
+        pool.join()
+    for sid, xml in zip(todo.keys(), xmls):
+        if xml is not None:
+            _ra_cache.store(sid, xml)
+    common_debug("prefetched meta-data of %d agents" % len(todo))
+
+
 def get_ra(r):
     """
     Argument is either an xml resource tag with class, provider and type attributes,
@@ -1,10 +1,15 @@
 # Copyright (C) 2012 Dejan Muhamedagic <dmuhamedagic@suse.de>
 # See COPYING for license information.
 
-from . import config
+import os
 import re
+import json
+from lxml import etree
+from . import config
+from . import pacemaker
+from . import utils
 from .pacemaker import CrmSchema, PacemakerError
-from .msg import common_err
+from .msg import common_err, common_debug
 
 
 def is_supported(name):
@@ -77,6 +82,8 @@ _cache_funcs = {
 
 
 _crm_schema = None
+_validate_name = None
+_tables = {}
 _store = {}
 
 
@@ -89,12 +96,109 @@ def _load_schema(cib):
     return CrmSchema(cib, config.path.crm_dtd_dir)
 
 
-def init_schema(cib):
+def _schema():
+    '''
+    The schema, loaded on first use. With the tables in place
+    it is needed only for elements which are not in them and
+    for rng_xpath().
+    '''
     global _crm_schema
+    if _crm_schema is None and _validate_name is not None:
+        try:
+            _crm_schema = _load_schema(etree.Element("cib", {"validate-with": _validate_name}))
+        except PacemakerError, msg:
+            common_err(msg)
+    return _crm_schema
+
+
+#
+# The answers to all get() queries for a schema are computed
+# once and kept in the cache directory, one file per schema
+# version. The file is valid for as long as the schema files
+# don't change.
+#
+def _tables_file(name):
+    return os.path.join(pacemaker.schema_cache_dir(), "%s.json" % name)
+
+
+def _file_stamp(f):
     try:
-        _crm_schema = _load_schema(cib)
-    except PacemakerError, msg:
-        common_err(msg)
+        st = os.stat(f)
+    except OSError:
+        return None
+    return "%r %d" % (st.st_mtime, st.st_size)
+
+
+def _to_str(obj):
+    "json returns unicode, the rest of crmsh wants str"
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    if isinstance(obj, list):
+        return [_to_str(x) for x in obj]
+    if isinstance(obj, dict):
+        return dict((_to_str(k), _to_str(v)) for k, v in obj.iteritems())
+    return obj
+
+
+def _load_tables(name):
+    try:
+        with open(_tables_file(name)) as f:
+            d = json.load(f)
+    except (IOError, ValueError):
+        return None
+    try:
+        for f, stamp in d["files"]:
+            if _file_stamp(f) != stamp:
+                return None
+        return _to_str(d["tables"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _make_tables(crm_schema):
+    tables = {}
+    for t, fun in _cache_funcs.iteritems():
+        tables[t] = {}
+        for name in crm_schema.elem_names():
+            try:
+                value = fun(crm_schema, name)
+            except PacemakerError, msg:
+                common_debug("schema table %s: skipped %s: %s" % (t, name, msg))
+                continue  # leave it to get()
+            # some values don't survive json (None as key)
+            if _to_str(json.loads(json.dumps(value))) == value:
+                tables[t][name] = value
+    return tables
+
+
+def _save_tables(name, crm_schema, tables):
+    d = {
+        "files": [(f, _file_stamp(f)) for f in crm_schema.schema_files()],
+        "tables": tables,
+    }
+    fname = _tables_file(name)
+    try:
+        with utils.atomic_write(fname, prefix=".schema") as f:
+            json.dump(d, f)
+    except (IOError, OSError), msg:
+        common_debug("cannot save schema tables %s: %s" % (fname, msg))
+
+
+def init_schema(cib):
+    global _crm_schema, _validate_name, _tables
+    _crm_schema = None
+    _validate_name = pacemaker.get_validate_name(cib)
+    _tables = _validate_name and _load_tables(_validate_name)
+    if not _tables:
+        _tables = {}
+        try:
+            _crm_schema = _load_schema(cib)
+        except PacemakerError, msg:
+            common_err(msg)
+            _validate_name = None
+        else:
+            _tables = _make_tables(_crm_schema)
+            _save_tables(_validate_name, _crm_schema, _tables)
     reset()
 
 
@@ -108,18 +212,21 @@ def test_schema(cib):
 
 
 def validate_name():
-    if _crm_schema is None:
+    if _validate_name is None:
         return 'pacemaker-2.0'
-    return _crm_schema.validate_name
+    return _validate_name
 
 
 def get(t, name, subset=None):
-    if _crm_schema is None:
-        return []
     if t not in _store:
         _store[t] = {}
     if name not in _store[t]:
-        _store[t][name] = _cache_funcs[t](_crm_schema, name)
+        if name in _tables.get(t, {}):
+            _store[t][name] = _tables[t][name]
+        elif _schema() is None:
+            return []
+        else:
+            _store[t][name] = _cache_funcs[t](_crm_schema, name)
     if subset:
         return _store[t][name][subset]
     else:
@@ -145,7 +252,7 @@ def rng_attr_values_l(el_name, attr_name):
 
 
 def rng_xpath(xpath, namespaces=None):
-    if _crm_schema is None:
+    if _schema() is None:
         return []
     return _crm_schema.rng_xpath(xpath, namespaces=namespaces)
 
@@ -26,9 +26,11 @@ except ImportError:
     has_parallax = False
 
 
+from . import cache
 from . import config
 from . import handles
 from . import options
+from . import sshpool
 from . import userdir
 from . import utils
 from .msg import err_buf, common_debug
@@ -350,6 +352,7 @@ import crm_init
 crm_init.install_packages(%s)
 crm_script.exit_ok(True)
         ''' % (self._value))
+        cache.invalidate("agent-install")
 
     def service(self):
         values = []
@@ -1057,21 +1060,6 @@ def _script_dirs():
                   config.path.hawk_wizards]
 
 
-def _check_control_persist():
-    '''
-    Checks if ControlPersist is available. If so,
-    we'll use it to make things faster.
-    '''
-    cmd = 'ssh -o ControlPersist'.split()
-    if options.regression_tests:
-        print(".EXT", cmd)
-    cmd = subprocess.Popen(cmd,
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE)
-    (out, err) = cmd.communicate()
-    return "Bad configuration option" not in err
-
-
 def _parallax_call(printer, hosts, cmd, opts):
     "parallax.call with debug logging"
     printer.debug("parallax.call(%s, %s)" % (repr(hosts), cmd))
@@ -1527,18 +1515,11 @@ def _has_remote_actions(actions):
     return False
 
 
-def _set_controlpersist(opts):
-    # _has_controlpersist = _check_control_persist()
-    # if _has_controlpersist:
-    #    opts.ssh_options += ["ControlMaster=auto",
-    #                         "ControlPersist=30s",
-    #                         "ControlPath=/tmp/crm-ssh-%r@%h:%p"]
-    # unfortunately, due to bad interaction between parallax and ssh,
-    # ControlPersist is broken
-    # See: http://code.google.com/p/parallel-ssh/issues/detail?id=67
-    # Supposedly fixed in openssh 6.3, but isn't: This may be an
-    # issue in parallel-ssh, not openssh
-    pass
+def _set_controlpersist(opts, hosts):
+    # ControlPersist started by parallax itself hangs, see
+    # http://code.google.com/p/parallel-ssh/issues/detail?id=67
+    # sshpool starts the master connections separately
+    opts.ssh_options = opts.ssh_options + sshpool.ssh_options(hosts, opts.ssh_options)
 
 
 def _flatten_parameters(steps):
@@ -2057,11 +2038,12 @@ def run(script, params, printer):
     printer.print_header(script, params, hosts)
     local_node, hosts = _extract_localnode(hosts)
     opts = _make_options(params)
-    _set_controlpersist(opts)
 
     dry_run = params.get('dry_run', False)
 
     has_remote_actions = _has_remote_actions(actions)
+    if has_remote_actions and not dry_run:
+        _set_controlpersist(opts, hosts)
 
     try:
         runner = RunActions(printer, script, params, actions, local_node, hosts, opts, workdir)
@@ -0,0 +1,144 @@
+# See COPYING for license information.
+'''
+Shared SSH connections to the cluster nodes.
+
+Every parallel ssh (history live updates, cluster run, copy
+and diff, cluster scripts) connects through a master
+connection kept per node, so that a repeated command costs a
+round trip instead of a handshake. Masters exit on their own
+after _PERSIST idle seconds and are closed at program exit.
+
+The masters are started here and not by the first client:
+parallax waits for the output pipes of its ssh processes to
+close, and a master forked by ssh -o ControlPersist keeps
+them open. Clients use ControlMaster=no and so fall back to a
+connection of their own if the master is gone.
+
+A master is started with the ssh options of the caller (host
+key checking, authentication), and is shared only by callers
+with the same options.
+'''
+
+import os
+import time
+import hashlib
+import atexit
+import subprocess
+
+from . import utils
+from . import tmpfiles
+from .msg import common_debug
+
+_PERSIST = 300  # seconds a master stays up without clients
+_TIMEOUT = 10  # connect timeout for the masters
+
+# connection sharing is ours to set
+_CONTROL_OPTIONS = ('controlmaster', 'controlpath', 'controlpersist')
+
+_dir = None
+_masters = {}  # (host, port, user, options) -> (time of last use, is it up)
+
+
+def _options(options):
+    "The ssh -o options of the caller which apply to a master."
+    return tuple(o for o in options
+                 if o.split('=', 1)[0].strip().lower() not in _CONTROL_OPTIONS)
+
+
+def _key(host, options=()):
+    "host is either a name or a (name, port, user) tuple."
+    if isinstance(host, basestring):
+        host = (host, None, None)
+    return tuple(host) + (options,)
+
+
+def _control_path(options):
+    global _dir
+    if _dir is None:
+        _dir = tmpfiles.create_dir(prefix='crmsh_ssh_')
+        # registered after tmpfiles, so this runs first
+        atexit.register(close)
+    options_dir = os.path.join(_dir, hashlib.md5('\0'.join(options)).hexdigest()[:8])
+    if not os.path.isdir(options_dir):
+        os.mkdir(options_dir, 0700)
+    return os.path.join(options_dir, '%r@%h:%p')
+
+
+def _ssh(key, *args):
+    host, port, user, options = key
+    cmd = ['ssh', '-o', 'ControlPath=%s' % (_control_path(options))]
+    for opt in options:
+        cmd += ['-o', opt]
+    if port:
+        cmd += ['-p', str(port)]
+    if user:
+        cmd += ['-l', user]
+    return cmd + list(args) + [host]
+
+
+def _run(cmds):
+    "Run the commands in parallel, return their exit codes."
+    null = open(os.devnull, 'r+')
+    try:
+        procs = [subprocess.Popen(cmd, stdin=null, stdout=null, stderr=null)
+                 for cmd in cmds]
+        return [p.wait() for p in procs]
+    except OSError, msg:
+        common_debug("ssh: %s" % (msg))
+        return [-1] * len(cmds)
+    finally:
+        null.close()
+
+
+def connect(hosts, options=()):
+    '''
+    Make sure there is a master connection to every host,
+    made with the given ssh -o options. Masters used recently
+    are assumed to be still up. Hosts without a master are
+    retried after a while.
+    '''
+    now = time.time()
+    options = _options(options)
+    keys = [_key(h, options) for h in hosts]
+    stale = [k for k in keys if now - _masters.get(k, (0, False))[0] > _PERSIST / 2]
+    down = []
+    if stale:
+        rcs = _run([_ssh(k, '-O', 'check') for k in stale])
+        down = [k for k, rc in zip(stale, rcs) if rc != 0]
+    if down:
+        common_debug("ssh: starting master connections to %s" %
+                     ', '.join(k[0] for k in down))
+        opts = ['-M', '-N', '-f',
+                '-o', 'ControlPersist=%d' % (_PERSIST),
+                '-o', 'ConnectTimeout=%d' % (_TIMEOUT),
+                '-o', 'BatchMode=yes']
+        rcs = _run([_ssh(k, *opts) for k in down])
+        down = [k for k, rc in zip(down, rcs) if rc != 0]
+        for k in down:
+            common_debug("ssh: no master connection to %s" % (k[0]))
+            _masters[k] = (now, False)
+    for k in keys:
+        if k not in down and (k in stale or _masters[k][1]):
+            _masters[k] = (now, True)
+
+
+def ssh_options(hosts, options=()):
+    '''
+    The ssh -o options for connecting to the hosts through
+    their master connections, to be added to the options
+    of the caller. Empty if ssh is not available.
+    '''
+    if not hosts or not utils.is_program('ssh'):
+        return []
+    connect(hosts, options)
+    return ['ControlMaster=no', 'ControlPath=%s' % (_control_path(_options(options)))]
+
+
+def close():
+    "Stop all master connections."
+    up = [k for k, (_, is_up) in _masters.items() if is_up]
+    if up:
+        _run([_ssh(k, '-O', 'exit') for k in up])
+    _masters.clear()
+
+# vim:ts=4:sw=4:et:
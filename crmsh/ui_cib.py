@@ -7,7 +7,6 @@ import glob
 from . import command
 from . import xmlutil
 from . import utils
-from . import ui_cibstatus
 from . import constants
 from . import config
 from . import options
@@ -35,7 +34,7 @@ class CibShadow(command.UI):
             return False
         return True
 
-    @command.level(ui_cibstatus.CibStatusUI)
+    @command.level('ui_cibstatus.CibStatusUI')
     def do_cibstatus(self):
         pass
 
@@ -6,6 +6,7 @@ from . import command
 from . import utils
 from .msg import err_buf
 from . import scripts
+from . import sshpool
 from . import completers as compl
 
 
@@ -213,6 +214,7 @@ class Cluster(command.UI):
 
         hosts = utils.list_cluster_nodes()
         opts = parallax.Options()
+        opts.ssh_options = opts.ssh_options + sshpool.ssh_options(hosts, opts.ssh_options)
         for host, result in parallax.call(hosts, cmd, opts).iteritems():
             if isinstance(result, parallax.Error):
                 err_buf.error("[%s]: %s" % (host, result))
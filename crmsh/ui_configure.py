@@ -19,13 +19,8 @@ from .msg import common_err, common_info, common_warn
 from .msg import err_buf, syntax_err
 from . import rsctest
 from . import schema
-from . import ui_cib
-from . import ui_cibstatus
 from . import ui_ra
-from . import ui_template
-from . import ui_history
 from . import ui_utils
-from . import ui_assist
 from .crm_gv import gv_types
 
 
@@ -274,27 +269,27 @@ class CibConfig(command.UI):
         for k, v in sorted(constants.keywords.iteritems(), key=lambda v: v[0].lower()):
             print("%-16s %s" % (k, v))
 
-    @command.level(ui_ra.RA)
+    @command.level('ui_ra.RA')
     def do_ra(self):
         pass
 
-    @command.level(ui_cib.CibShadow)
+    @command.level('ui_cib.CibShadow')
     def do_cib(self):
         pass
 
-    @command.level(ui_cibstatus.CibStatusUI)
+    @command.level('ui_cibstatus.CibStatusUI')
     def do_cibstatus(self):
         pass
 
-    @command.level(ui_template.Template)
+    @command.level('ui_template.Template')
     def do_template(self):
         pass
 
-    @command.level(ui_history.History)
+    @command.level('ui_history.History')
     def do_history(self):
         pass
 
-    @command.level(ui_assist.Assist)
+    @command.level('ui_assist.Assist')
     def do_assist(self):
         pass
 
@@ -26,9 +26,17 @@ from . import cmd_status
 ptest_options = ["@v+", "nograph", "scores", "actions", "utilization"]
 
 
-@utils.memoize
+# the history source, timeframe and settings of the user live
+# in this object, so it is kept for the whole session and not
+# in a cache region
+_crm_report = None
+
+
 def crm_report():
-    return history.Report()
+    global _crm_report
+    if _crm_report is None:
+        _crm_report = history.Report()
+    return _crm_report
 
 
 class History(command.UI):
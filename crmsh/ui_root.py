@@ -17,22 +17,9 @@
 #   This is so that crmsh can be installed with minimal prereqs,
 #   and use cluster sublevel to install all requirements
 
+from . import cache
 from . import command
 from . import cmd_status
-from . import ui_cib
-from . import ui_cibstatus
-from . import ui_cluster
-from . import ui_configure
-from . import ui_corosync
-from . import ui_history
-from . import ui_maintenance
-from . import ui_node
-from . import ui_options
-from . import ui_ra
-from . import ui_report
-from . import ui_resource
-from . import ui_script
-from . import ui_site
 
 
 class Root(command.UI):
@@ -43,7 +30,7 @@ class Root(command.UI):
     # name is the user-visible name of this CLI level.
     name = 'root'
 
-    @command.level(ui_cib.CibShadow)
+    @command.level('ui_cib.CibShadow')
     @command.help('''manage shadow CIBs
 A shadow CIB is a regular cluster configuration which is kept in
 a file. The CRM and the CRM tools may manage a shadow CIB in the
@@ -53,14 +40,14 @@ A shadow CIB may be applied to the cluster in one step.
     def do_cib(self):
         pass
 
-    @command.level(ui_cibstatus.CibStatusUI)
+    @command.level('ui_cibstatus.CibStatusUI')
     @command.help('''CIB status management and editing
 Enter edit and manage the CIB status section level.
 ''')
     def do_cibstatus(self):
         pass
 
-    @command.level(ui_cluster.Cluster)
+    @command.level('ui_cluster.Cluster')
     @command.help('''Cluster setup and management
 Commands at this level enable low-level cluster configuration
 management with HA awareness.
@@ -68,7 +55,7 @@ management with HA awareness.
     def do_cluster(self):
         pass
 
-    @command.level(ui_configure.CibConfig)
+    @command.level('ui_configure.CibConfig')
     @command.help('''CRM cluster configuration
 The configuration level.
 
@@ -79,7 +66,7 @@ cluster.
     def do_configure(self):
         pass
 
-    @command.level(ui_corosync.Corosync)
+    @command.level('ui_corosync.Corosync')
     @command.help('''Corosync configuration management
 Corosync is the underlying messaging layer for most HA clusters.
 This level provides commands for editing and managing the corosync
@@ -88,7 +75,7 @@ configuration.
     def do_corosync(self):
         pass
 
-    @command.level(ui_history.History)
+    @command.level('ui_history.History')
     @command.help('''CRM cluster history
 The history level.
 
@@ -97,7 +84,7 @@ Examine Pacemaker's history: node and resource events, logs.
     def do_history(self):
         pass
 
-    @command.level(ui_maintenance.Maintenance)
+    @command.level('ui_maintenance.Maintenance')
     @command.help('''maintenance
 Commands that should only be executed while in
 maintenance mode.
@@ -105,7 +92,7 @@ maintenance mode.
     def do_maintenance(self):
         pass
 
-    @command.level(ui_node.NodeMgmt)
+    @command.level('ui_node.NodeMgmt')
     @command.help('''nodes management
 A few node related tasks such as node standby are implemented
 here.
@@ -113,7 +100,7 @@ here.
     def do_node(self):
         pass
 
-    @command.level(ui_options.CliOptions)
+    @command.level('ui_options.CliOptions')
     @command.help('''user preferences
 Several user preferences are available. Note that it is possible
 to save the preferences to a startup file.
@@ -121,7 +108,7 @@ to save the preferences to a startup file.
     def do_options(self):
         pass
 
-    @command.level(ui_ra.RA)
+    @command.level('ui_ra.RA')
     @command.help('''resource agents information center
 This level contains commands which show various information about
 the installed resource agents. It is available both at the top
@@ -136,10 +123,11 @@ configuration files, system information, etc) relevant to
 crmsh over the given period of time.
 ''')
     def do_report(self, context, *args):
+        from . import ui_report
         rc = ui_report.create_report(context, args)
         return rc == 0
 
-    @command.level(ui_resource.RscMgmt)
+    @command.level('ui_resource.RscMgmt')
     @command.help('''resources management
 Everything related to resources management is available at this
 level. Most commands are implemented using the crm_resource(8)
@@ -148,7 +136,7 @@ program.
     def do_resource(self):
         pass
 
-    @command.level(ui_script.Script)
+    @command.level('ui_script.Script')
     @command.help('''Cluster scripts
 Cluster scripts can perform cluster-wide configuration,
 validation and management. See the `list` command for
@@ -157,7 +145,7 @@ an overview of available scripts.
     def do_script(self):
         pass
 
-    @command.level(ui_site.Site)
+    @command.level('ui_site.Site')
     @command.help('''Geo-cluster support
 The site level.
 
@@ -193,8 +181,25 @@ verify [scores]
     def do_verify(self, context, *args):
         return cmd_status.cmd_verify(args)
 
-
-# this will initialize _children for all levels under the root
+    @command.name('_cache')
+    @command.skill_level('administrator')
+    def do_cache(self, context, cmd=None):
+        "usage: _cache [clear]"
+        if cmd == "clear":
+            cache.clear()
+            return True
+        if cmd is not None:
+            context.fatal_error("Expected clear")
+        print "%-32s %6s %6s %6s %8s %8s %8s" % \
+            ("region", "size", "max", "ttl", "hits", "misses", "evicted")
+        for name, size, maxsize, ttl, hits, misses, evictions in cache.stats():
+            print "%-32s %6d %6d %6s %8d %8d %8d" % \
+                (name, size, maxsize, ttl is None and "-" or ttl, hits, misses, evictions)
+        return True
+
+
+# this will initialize _children for the root; the levels
+# under it are initialized when they are first used
 Root.init_ui()
 
 
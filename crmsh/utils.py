@@ -14,6 +14,7 @@ import bz2
 import fnmatch
 import gc
 from contextlib import contextmanager
+from . import cache
 from . import config
 from . import userdir
 from . import constants
@@ -22,18 +23,6 @@ from . import term
 from .msg import common_warn, common_info, common_debug, common_err, err_buf
 
 
-def memoize(function):
-    "Decorator to invoke a function once only for any argument"
-    memoized = {}
-    def inner(*args):
-        if args in memoized:
-            return memoized[args]
-        r = function(*args)
-        memoized[args] = r
-        return r
-    return inner
-
-
 @contextmanager
 def nogc():
     gc.disable()
@@ -43,11 +32,21 @@ def nogc():
         gc.enable()
 
 
+@contextmanager
+def timed(what):
+    "Log how long the block took (in debug mode)."
+    t = time.time()
+    try:
+        yield
+    finally:
+        common_debug("%s: %.3fs" % (what, time.time() - t))
+
+
 getuser = userdir.getuser
 gethomedir = userdir.gethomedir
 
 
-@memoize
+@cache.memoize
 def this_node():
     'returns name of this node (hostname)'
     return os.uname()[1]
@@ -314,6 +313,34 @@ def str2tmp(s, suffix=".pcmk"):
     return tmp
 
 
+@contextmanager
+def atomic_write(fname, mode="w", prefix=".tmp"):
+    '''
+    Write to a temporary file next to fname, which replaces
+    fname once the with block is done, so that readers never
+    see a partial file. The directory is created if needed.
+    On errors the temporary file is removed.
+    '''
+    d = os.path.dirname(fname)
+    if not os.path.isdir(d):
+        try:
+            os.makedirs(d)
+        except OSError:
+            if not os.path.isdir(d):
+                raise
+    fd, tmp = mkstemp(dir=d, prefix=prefix)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.rename(tmp, fname)
+    except:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
 def str2file(s, fname):
     '''
     Write a string to a file.
@@ -851,7 +878,7 @@ def print_stacktrace():
     traceback.print_stack(sf)
 
 
-@memoize
+@cache.memoize
 def cluster_stack():
     if is_process("heartbeat:.[m]aster"):
         return "heartbeat"
@@ -1208,15 +1235,73 @@ def load_graphviz_file(ini_f):
     return True, _graph_d
 
 
-def get_pcmk_version(dflt):
-    version = dflt
+# Pacemaker capabilities found by running its programs are
+# kept in a file and reused by later crm invocations, for as
+# long as the programs stay the same.
+_probe_programs = ('crmd', 'cibadmin')
+_probes = None
+
+
+def probe_cache_file():
+    return os.path.join(config.path.cache, "probes-%s" % getuser())
+
+
+def _probe_key():
+    "Path and mtime of each of the probed programs"
+    key = []
+    for prog in _probe_programs:
+        path = is_program(prog)
+        try:
+            key.append([prog, path, os.stat(path).st_mtime if path else None])
+        except OSError:
+            key.append([prog, path, None])
+    return key
+
+
+def _load_probes():
+    global _probes
+    import json
+    key = _probe_key()
+    _probes = {"key": key, "probes": {}}
+    try:
+        d = json.load(open(probe_cache_file()))
+        if d["key"] == key:
+            _probes = d
+    except (IOError, ValueError, KeyError, TypeError):
+        pass
 
-    crmd = is_program('crmd')
-    if crmd:
-        cmd = crmd
-    else:
-        return version
 
+def _save_probes():
+    import json
+    fname = probe_cache_file()
+    try:
+        with atomic_write(fname, prefix=".probes") as f:
+            json.dump(_probes, f)
+    except (IOError, OSError), msg:
+        common_debug("cannot save %s: %s" % (fname, msg))
+
+
+def probed(name, probe):
+    '''
+    The result of probe(), saved under name. A probe which
+    returns None is run again next time.
+    '''
+    if _probes is None:
+        _load_probes()
+    if name in _probes["probes"]:
+        return _probes["probes"][name]
+    value = probe()
+    if value is not None:
+        _probes["probes"][name] = value
+        _save_probes()
+    return value
+
+
+def _probe_pcmk_version():
+    cmd = is_program('crmd')
+    if not cmd:
+        return None
+    version = None
     try:
         rc, s, err = get_stdout_stderr("%s version" % (cmd))
         if rc != 0:
@@ -1234,6 +1319,10 @@ def get_pcmk_version(dflt):
     return version
 
 
+def get_pcmk_version(dflt):
+    return probed("pcmk_version", _probe_pcmk_version) or dflt
+
+
 def get_cib_property(cib_f, attr, dflt):
     """A poor man's get attribute procedure.
     We don't want heavy parsing, this needs to be relatively
@@ -1310,24 +1399,29 @@ def is_pcmk_118(cib_f=None):
     return is_min_pcmk_ver("1.1.8", cib_f=cib_f)
 
 
-@memoize
-def cibadmin_features():
-    '''
-    # usage example:
-    if 'corosync-plugin' in cibadmin_features()
-    '''
+def _probe_cibadmin_features():
     rc, outp = get_stdout(['cibadmin', '-!'], shell=False)
     if rc == 0:
         m = re.match(r'Pacemaker\s(\S+)\s\(Build: ([^\)]+)\):\s(.*)', outp.strip())
         if m and len(m.groups()) > 2:
             return m.group(3).split()
-    return []
+    return None
+
+
+@cache.memoize
+def cibadmin_features():
+    '''
+    # usage example:
+    if 'corosync-plugin' in cibadmin_features()
+    '''
+    return probed("cibadmin_features", _probe_cibadmin_features) or []
 
 
-@memoize
+@cache.memoize
 def cibadmin_can_patch():
-    # cibadmin -P doesn't handle comments in <1.1.11 (unless patched)
-    return is_min_pcmk_ver("1.1.11")
+    # cibadmin -P doesn't handle comments in <1.1.11 (unless patched),
+    # and applies the format 2 patches made by cib_patch since 1.1.12
+    return is_min_pcmk_ver("1.1.12")
 
 
 # quote function from python module shlex.py in python 3.3
@@ -1509,64 +1603,100 @@ def remote_diff_slurp(nodes, filename):
         raise ValueError("Parallax is required to diff")
     from . import tmpfiles
 
+    from . import sshpool
+
     tmpdir = tmpfiles.create_dir()
     opts = parallax.Options()
     opts.localdir = tmpdir
+    opts.ssh_options = opts.ssh_options + sshpool.ssh_options(nodes, opts.ssh_options)
     dst = os.path.basename(filename)
     return parallax.slurp(nodes, filename, dst, opts).items()
 
 
-def remote_diff_this(local_path, nodes, this_node):
+def remote_digests(nodes, filename, strict=False):
+    """
+    SHA1 digest of the file on each node, computed there in
+    one parallel call. Returns {host: digest}; nodes where the
+    digest couldn't be taken are left out, or with strict, a
+    ValueError with the error of the node is raised.
+    """
     try:
         import parallax
     except ImportError:
         raise ValueError("Parallax is required to diff")
+    from . import sshpool
+
+    opts = parallax.Options()
+    opts.ssh_options = opts.ssh_options + sshpool.ssh_options(nodes, opts.ssh_options)
+    digests = {}
+    for host, result in parallax.call(nodes, "sha1sum %s" % (quote(filename)), opts).iteritems():
+        if isinstance(result, parallax.Error):
+            err = str(result)
+        else:
+            rc, outp, err = result
+            if rc == 0 and outp.split():
+                digests[host] = outp.split()[0]
+                continue
+            err = "sha1sum failed (rc=%d): %s" % (rc, err.strip())
+        if strict:
+            raise ValueError("Failed on %s: %s" % (host, err))
+        common_debug("sha1sum on %s: %s" % (host, err))
+    return digests
+
+
+def file_digest(path):
+    import hashlib
+    return hashlib.sha1(open(path).read()).hexdigest()
 
-    by_host = remote_diff_slurp(nodes, local_path)
+
+def _slurp_by_host(nodes, filename):
+    import parallax
+    by_host = remote_diff_slurp(nodes, filename)
     for host, result in by_host:
         if isinstance(result, parallax.Error):
             raise ValueError("Failed on %s: %s" % (host, str(result)))
-        _, _, _, path = result
+    return dict((host, result[3]) for host, result in by_host)
+
+
+def remote_diff_this(local_path, nodes, this_node):
+    """
+    Diff the local file against the copies on the nodes. Only
+    the copies that differ from the local one are fetched.
+    """
+    local_digest = file_digest(local_path)
+    digests = remote_digests(nodes, local_path)
+    differ = [n for n in nodes if digests.get(n) != local_digest]
+    if not differ:
+        return
+    paths = _slurp_by_host(differ, local_path)
+    for host in differ:
         _, s = get_stdout("diff -U 0 -d -b --label %s --label %s %s %s" %
-                          (host, this_node, path, local_path))
+                          (host, this_node, paths[host], local_path))
         page_string(s)
 
 
 def remote_diff(local_path, nodes):
-    try:
-        import parallax
-    except ImportError:
-        raise ValueError("parallax is required to diff")
-
-    by_host = remote_diff_slurp(nodes, local_path)
-    for host, result in by_host:
-        if isinstance(result, parallax.Error):
-            raise ValueError("Failed on %s: %s" % (host, str(result)))
-    h1, r1 = by_host[0]
-    h2, r2 = by_host[1]
+    """
+    Diff the file on two nodes. Nothing is fetched if the
+    copies are the same.
+    """
+    digests = remote_digests(nodes, local_path)
+    if len(digests) == 2 and len(set(digests.values())) == 1:
+        return
+    paths = _slurp_by_host(nodes, local_path)
+    h1, h2 = nodes[0], nodes[1]
     _, s = get_stdout("diff -U 0 -d -b --label %s --label %s %s %s" %
-                      (h1, h2, r1[3], r2[3]))
+                      (h1, h2, paths[h1], paths[h2]))
     page_string(s)
 
 
 def remote_checksum(local_path, nodes, this_node):
-    try:
-        import parallax
-    except ImportError:
-        raise ValueError("Parallax is required to diff")
-    import hashlib
-
-    by_host = remote_diff_slurp(nodes, local_path)
-    for host, result in by_host:
-        if isinstance(result, parallax.Error):
-            raise ValueError(str(result))
-
+    digests = remote_digests(nodes, local_path, strict=True)
     print "%-16s  SHA1 checksum of %s" % ('Host', local_path)
     if this_node not in nodes:
-        print "%-16s: %s" % (this_node, hashlib.sha1(open(local_path).read()).hexdigest())
-    for host, result in by_host:
-        _, _, _, path = result
-        print "%-16s: %s" % (host, hashlib.sha1(open(path).read()).hexdigest())
+        print "%-16s: %s" % (this_node, file_digest(local_path))
+    for host in nodes:
+        print "%-16s: %s" % (host, digests[host])
 
 
 def cluster_copy_file(local_path, nodes=None):
@@ -1577,12 +1707,14 @@ def cluster_copy_file(local_path, nodes=None):
         import parallax
     except ImportError:
         raise ValueError("parallax is required to copy cluster files")
+    from . import sshpool
     if not nodes:
         nodes = list_cluster_nodes()
         nodes.remove(this_node())
     opts = parallax.Options()
     opts.timeout = 60
-    opts.ssh_options += ['ControlPersist=no']
+    opts.ssh_options = opts.ssh_options + ['ControlPersist=no']
+    opts.ssh_options = opts.ssh_options + sshpool.ssh_options(nodes, opts.ssh_options)
     ok = True
     for host, result in parallax.copy(nodes,
                                       local_path,
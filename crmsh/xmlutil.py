@@ -98,6 +98,21 @@ def cibdump2tmp():
     return None
 
 
+def cib_version():
+    '''
+    The (admin_epoch, epoch, num_updates) of the CIB, read
+    without the contents. None if cibadmin can't do that.
+    '''
+    rc, outp, _ = sudocall("%s --xpath /cib --no-children" % cib_dump)
+    if rc != 0 or not outp:
+        return None
+    try:
+        e = etree.fromstring(outp)
+    except etree.Error:
+        return None
+    return tuple(e.get(attr) for attr in ("admin_epoch", "epoch", "num_updates"))
+
+
 def cibtext2elem(cibtext):
     """
     Convert a text format CIB to
@@ -177,18 +192,27 @@ def get_top_cib_nodes(node, nodes_l):
 class RscState(object):
     '''
     Get the resource status and some other relevant bits.
-    In particular, this class should allow for a bit of caching
-    of cibadmin -Q -o resources output in case we need to check
-    more than one resource in a row.
+    The configuration (cibadmin -Q -o configuration) and the
+    resource status (crm_mon --as-xml) are read once, on first
+    use, so that checking many resources in a row is cheap.
+    Call refresh() to read them again.
     '''
 
     rsc_status = "crm_resource -W -r '%s'"
+    status_snapshot = "crm_mon -1 -r --as-xml"
+    status_tags = ("resource", "group", "clone", "bundle")
 
     def __init__(self):
+        self.refresh()
+
+    def refresh(self):
+        "Drop the snapshots, they are read again on next use."
         self.current_cib = None
         self.rsc_elem = None
         self.prop_elem = None
         self.rsc_dflt_elem = None
+        self.rsc_nodes = None
+        self.running = None
 
     def _init_cib(self):
         cib = cibdump2elem("configuration")
@@ -197,6 +221,39 @@ class RscState(object):
         self.prop_elem = get_first_conf_elem(cib, "crm_config/cluster_property_set")
         self.rsc_dflt_elem = get_first_conf_elem(cib, "rsc_defaults/meta_attributes")
 
+    def _init_status(self):
+        '''
+        Index the nodes where each resource runs by resource id.
+        Clone instances (id:N) count for the primitive and
+        children for their group and clone. If there is no
+        status, self.running is False.
+        '''
+        self.running = False
+        rc, outp = get_stdout(self.status_snapshot, stderr_on=False)
+        if rc != 0:
+            return
+        try:
+            resources = etree.fromstring(outp).find("resources")
+        except etree.Error:
+            return
+        if resources is None:
+            return
+        self.running = {}
+
+        def index(e):
+            nodes = set()
+            if e.tag == "resource":
+                nodes.update(n.get("name") for n in e.iterchildren("node"))
+            for c in e.iterchildren():
+                if c.tag in self.status_tags or c.tag == "replica":
+                    nodes |= index(c)
+            if e.tag in self.status_tags and e.get("id"):
+                for ident in set((e.get("id"), e.get("id").split(':')[0])):
+                    self.running.setdefault(ident, set()).update(nodes)
+            return nodes
+        for e in resources.iterchildren():
+            index(e)
+
     def rsc2node(self, ident):
         '''
         Get a resource XML element given the id.
@@ -208,12 +265,12 @@ class RscState(object):
             self._init_cib()
         if self.rsc_elem is None:
             return None
-        # does this need to be optimized?
-        expr = './/*[@id="%s"]' % ident
-        try:
-            return self.rsc_elem.xpath(expr)[0]
-        except (IndexError, AttributeError):
-            return None
+        if self.rsc_nodes is None:
+            self.rsc_nodes = {}
+            for e in self.rsc_elem.iter():
+                if is_element(e) and e.get("id") is not None:
+                    self.rsc_nodes.setdefault(e.get("id"), e)
+        return self.rsc_nodes.get(ident)
 
     def is_ms(self, ident):
         '''
@@ -267,6 +324,17 @@ class RscState(object):
             return is_xs_boolean_true(attr)
         return True
 
+    def running_on(self, ident):
+        '''
+        Sorted list of nodes where this resource (or any of its
+        instances or children) runs. None if there is no status.
+        '''
+        if self.running is None:
+            self._init_status()
+        if self.running is False:
+            return None
+        return sorted(self.running.get(ident, ()))
+
     def is_running(self, ident):
         '''
         Is this resource running?
@@ -274,6 +342,9 @@ class RscState(object):
         if not is_live_cib():
             return False
         test_id = self.rsc_clone(ident) or ident
+        nodes = self.running_on(test_id)
+        if nodes is not None:
+            return len(nodes) > 0
         rc, outp = get_stdout(self.rsc_status % test_id, stderr_on=False)
         return outp.find("running") > 0 and outp.find("NOT") == -1
 
@@ -335,8 +406,9 @@ def mk_rsc_type(n):
     return ''.join((s1, s2, ra_type))
 
 
-def listnodes():
-    cib = cibdump2elem()
+def listnodes(cib=None):
+    if cib is None:
+        cib = cibdump2elem()
     if cib is None:
         return []
     local_nodes = cib.xpath('/cib/configuration/nodes/node/@uname')
@@ -502,6 +574,10 @@ def is_comment(e):
     return e.tag == etree.Comment
 
 
+def is_element(e):
+    return isinstance(e.tag, basestring)
+
+
 def is_status_node(e):
     return e.tag == "status"
 
@@ -611,6 +687,24 @@ def is_related(rsc_id, node):
     return False
 
 
+def related_ids(node):
+    """
+    The set of resource ids which node has a direct
+    relation to, see is_related().
+    """
+    if is_constraint(node):
+        ids = set(node.get(attr) for attr in constants.constraint_rsc_refs)
+        ids.update(node.xpath("resource_set/resource_ref/@id"))
+    elif node.tag == 'tag':
+        ids = set(node.xpath('.//obj_ref/@id'))
+    elif is_container(node):
+        ids = set(node.xpath('.//primitive/@id|.//group/@id|.//clone/@id|.//master/@id'))
+    else:
+        return set()
+    ids.discard(None)
+    return ids
+
+
 def sort_container_children(e_list):
     '''
     Make sure that attributes's nodes are first, followed by the
@@ -1266,6 +1360,146 @@ def xml_equals(n, m, show=False):
     return rc
 
 
+#
+# Pacemaker patches (format 2)
+#
+def xml_path(e):
+    '''
+    Path of element e in the form used by Pacemaker patches,
+    for instance /cib/configuration/resources/primitive[@id='p1'].
+    '''
+    l = []
+    while e is not None:
+        if e.get("id") is not None:
+            l.append("%s[@id='%s']" % (e.tag, e.get("id")))
+        else:
+            l.append(e.tag)
+        e = e.getparent()
+    return "/" + "/".join(reversed(l))
+
+
+def _patch_keys(e):
+    '''
+    List of (key, child) for children of e. Elements are keyed
+    by tag and id, comments by their text and occurrence.
+    None if two elements have the same key, then there is no
+    path to tell them apart.
+    '''
+    l, seen = [], set()
+    for c in e:
+        if is_element(c):
+            k = (c.tag, c.get("id"))
+            if k in seen:
+                return None
+        else:
+            k = (c.tag, c.text, 0)
+            while k in seen:
+                k = (c.tag, c.text, k[2] + 1)
+        seen.add(k)
+        l.append((k, c))
+    return l
+
+
+def _patch_change(op, e, position=None):
+    c = etree.Element("change")
+    c.set("operation", op)
+    c.set("path", xml_path(e))
+    if position is not None:
+        c.set("position", str(position))
+    return c
+
+
+def _patch_modify(old, new):
+    c = _patch_change("modify", new)
+    changes = etree.SubElement(c, "change-list")
+    for name, value in new.items():
+        if old.get(name) != value:
+            etree.SubElement(changes, "change-attr", name=name, operation="set", value=value)
+    for name in old.keys():
+        if new.get(name) is None:
+            etree.SubElement(changes, "change-attr", name=name, operation="unset")
+    result = etree.SubElement(etree.SubElement(c, "change-result"), new.tag)
+    for name, value in new.items():
+        result.set(name, value)
+    return c
+
+
+def _patch_diff(old, new, unchanged):
+    '''
+    Changes turning old into new, as two lists: deletes and the
+    rest. Creates and moves are in the order of position, so
+    the patch applies the same both in order and sorted by
+    position. None if the children of old/new cannot be told
+    apart by path or comments would have to change, then the
+    caller should replace the element as a whole.
+    '''
+    if new in unchanged:
+        return [], []
+    old_l, new_l = _patch_keys(old), _patch_keys(new)
+    if old_l is None or new_l is None:
+        return None
+    deletes, changes, nested = [], [], []
+    if old.attrib != new.attrib:
+        changes.append(_patch_modify(old, new))
+    old_d = dict(old_l)
+    kept = set()
+    for k, c in new_l:
+        o = old_d.get(k)
+        if o is None:
+            continue
+        if not is_element(c):
+            kept.add(k)
+            continue
+        sub = _patch_diff(o, c, unchanged)
+        if sub is not None:  # else delete and create it
+            kept.add(k)
+            deletes += sub[0]
+            nested += sub[1]
+    for k, o in old_l:
+        if k not in kept:
+            if not is_element(o):
+                return None
+            deletes.append(_patch_change("delete", o))
+    cur = [k for k, o in old_l if k in kept]
+    for i, (k, c) in enumerate(new_l):
+        if i < len(cur) and cur[i] == k:
+            continue
+        if not is_element(c):
+            return None
+        if k in kept:
+            cur.remove(k)
+            changes.append(_patch_change("move", c, position=i))
+        else:
+            create = _patch_change("create", new, position=i)
+            create.append(copy.deepcopy(c))
+            changes.append(create)
+        cur.insert(i, k)
+    return deletes, changes + nested
+
+
+def cib_patch(old, new, unchanged=()):
+    '''
+    Create a Pacemaker patch (format 2, without versions) which
+    turns CIB old into CIB new. Elements in unchanged are known
+    to be equal in both and are not compared, which makes the
+    cost proportional to the size of the change.
+    Returns None if the difference cannot be expressed as a
+    patch.
+    '''
+    if old.tag != new.tag:
+        return None
+    changes = _patch_diff(old, new, unchanged)
+    if changes is None:
+        return None
+    diff = etree.Element("diff", format="2")
+    version = etree.SubElement(diff, "version")
+    etree.SubElement(version, "source")
+    etree.SubElement(version, "target")
+    for c in changes[0] + changes[1]:
+        diff.append(c)
+    return diff
+
+
 def merge_attributes(dnode, snode, tag):
     rc = False
     add_children = []
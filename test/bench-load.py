@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# Benchmark configure load.
+#
+# Generates a configuration with the given number of
+# primitives (plus groups and constraints, one for every ten
+# primitives) and reports how long it takes to load it into
+# an empty CIB and then to replace it with a modified copy.
+# Run with -d to see the time spent in each stage.
+#
+# usage: bench-load.py [-d] [count...]
+#   count: number of primitives (default 1000 5000 20000)
+
+import os
+import sys
+import time
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, '..'))
+
+from crmsh import cibconfig
+from crmsh import config
+
+_CIB = '''<cib validate-with="pacemaker-1.2" epoch="0" num_updates="0" admin_epoch="0">
+<configuration><crm_config/><nodes/><resources/><constraints/></configuration></cib>'''
+
+
+def configuration(n):
+    l = []
+    for i in range(n):
+        l.append("primitive p%d ocf:heartbeat:Dummy op monitor interval=10s meta target-role=Stopped" % i)
+    for i in range(0, n, 10):
+        l.append("group g%d %s" % (i, " ".join("p%d" % j for j in range(i, i + 5))))
+        l.append("location l%d g%d 100: node1" % (i, i))
+        l.append("order o%d Mandatory: p%d p%d" % (i, i + 5, i + 6))
+    return "\n".join(l)
+
+
+def bench(n):
+    cibconfig.cib_factory.initialize(cib=_CIB)
+    text = configuration(n)
+    t = time.time()
+    if not cibconfig.mkset_obj().save(text, remove=False, method='update'):
+        sys.exit(1)
+    t_load = time.time() - t
+    t = time.time()
+    if not cibconfig.mkset_obj().save(text.replace("interval=10s", "interval=20s")):
+        sys.exit(1)
+    return len(cibconfig.cib_factory.cib_objects), t_load, time.time() - t
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == '-d':
+        config.core.debug = True
+        args = args[1:]
+    config.path.crm_dtd_dir = os.path.join(_here, 'unittests', 'schemas')
+    for n in [int(a) for a in args] or [1000, 5000, 20000]:
+        nobjs, t_load, t_replace = bench(n)
+        print("%d objects: load %.2fs (%.0f objects/s), replace %.2fs" %
+              (nobjs, t_load, nobjs / t_load, t_replace))
+
+main()
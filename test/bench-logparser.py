@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+# Benchmark the history explorer log scanner.
+#
+# Unpacks test/history-test.tar.bz2 and reports how many
+# log lines per second LogParser.scan() processes, with and
+# without the keyword prefilter for the event regexes.
+#
+# usage: bench-logparser.py [scale [rounds]]
+#   scale: repeat the logs this many times (default 50)
+#   rounds: best of this many scans (default 3)
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from crmsh import logparser
+from crmsh import logtime
+
+_REPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history-test.tar.bz2')
+_NODES = ('xen-d', 'xen-e')
+
+
+def unpack(tmpdir, scale):
+    if os.system("tar -C '%s' -xjf '%s'" % (tmpdir, _REPORT)) != 0:
+        sys.exit(1)
+    loc = os.path.join(tmpdir, 'history-test')
+    nlines = 0
+    for node in _NODES:
+        log = os.path.join(loc, node, 'ha-log.txt')
+        data = open(log).read()
+        open(log, 'w').write(data * scale)
+        nlines += data.count('\n') * scale
+    return loc, nlines
+
+
+def bench(loc, rounds):
+    logtime.set_year(os.stat(os.path.join(loc, 'description.txt')).st_mtime)
+    cib = logparser.CibInfo(loc)
+    logs = [os.path.join(loc, node, 'ha-log.txt') for node in _NODES]
+    best = None
+    for _ in range(rounds):
+        lp = logparser.LogParser(loc, cib, logs, 1)
+        t = time.time()
+        lp.scan(mode='force')
+        t = time.time() - t
+        best = t if best is None else min(best, t)
+    return best, lp.count()
+
+
+def main():
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    tmpdir = tempfile.mkdtemp()
+    try:
+        loc, nlines = unpack(tmpdir, scale)
+        print("%d log lines, best of %d scans" % (nlines, rounds))
+        keyword_min_len = logparser._KEYWORD_MIN_LEN
+        for name, minlen in (("no prefilter", sys.maxint), ("prefilter", keyword_min_len)):
+            logparser._KEYWORD_MIN_LEN = minlen
+            t, (ntrans, nevents) = bench(loc, rounds)
+            print("%-14s %8.3fs %10.0f lines/s (%d transitions, %d events)" %
+                  (name, t, nlines / t, ntrans, nevents))
+        logparser._KEYWORD_MIN_LEN = keyword_min_len
+    finally:
+        shutil.rmtree(tmpdir)
+
+main()
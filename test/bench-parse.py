@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# Benchmark the CLI parser.
+#
+# Collects the configure statements from test/testcases and
+# reports how many statements per second parse.parse()
+# processes.
+#
+# usage: bench-parse.py [scale [rounds]]
+#   scale: parse the statements this many times (default 20)
+#   rounds: best of this many runs (default 3)
+
+import os
+import sys
+import time
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, '..'))
+
+from crmsh import cibconfig
+from crmsh import config
+from crmsh import msg
+from crmsh import parse
+
+_TESTCASES = os.path.join(_here, 'testcases')
+_CIB = '''<cib validate-with="pacemaker-1.2" epoch="0" num_updates="0" admin_epoch="0">
+<configuration><crm_config/><nodes/><resources/><constraints/></configuration></cib>'''
+
+
+def statements():
+    '''
+    All lines of the test cases which start with a keyword
+    the parser knows, continuation lines joined.
+    '''
+    l = []
+    for name in sorted(os.listdir(_TESTCASES)):
+        if '.' in name:
+            continue
+        f = os.path.join(_TESTCASES, name)
+        if not os.path.isfile(f):
+            continue
+        stmt = ''
+        for line in open(f):
+            line = line.rstrip('\n')
+            if line.endswith('\\'):
+                stmt += line[:-1]
+                continue
+            stmt += line
+            if stmt.split() and stmt.split()[0] in parse._parsers:
+                l.append(stmt)
+            stmt = ''
+    return l
+
+
+def bench(stmts, scale, rounds):
+    best = None
+    for _ in range(rounds):
+        t = time.time()
+        for _ in range(scale):
+            for s in stmts:
+                parse.parse(s)
+        t = time.time() - t
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main():
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    msg.ERR_STREAM = open(os.devnull, 'w')  # parse errors are expected
+    config.path.crm_dtd_dir = os.path.join(_here, 'unittests', 'schemas')
+    cibconfig.cib_factory.initialize(cib=_CIB)
+    stmts = statements()
+    n = len(stmts) * scale
+    t = bench(stmts, scale, rounds)
+    print("%d statements, best of %d runs: %.3fs, %.0f statements/s" % (n, rounds, t, n / t))
+
+main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# Benchmark crm startup.
+#
+# For each command line, starts a fresh interpreter which
+# imports crmsh.main (as the crm script does) and looks up the
+# command in the UI hierarchy, loading the levels on the way,
+# without running it. Reports the median wall clock time over
+# the runs, the number of crmsh modules loaded and which of the
+# heavier libraries got imported.
+#
+# usage: bench-startup.py [-n runs] [command...]
+#   command: a crm command line (default: a few single-shot commands)
+
+import os
+import sys
+import time
+import subprocess
+
+_here = os.path.dirname(os.path.abspath(__file__))
+
+_COMMANDS = ["status", "node standby", "resource start", "configure show", "history info"]
+
+_CHILD = '''
+import sys
+sys.path.insert(0, %(path)r)
+from crmsh import main
+from crmsh import ui_root
+level = ui_root.Root
+for token in %(tokens)r:
+    info = level.children().get(token)
+    if info is None or info.type != 'level':
+        break
+    level = info.level
+mods = [m for m in sys.modules if m.startswith('crmsh.') and sys.modules[m]]
+libs = [m for m in ('lxml.etree', 'yaml', 'parallax') if m in sys.modules]
+print len(mods), ','.join(libs) or '-'
+'''
+
+
+def bench(cmd, runs):
+    src = _CHILD % {'path': os.path.join(_here, '..'), 'tokens': cmd.split()}
+    times = []
+    for _ in range(runs):
+        t = time.time()
+        out = subprocess.Popen([sys.executable, '-c', src],
+                               stdout=subprocess.PIPE).communicate()[0]
+        times.append(time.time() - t)
+    nmods, libs = out.split()
+    return sorted(times)[len(times) // 2], int(nmods), libs
+
+
+def main():
+    args = sys.argv[1:]
+    runs = 10
+    if args[:1] == ['-n']:
+        runs = int(args[1])
+        args = args[2:]
+    for cmd in args or _COMMANDS:
+        t, nmods, libs = bench(cmd, runs)
+        print("%-16s %6.0f ms %4d modules  %s" % (cmd, t * 1000, nmods, libs))
+
+main()
@@ -1,5 +1,8 @@
 import os
 import sys
+import atexit
+import shutil
+import tempfile
 
 try:
     import modules
@@ -19,6 +22,18 @@ config.path.crm_dtd_dir = os.path.join(_here, "schemas")
 
 os.environ["CIB_file"] = "test"
 
+# the tests commit by patch, which needs Pacemaker 1.1.12
+from crmsh import constants
+constants.pcmk_version = "1.1.12"
+
+# keep the schema tables and probes of the tests out of the user's cache
+from crmsh import pacemaker
+from crmsh import utils
+_cache_dir = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, _cache_dir, True)
+pacemaker.schema_cache_dir = lambda: os.path.join(_cache_dir, "rng")
+utils.probe_cache_file = lambda: os.path.join(_cache_dir, "probes")
+
 
 # install a basic CIB
 from crmsh import cibconfig
@@ -0,0 +1,52 @@
+# See COPYING for license information.
+#
+# unit tests for cache.py
+
+from nose.tools import eq_
+from crmsh import cache
+
+
+def test_lru():
+    r = cache.region("test-lru", maxsize=2)
+    r.store("a", 1)
+    r.store("b", 2)
+    assert r.is_cached("a")
+    r.store("c", 3)
+    assert r.is_cached("a")
+    assert not r.is_cached("b")
+    assert r.is_cached("c")
+    eq_(r.evictions, 1)
+    eq_((r.hits, r.misses), (3, 1))
+
+
+def test_ttl():
+    r = cache.region("test-ttl", ttl=60)
+    r.store("a", 1)
+    assert r.is_cached("a")
+    eq_(r.retrieve("a"), 1)
+    r.ttl = -1
+    r.store("a", 1)
+    assert not r.is_cached("a")
+
+
+def test_invalidate():
+    r = cache.region("test-invalidate", invalidate_on=("test-event",))
+    r.store("a", 1)
+    cache.invalidate("other-event")
+    assert r.is_cached("a")
+    cache.invalidate("test-event")
+    assert not r.is_cached("a")
+
+
+def test_memoize():
+    calls = []
+
+    @cache.memoize(maxsize=1)
+    def f(x):
+        calls.append(x)
+        return x * 2
+    eq_(f(1), 2)
+    eq_(f(1), 2)
+    eq_(f(2), 4)
+    eq_(f(1), 2)
+    eq_(calls, [1, 2, 1])
@@ -1,6 +1,7 @@
 # Copyright (C) 2015 Kristoffer Gronlund <kgronlund@suse.com>
 # See COPYING for license information.
 from crmsh import cibconfig
+from crmsh import xmlutil
 from lxml import etree
 from nose.tools import eq_, with_setup
 import copy
@@ -30,3 +31,126 @@ def test_cib_schema_change():
     factory._copy_cib_attributes(copy_of_cib, factory.cib_orig)
     eq_(factory.cib_attrs["validate-with"], "pacemaker-1.1")
     eq_(factory.cib_elem.get("validate-with"), "pacemaker-1.1")
+
+
+@with_setup(setup_func, teardown_func)
+def test_object_index():
+    "The id index follows create, rename, delete and rollback"
+    assert factory.create_object('primitive', 'idx-p1', 'Dummy')
+    eq_(factory.find_object('idx-p1').obj_id, 'idx-p1')
+    eq_(factory.find_node('ha-one').obj_type, 'node')
+    factory.rename('idx-p1', 'idx-p2')
+    eq_(factory.find_object('idx-p1'), None)
+    eq_(factory.find_object('idx-p2').obj_id, 'idx-p2')
+    eq_([o.obj_id for o in factory.find_objects('idx-*')], ['idx-p2'])
+    factory._push_state()
+    factory.delete('idx-p2')
+    eq_(factory.find_object('idx-p2'), None)
+    factory._pop_state()
+    obj = factory.find_object('idx-p2')
+    assert obj in factory.cib_objects
+    factory.delete('idx-p2')
+    eq_(factory.find_object('idx-p2'), None)
+
+
+@with_setup(setup_func, teardown_func)
+def test_related_index():
+    "Constraints follow a renamed resource"
+    assert factory.create_object('primitive', 'rel-a', 'Dummy')
+    assert factory.create_object('primitive', 'rel-b', 'Dummy')
+    assert factory.create_object('order', 'rel-o', 'Mandatory:', 'rel-a', 'rel-b')
+    eq_([o.obj_id for o in factory.related_constraints(factory.find_object('rel-a'))], ['rel-o'])
+    factory.rename('rel-a', 'rel-c')
+    eq_([o.obj_id for o in factory.related_constraints(factory.find_object('rel-c'))], ['rel-o'])
+    eq_(factory.find_object('rel-o').node.get('first'), 'rel-c')
+    factory.delete('rel-c', 'rel-b')
+    eq_(factory.find_object('rel-o'), None)
+
+
+@with_setup(setup_func, teardown_func)
+def test_rollback():
+    "A failed transaction leaves the CIB as it was"
+    assert factory.create_object('primitive', 'rb-a', 'Dummy')
+    assert factory.create_object('primitive', 'rb-b', 'Dummy')
+    assert factory.create_object('order', 'rb-o', 'Mandatory:', 'rb-a', 'rb-b')
+    before = etree.tostring(factory.cib_elem)
+    a = factory.find_object('rb-a')
+    factory._push_state()
+    assert factory.create_object('group', 'rb-g', 'rb-a', 'rb-b')
+    factory.rename('rb-g', 'rb-h')
+    eq_(factory.find_object('rb-o'), None)
+    factory._pop_state()
+    eq_(etree.tostring(factory.cib_elem), before)
+    eq_(factory.find_object('rb-h'), None)
+    eq_(factory.find_object('rb-a'), a)
+    eq_(a.parent, None)
+    eq_(factory.find_object('rb-o').node.get('first'), 'rb-a')
+    assert factory.create_object('group', 'rb-g', 'rb-a', 'rb-b')
+    factory.delete('rb-g', 'rb-a', 'rb-b')
+
+
+@with_setup(setup_func, teardown_func)
+def test_cib_patch():
+    "The patch from updated objects turns the original CIB into the new one"
+    from .test_xmlutil import apply_patch
+    assert factory.create_object('primitive', 'pt-a', 'Dummy')
+    assert factory.create_object('primitive', 'pt-b', 'Dummy')
+    assert factory.create_object('group', 'pt-g', 'pt-a', 'pt-b')
+    assert factory.create_object('location', 'pt-l', 'pt-g', '100:', 'ha-one')
+    unchanged = set(obj.node for obj in factory.cib_objects if not obj.updated)
+    assert unchanged
+    diff = xmlutil.cib_patch(factory.cib_orig, factory.cib_elem, unchanged)
+    patched = apply_patch(copy.deepcopy(factory.cib_orig), diff)
+    eq_(etree.tostring(patched), etree.tostring(factory.cib_elem))
+    factory.delete('pt-l', 'pt-g', 'pt-a', 'pt-b')
+
+
+def check_patch():
+    from .test_xmlutil import apply_patch
+    unchanged = set(obj.node for obj in factory.cib_objects if not obj.updated)
+    diff = xmlutil.cib_patch(factory.cib_orig, factory.cib_elem, unchanged)
+    patched = apply_patch(copy.deepcopy(factory.cib_orig), diff)
+    eq_(etree.tostring(patched), etree.tostring(factory.cib_elem))
+
+
+def set_committed():
+    "Make the current CIB the original one, as after a commit"
+    factory.cib_orig = copy.deepcopy(factory.cib_elem)
+    for obj in factory.cib_objects:
+        obj.reset_updated()
+
+
+@with_setup(setup_func, teardown_func)
+def test_cib_patch_group_member():
+    "Deleting a group member changes the group in the patch"
+    for rsc in ('pd-a', 'pd-b', 'pd-c'):
+        assert factory.create_object('primitive', rsc, 'Dummy')
+    assert factory.create_object('group', 'pd-g', 'pd-a', 'pd-b', 'pd-c')
+    assert factory.create_object('location', 'pd-l', 'pd-a', '100:', 'ha-one')
+    set_committed()
+    assert factory.delete('pd-b')
+    check_patch()
+    set_committed()
+    assert factory.delete('pd-a')
+    check_patch()
+    set_committed()
+    assert factory.delete('pd-g')
+    check_patch()
+    factory.delete('pd-c')
+
+
+@with_setup(setup_func, teardown_func)
+def test_bulk_load():
+    "Loading many objects at once links containers and their children"
+    prims = ["primitive bl-p%d Dummy" % i for i in range(20)]
+    groups = ["group bl-g%d bl-p%d bl-p%d" % (i, i, i + 1) for i in range(0, 20, 2)]
+    text = "\n".join(prims + groups + ["clone bl-c bl-g0", "order bl-o Mandatory: bl-c bl-g2"])
+    before = etree.tostring(factory.cib_elem)
+    assert not cibconfig.mkset_obj().save(text + "\ngroup bl-g bl-p3 bl-p4", remove=False, method='update')
+    eq_(etree.tostring(factory.cib_elem), before)
+    assert cibconfig.mkset_obj().save(text, remove=False, method='update')
+    eq_(factory.find_object('bl-p1').parent.obj_id, 'bl-g0')
+    eq_(factory.find_object('bl-g0').parent.obj_id, 'bl-c')
+    eq_([o.obj_id for o in factory.find_object('bl-g8').children], ['bl-p8', 'bl-p9'])
+    factory.delete(*(['bl-o', 'bl-c'] + ['bl-g%d' % i for i in range(0, 20, 2)] +
+                     ['bl-p%d' % i for i in range(20)]))
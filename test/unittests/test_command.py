@@ -0,0 +1,44 @@
+# See COPYING for license information.
+#
+# unit tests for command.py
+
+import os
+import sys
+import subprocess
+from nose.tools import eq_
+
+# run in a fresh interpreter: the other tests import all levels
+_LAZY = '''
+import sys
+from crmsh import command
+
+
+class Lazy(command.UI):
+    name = 'lazy'
+
+    @command.level('ui_ra.RA')
+    @command.help(\'\'\'resource agents
+\'\'\')
+    def do_ra(self):
+        pass
+
+
+info = Lazy.children()['ra']
+print info.type, info._level, 'crmsh.ui_ra' in sys.modules
+level = info.level
+print level.__module__, level.__name__, 'crmsh.ui_ra' in sys.modules
+print 'list' in info.children, Lazy().is_sublevel('ra')
+'''
+
+
+def test_lazy_level():
+    "Levels given by name are imported on first use"
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..')
+    p = subprocess.Popen([sys.executable, '-c', _LAZY], env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    eq_(p.returncode, 0, err)
+    eq_(out.splitlines(), ['level ui_ra.RA False',
+                           'crmsh.ui_ra RA True',
+                           'True True'])
@@ -0,0 +1,60 @@
+# See COPYING for license information.
+#
+# unit tests for completers.py
+
+from lxml import etree
+from nose.tools import eq_
+from crmsh import cache
+from crmsh import completers
+from crmsh import xmlutil
+
+_CIB = """<cib epoch="3" num_updates="0" admin_epoch="0"><configuration>
+<nodes><node id="1" uname="node1"/><node id="2" uname="node2"/></nodes>
+<resources><primitive id="p1" type="Dummy"/>
+<group id="g1"><primitive id="p2" type="Dummy"/></group></resources>
+</configuration><status/></cib>"""
+
+
+def test_cib_snapshot():
+    "The CIB is read again only when its configuration changed"
+    version = [("0", "3", "0")]
+    cib = [_CIB]
+    dumps = []
+
+    def cibdump2elem(section=None):
+        dumps.append(section)
+        return etree.fromstring(cib[0])
+    saved = xmlutil.cib_version, xmlutil.cibdump2elem, completers._cib_ttl
+    xmlutil.cib_version = lambda: version[0]
+    xmlutil.cibdump2elem = cibdump2elem
+    cache.invalidate("cib-commit")
+    try:
+        eq_(completers.resources([]), ["p1", "g1", "p2"])
+        eq_(completers.primitives([]), ["p1", "p2"])
+        eq_(sorted(completers.nodes([])), ["node1", "node2"])
+        eq_(len(dumps), 1)
+        version[0] = ("0", "3", "7")
+        cib[0] = _CIB.replace("<status/>", '<status><node_state uname="remote1" remote_node="true"/></status>')
+        completers.resources([])
+        eq_(len(dumps), 1)
+        # remote nodes come from the status
+        eq_(sorted(completers.nodes([])), ["node1", "node2", "remote1"])
+        eq_(len(dumps), 2)
+        completers.resources([])
+        completers.nodes([])
+        eq_(len(dumps), 2)
+        version[0] = ("0", "4", "0")
+        completers.resources([])
+        eq_(len(dumps), 3)
+        cache.invalidate("cib-commit")
+        completers.nodes([])
+        eq_(len(dumps), 4)
+        version[0] = None
+        completers.nodes([])
+        eq_(len(dumps), 4)
+        completers._cib_ttl = -1
+        completers.nodes([])
+        eq_(len(dumps), 5)
+    finally:
+        xmlutil.cib_version, xmlutil.cibdump2elem, completers._cib_ttl = saved
+        cache.invalidate("cib-commit")
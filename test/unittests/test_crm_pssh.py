@@ -0,0 +1,62 @@
+# See COPYING for license information.
+#
+# unit tests for crm_pssh.py
+
+import os
+import shutil
+import tempfile
+from nose.tools import eq_, with_setup
+from crmsh import crm_pssh
+from crmsh import history
+from crmsh import sshpool
+
+
+def setup_func():
+    "run the commands locally"
+    global _saved
+    _saved = (crm_pssh._ssh_cmd, sshpool.ssh_options)
+    crm_pssh._ssh_cmd = lambda host, cmdline, opts, pool_options: ['sh', '-c', cmdline]
+    sshpool.ssh_options = lambda hosts, options=(): []
+
+
+def teardown_func():
+    crm_pssh._ssh_cmd, sshpool.ssh_options = _saved
+
+
+@with_setup(setup_func, teardown_func)
+def test_stream_pssh():
+    chunks = {'node1': [], 'node2': []}
+    consumers = dict((host, l.append) for host, l in chunks.items())
+    l = [('node1', 'echo one; echo oops >&2; exit 3'),
+         ('node2', 'head -c 200000 /dev/zero')]
+    statuses, errors = crm_pssh.stream_pssh(l, consumers, crm_pssh.parse_args(None, None))
+    eq_(sorted(statuses), [0, 3])
+    eq_(chunks['node1'], ['one\n', None])
+    eq_(len(''.join(chunks['node2'][:-1])), 200000)
+    eq_(chunks['node2'][-1], None)
+    eq_(errors, {'node1': 'oops\n', 'node2': ''})
+
+
+@with_setup(setup_func, teardown_func)
+def test_live_update():
+    "New log lines and PE inputs go straight to the report"
+    tmpdir = tempfile.mkdtemp()
+    try:
+        log = os.path.join(tmpdir, 'node1', 'ha-log.txt')
+        os.makedirs(os.path.join(tmpdir, 'node1', 'pengine'))
+        open(os.path.join(tmpdir, 'node1', 'pengine', 'pe-input-1.bz2'), 'w').write('pe')
+        open(log, 'w').write('line 1\n')
+        logs = {'node1': history.LogAppender(log, '/var/log/ha-log', 8)}
+        l = [('node1', 'echo line 2; echo line 3')]
+        statuses, _ = crm_pssh.stream_pssh(l, logs, crm_pssh.parse_args(None, None))
+        eq_(statuses, [0])
+        eq_(open(log).read(), 'line 1\nline 2\nline 3\n')
+        eq_(history.read_log_info(log), ('/var/log/ha-log', 22))
+        untar = {'node1': history.Untar(os.path.join(tmpdir, 'new'))}
+        os.makedirs(os.path.join(tmpdir, 'new'))
+        l = [('node1', 'tar -C %s -cf - pengine' % os.path.join(tmpdir, 'node1'))]
+        crm_pssh.stream_pssh(l, untar, crm_pssh.parse_args(None, None))
+        eq_(untar['node1'].rc, 0)
+        eq_(open(os.path.join(tmpdir, 'new', 'pengine', 'pe-input-1.bz2')).read(), 'pe')
+    finally:
+        shutil.rmtree(tmpdir)
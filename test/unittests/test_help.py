@@ -0,0 +1,45 @@
+# See COPYING for license information.
+#
+# unit tests for help.py
+
+import os
+import shutil
+import tempfile
+from nose.tools import eq_
+from crmsh import config
+from crmsh import help
+
+
+def test_help_index():
+    "The help index locates the long help in the help file"
+    tmpdir = tempfile.mkdtemp()
+    helpfile = os.path.join(tmpdir, 'crm.8.adoc')
+    shutil.copy(os.path.join(config.path.sharedir, 'crm.8.adoc'), helpfile)
+    saved = os.getenv("CRM_HELP_FILE")
+    os.environ["CRM_HELP_FILE"] = helpfile
+    try:
+        eq_(help._read_index(helpfile), None)
+        help.write_index(helpfile)
+        entries = help.index_help(helpfile)
+        eq_(help._read_index(helpfile), entries)
+        entry = [e for e in entries if e[:3] == ['command', 'configure', 'primitive']][0]
+        eq_(entry[3], 'define a resource')
+        h = help.HelpEntry(entry[3], source=tuple(entry[4:]))
+        h.append("\nmore")
+        assert h.long.startswith("\nThe primitive command describes a resource.")
+        assert h.long.endswith("\nmore")
+        open(helpfile, 'a').write("\n")
+        eq_(help._read_index(helpfile), None)
+    finally:
+        if saved is None:
+            del os.environ["CRM_HELP_FILE"]
+        else:
+            os.environ["CRM_HELP_FILE"] = saved
+        shutil.rmtree(tmpdir)
+
+
+def test_overview_hides_debug_commands():
+    "Debug commands don't show in the help overview"
+    lines = help.help_overview().long.splitlines()
+    assert '\t`cd`             Navigate the level structure' in lines
+    eq_([l for l in lines if '`_' in l], [])
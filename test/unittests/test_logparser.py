@@ -0,0 +1,167 @@
+# See COPYING for license information.
+#
+# unit tests for logparser.py
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+from nose.tools import eq_, with_setup
+from crmsh import logparser
+from crmsh import logtime
+
+_REPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../history-test.tar.bz2')
+_NODES = ('xen-d', 'xen-e')
+
+_tmpdir = None
+_loc = None
+
+
+def setup_func():
+    global _tmpdir, _loc
+    _tmpdir = tempfile.mkdtemp()
+    assert os.system("tar -C '%s' -xjf '%s'" % (_tmpdir, _REPORT)) == 0
+    _loc = os.path.join(_tmpdir, 'history-test')
+    logtime.set_year(os.stat(os.path.join(_loc, 'description.txt')).st_mtime)
+
+
+def teardown_func():
+    shutil.rmtree(_tmpdir)
+
+
+def logfiles():
+    return [os.path.join(_loc, node, 'ha-log.txt') for node in _NODES]
+
+
+def parser():
+    return logparser.LogParser(_loc, logparser.CibInfo(_loc), logfiles(), 1)
+
+
+def result(lp):
+    "What a scan found: transitions, events and the log lines"
+    events = dict((etype, [tuple(e) for e in logs])
+                  for etype, logs in lp.events.iteritems() if logs)
+    return [t.to_row() for t in lp.transitions], events, list(lp.get_logs())
+
+
+def scanned(mode='force'):
+    lp = parser()
+    lp.scan(mode=mode)
+    return lp
+
+
+@with_setup(setup_func, teardown_func)
+def test_refresh():
+    "Refresh after logs grew gives the same result as a full scan"
+    full = result(scanned())
+    contents = [open(log).read() for log in logfiles()]
+    for log, data in zip(logfiles(), contents):
+        cut = data.index('\n', len(data) // 2) + 1
+        open(log, 'w').write(data[:cut])
+    lp = scanned()
+    assert result(lp) != full
+    for log, data in zip(logfiles(), contents):
+        cut = data.index('\n', len(data) // 2) + 1
+        open(log, 'a').write(data[cut:])
+    lp.scan(mode='refresh')
+    eq_(result(lp), full)
+    # nothing new: nothing changes
+    lp.scan(mode='refresh')
+    eq_(result(lp), full)
+
+
+@with_setup(setup_func, teardown_func)
+def test_parallel_scan():
+    "Scanning the logs in worker processes gives the same result as one by one"
+    serial = result(scanned())
+    pools = []
+    saved = (logparser._PARALLEL_SCAN_MIN_SIZE,
+             logparser.multiprocessing.cpu_count,
+             logparser.multiprocessing.Pool)
+
+    def pool(nprocs):
+        pools.append(nprocs)
+        return saved[2](nprocs)
+    logparser._PARALLEL_SCAN_MIN_SIZE = 0
+    logparser.multiprocessing.cpu_count = lambda: 2
+    logparser.multiprocessing.Pool = pool
+    try:
+        eq_(result(scanned()), serial)
+        eq_(pools, [2])
+    finally:
+        (logparser._PARALLEL_SCAN_MIN_SIZE,
+         logparser.multiprocessing.cpu_count,
+         logparser.multiprocessing.Pool) = saved
+
+
+@with_setup(setup_func, teardown_func)
+def test_prefilter():
+    "Looking for keywords first doesn't change what a scan finds"
+    eq_(logparser._keywords(re.compile(r"foo.*bar")), ("foo",))
+    eq_(logparser._keywords(re.compile(r"(error|warning): .* failed")), (" failed",))
+    eq_(logparser._keywords(re.compile(r"a|bc")), None)
+    eq_(logparser._keywords(re.compile(r"foo.*bar", re.I)), None)
+    assert logparser._has_keyword("rsc stop failed", (" failed", "stop"))
+    assert not logparser._has_keyword("rsc started", (" failed", "stop"))
+    assert logparser._has_keyword("anything", None)
+    full = result(scanned())
+    keyword_min_len = logparser._KEYWORD_MIN_LEN
+    logparser._KEYWORD_MIN_LEN = sys.maxint
+    try:
+        eq_(result(scanned()), full)
+    finally:
+        logparser._KEYWORD_MIN_LEN = keyword_min_len
+
+
+@with_setup(setup_func, teardown_func)
+def test_index_rebuilt():
+    "A stale, truncated or old index is not used but rebuilt"
+    full = result(scanned())
+    metafile = os.path.join(_loc, logparser._METADATA_FILENAME)
+    data = open(metafile, 'rb').read()
+    lp = parser()
+    assert lp._load_cache()
+    eq_(result(lp), full)
+
+    def check_rebuilt():
+        assert not parser()._load_cache()
+        eq_(result(scanned(mode=None)), full)
+        assert parser()._load_cache()
+
+    open(metafile, 'wb').write(data[:len(data) - 8])
+    check_rebuilt()
+    preamble = logparser._METADATA_PREAMBLE
+    magic, version, hdrlen = preamble.unpack_from(data, 0)
+    open(metafile, 'wb').write(preamble.pack(magic, version - 1, hdrlen) + data[preamble.size:])
+    check_rebuilt()
+    old = os.stat(metafile).st_mtime - logparser._METADATA_CACHE_AGE - 1
+    os.utime(metafile, (old, old))
+    check_rebuilt()
+
+
+@with_setup(setup_func, teardown_func)
+def test_timeframe_seek():
+    "Seeking to the timeframe yields the same lines as reading from the start"
+    ts_index_interval = logparser._TS_INDEX_INTERVAL
+    logparser._TS_INDEX_INTERVAL = 50
+    try:
+        lp = scanned()
+    finally:
+        logparser._TS_INDEX_INTERVAL = ts_index_interval
+    tsp = logtime.TimestampParser()
+    stamps = tsp.parse_lines(list(lp.get_logs()))
+    from_ts, to_ts = stamps[len(stamps) // 2], stamps[len(stamps) * 3 // 4]
+    lp.set_timeframe(from_ts, to_ts)
+    offsets = [lp._seek_offset(i) for i in range(len(_NODES))]
+    assert min(offsets) > 0
+    lines = list(lp.get_logs())
+    assert lines
+    assert all(from_ts <= ts <= to_ts for ts in tsp.parse_lines(lines))
+    lp._seek_offset = lambda logidx: 0
+    eq_(list(lp.get_logs()), lines)
+    # the timestamp index is kept in the metadata
+    lp = parser()
+    assert lp._load_cache()
+    lp.set_timeframe(from_ts, to_ts)
+    eq_([lp._seek_offset(i) for i in range(len(_NODES))], offsets)
@@ -3,6 +3,8 @@
 
 
 from crmsh import cibconfig
+from crmsh import options
+from crmsh import ra
 from nose.tools import eq_, with_setup
 
 factory = cibconfig.cib_factory
@@ -40,3 +42,45 @@ def test_show():
     s = setobj.repr_nopretty()
     sp = s.splitlines()
     assert_in("node ha-one", sp[0:3])
+
+
+class FakeRaIf(object):
+    "Counts meta-data reads per agent"
+    def __init__(self):
+        self.calls = {}
+
+    def meta(self, ra_class, ra_type, ra_provider):
+        agent = "%s:%s:%s" % (ra_class, ra_provider, ra_type)
+        self.calls[agent] = self.calls.get(agent, 0) + 1
+        return ['<resource-agent name="%s"><parameters/><actions/></resource-agent>' % ra_type]
+
+
+@with_setup(setup_func, teardown_func)
+def test_prefetch_meta():
+    "The agents of all primitives are read once, before the checks"
+    fake = FakeRaIf()
+    saved = ra.ra_if, ra._agent_stamp, options.regression_tests
+    ra.ra_if = lambda: fake
+    ra._agent_stamp = lambda ra_class, ra_type, ra_provider: None
+    options.regression_tests = False
+    ra._ra_cache.invalidate()
+    ids = []
+    try:
+        for i, agent in enumerate(("A", "B", "A")):
+            ids.append("pf-p%d" % i)
+            assert factory.create_object('primitive', ids[-1], 'ocf:test:%s' % agent)
+        fake.calls.clear()
+        setobj = cibconfig.mkset_obj(*ids)
+        setobj._prefetch_meta(cibconfig.mkset_obj())
+        # the uniqueness check looks at all primitives in the CIB
+        calls = dict(fake.calls)
+        eq_(calls["ocf:test:A"], 1)
+        eq_(calls["ocf:test:B"], 1)
+        eq_(set(calls.values()), set([1]))
+        setobj.semantic_check(cibconfig.mkset_obj())
+        eq_(fake.calls, calls)
+    finally:
+        for obj_id in ids:
+            factory.delete(obj_id)
+        ra.ra_if, ra._agent_stamp, options.regression_tests = saved
+        ra._ra_cache.invalidate()
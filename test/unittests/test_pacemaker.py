@@ -0,0 +1,42 @@
+# See COPYING for license information.
+#
+# unit tests for pacemaker.py
+
+import os
+import shutil
+import tempfile
+from lxml import etree
+from nose.tools import eq_
+from crmsh import config
+from crmsh import pacemaker
+
+_CIB = '''<cib validate-with="pacemaker-1.2" epoch="1" num_updates="0" admin_epoch="0">
+<configuration><crm_config/><nodes/><resources/><constraints/></configuration><status/></cib>'''
+
+
+def test_validator_cache():
+    cib = etree.fromstring(_CIB)
+    s = pacemaker.CrmSchema(cib, config.path.crm_dtd_dir)
+    eq_(s.validate_cib(cib), (True, ""))
+    schema_f = os.path.join(config.path.crm_dtd_dir, s.schema_filename)
+    assert pacemaker.relaxng(schema_f) is pacemaker.relaxng(schema_f)
+    cib.find("configuration").append(etree.Element("bogus"))
+    is_valid, msg = s.validate_cib(cib)
+    assert not is_valid
+    assert msg
+
+
+def test_expanded_schema():
+    cib = etree.fromstring(_CIB)
+    cache_dir = tempfile.mkdtemp()
+    saved_dir = pacemaker.schema_cache_dir
+    pacemaker.schema_cache_dir = lambda: os.path.join(cache_dir, "rng")
+    try:
+        s = pacemaker.RngSchema(cib, config.path.crm_dtd_dir, is_local=False)
+        schema_f = s.expanded_schema_f()
+        eq_(s.expanded_schema_f(), schema_f)
+        eq_(os.listdir(os.path.join(cache_dir, "rng")), [os.path.basename(os.path.dirname(schema_f))])
+        eq_(s.validate_cib(cib), (True, ""))
+    finally:
+        pacemaker.schema_cache_dir = saved_dir
+        shutil.rmtree(cache_dir)
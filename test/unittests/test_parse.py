@@ -67,6 +67,25 @@ class TestBaseParser(unittest.TestCase):
             self.base.match_idspec()
         self.assertRaises(parse.ParseError, runner)
 
+    def test_split(self):
+        for s in ('a b  c', "params a='x y' b=\"p \\\"q\\\" \\r\"", 'a""b \'\' c\\ d',
+                  'x \\\n y', '"a\\'):
+            try:
+                expected = shlex.split(s)
+            except ValueError, e:
+                expected = str(e)
+            try:
+                result = parse.split(s)
+            except ValueError, e:
+                result = str(e)
+            self.assertEqual(expected, result)
+
+    def test_keyword(self):
+        self._reset('RULE x')
+        self.assertTrue(self.base.try_match('rule'))
+        self.assertEqual(self.base.matched(0), 'RULE')
+        self.assertFalse(self.base.try_match('rule'))
+
     def test_match_split(self):
         self._reset('resource:role')
         a, b = self.base.match_split()
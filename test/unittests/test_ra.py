@@ -0,0 +1,102 @@
+# See COPYING for license information.
+#
+# unit tests for ra.py
+
+import shutil
+import tempfile
+from nose.tools import eq_
+from crmsh import ra
+from crmsh import options
+
+
+def test_meta_disk_cache():
+    tmpdir = tempfile.mkdtemp()
+    cache_dir = ra._meta_cache_dir
+    try:
+        ra._meta_cache_dir = lambda: tmpdir
+        stamp = "1.0 10 /dummy\n"
+        eq_(ra._load_cached_meta("ocf:test:Dummy", stamp), None)
+        ra._save_cached_meta("ocf:test:Dummy", stamp, "<resource-agent/>")
+        eq_(ra._load_cached_meta("ocf:test:Dummy", stamp), "<resource-agent/>")
+        eq_(ra._load_cached_meta("ocf:test:Dummy", "2.0 10 /dummy\n"), None)
+        eq_(ra._load_cached_meta("ocf:test:Other", stamp), None)
+    finally:
+        ra._meta_cache_dir = cache_dir
+        shutil.rmtree(tmpdir)
+
+
+def test_meta_disk_cache_regression():
+    "The regression tests always run the agent"
+    tmpdir = tempfile.mkdtemp()
+    saved = ra._meta_cache_dir, ra._agent_stamp, ra.ra_if, options.regression_tests
+
+    class FakeRaIf(object):
+        def meta(self, ra_class, ra_type, ra_provider):
+            return ['<resource-agent name="agent"/>']
+    try:
+        ra._meta_cache_dir = lambda: tmpdir
+        ra._agent_stamp = lambda ra_class, ra_type, ra_provider: "1.0 10 /dummy\n"
+        ra.ra_if = FakeRaIf
+        ra._save_cached_meta("ocf:test:Dummy", "1.0 10 /dummy\n", '<resource-agent name="disk"/>')
+        agent = ra.RAInfo("ocf", "Dummy", "test")
+        options.regression_tests = False
+        eq_(agent._read_meta().get("name"), "disk")
+        options.regression_tests = True
+        eq_(agent._read_meta().get("name"), "agent")
+    finally:
+        ra._meta_cache_dir, ra._agent_stamp, ra.ra_if, options.regression_tests = saved
+        shutil.rmtree(tmpdir)
+
+
+def test_agent_stamp():
+    eq_(ra._agent_stamp("ocf", "NoSuchAgent", "nosuchprovider"), None)
+    eq_(ra._agent_stamp("systemd", "foo", None), None)
+
+
+class FakeRaIf(object):
+    "Counts meta-data reads per agent"
+    def __init__(self):
+        self.calls = {}
+
+    def meta(self, ra_class, ra_type, ra_provider):
+        agent = "%s:%s:%s" % (ra_class, ra_provider, ra_type)
+        self.calls[agent] = self.calls.get(agent, 0) + 1
+        return ['<resource-agent name="%s">' % ra_type,
+                '<parameters/><actions/>',
+                '</resource-agent>']
+
+
+def stub_meta(fn):
+    "Run fn(fake) with the agent meta-data reads stubbed out"
+    fake = FakeRaIf()
+    saved = ra.ra_if, ra._agent_stamp, options.regression_tests
+    ra.ra_if = lambda: fake
+    ra._agent_stamp = lambda ra_class, ra_type, ra_provider: None
+    options.regression_tests = False
+    ra._ra_cache.invalidate()
+    try:
+        fn(fake)
+    finally:
+        ra.ra_if, ra._agent_stamp, options.regression_tests = saved
+        ra._ra_cache.invalidate()
+
+
+def test_prefetch_meta():
+    def check(fake):
+        agents = [ra.RAInfo("ocf", t, "test") for t in ("A", "B", "C", "A", "B")]
+        # the regression tests read the agents in order
+        options.regression_tests = True
+        ra.prefetch_meta(agents)
+        eq_(fake.calls, {})
+        options.regression_tests = False
+        ra.prefetch_meta(agents)
+        eq_(fake.calls, {"ocf:test:A": 1, "ocf:test:B": 1, "ocf:test:C": 1})
+        hits = ra._ra_cache.hits
+        for agent in agents:
+            eq_(agent.meta().get("name"), agent.ra_type)
+        eq_(ra._ra_cache.hits, hits + len(agents))
+        eq_(fake.calls, {"ocf:test:A": 1, "ocf:test:B": 1, "ocf:test:C": 1})
+        # all cached: nothing more to read
+        ra.prefetch_meta(agents)
+        eq_(sum(fake.calls.values()), 3)
+    stub_meta(check)
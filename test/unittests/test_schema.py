@@ -0,0 +1,38 @@
+# See COPYING for license information.
+#
+# unit tests for schema.py
+
+import os
+import shutil
+import tempfile
+from lxml import etree
+from nose.tools import eq_
+from crmsh import config
+from crmsh import pacemaker
+from crmsh import schema
+
+_CIB = '<cib validate-with="pacemaker-1.2"/>'
+
+
+def test_tables():
+    saved_name = schema.validate_name()
+    cache_dir = tempfile.mkdtemp()
+    saved_dir = pacemaker.schema_cache_dir
+    pacemaker.schema_cache_dir = lambda: cache_dir
+    try:
+        cib = etree.fromstring(_CIB)
+        schema.init_schema(cib)
+        assert os.path.isfile(os.path.join(cache_dir, "pacemaker-1.2.json"))
+        live = pacemaker.CrmSchema(cib, config.path.crm_dtd_dir)
+        schema.init_schema(cib)
+        eq_(schema._crm_schema, None)
+        for t, fun in schema._cache_funcs.iteritems():
+            for name in ("op", "primitive", "rsc_order", "date_expression"):
+                eq_(schema.get(t, name), fun(live, name))
+        eq_(schema.validate_name(), "pacemaker-1.2")
+        eq_(schema._crm_schema, None)
+    finally:
+        # restore while the tables still go to the temporary cache
+        schema.init_schema(etree.Element("cib", {"validate-with": saved_name}))
+        pacemaker.schema_cache_dir = saved_dir
+        shutil.rmtree(cache_dir)
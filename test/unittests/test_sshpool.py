@@ -0,0 +1,83 @@
+# See COPYING for license information.
+#
+# unit tests for sshpool.py
+
+from nose.tools import eq_, with_setup
+from crmsh import sshpool
+
+_calls = []
+_rcs = {}
+
+
+def fake_run(cmds):
+    _calls.extend(cmds)
+    return [_rcs.get((cmd[-1], '-M' in cmd), 0) for cmd in cmds]
+
+
+def setup_func():
+    global _saved_run
+    _saved_run = sshpool._run
+    sshpool._run = fake_run
+    sshpool._masters.clear()
+    del _calls[:]
+    _rcs.clear()
+
+
+def teardown_func():
+    sshpool._masters.clear()
+    sshpool._run = _saved_run
+
+
+def ops(cmds):
+    return [(cmd[-1], '-O' in cmd and cmd[cmd.index('-O') + 1] or 'master') for cmd in cmds]
+
+
+@with_setup(setup_func, teardown_func)
+def test_connect():
+    _rcs[('node1', False)] = 255  # no master yet
+    sshpool.connect(['node1', 'node2'])
+    eq_(ops(_calls), [('node1', 'check'), ('node2', 'check'), ('node1', 'master')])
+    del _calls[:]
+    sshpool.connect(['node1', ('node2', None, None)])
+    eq_(_calls, [])
+    sshpool.close()
+    eq_(sorted(ops(_calls)), [('node1', 'exit'), ('node2', 'exit')])
+
+
+@with_setup(setup_func, teardown_func)
+def test_no_master():
+    "Hosts without a master are not retried on every call"
+    _rcs[('node1', False)] = 255
+    _rcs[('node1', True)] = 255
+    sshpool.connect(['node1'])
+    eq_(ops(_calls), [('node1', 'check'), ('node1', 'master')])
+    del _calls[:]
+    sshpool.connect(['node1'])
+    eq_(_calls, [])
+    sshpool.close()
+    eq_(_calls, [])
+
+
+@with_setup(setup_func, teardown_func)
+def test_port_user():
+    sshpool.connect([('node1', 2222, 'root')])
+    cmd = _calls[0]
+    eq_(cmd[cmd.index('-p') + 1], '2222')
+    eq_(cmd[cmd.index('-l') + 1], 'root')
+    assert cmd[2].startswith('ControlPath=')
+
+
+@with_setup(setup_func, teardown_func)
+def test_options():
+    "Masters use the ssh options of the caller and are shared only between equal options"
+    sshpool.connect(['node1'])
+    master = _calls[-1]
+    assert 'StrictHostKeyChecking=no' not in master
+    del _calls[:]
+    sshpool.connect(['node1'], ['StrictHostKeyChecking=no', 'ControlPersist=no'])
+    eq_(ops(_calls), [('node1', 'check')])
+    master = _calls[-1]
+    assert 'StrictHostKeyChecking=no' in master
+    assert 'ControlPersist=no' not in master
+    assert master[2] != ('ControlPath=' + sshpool._control_path(()))
+    eq_(len(sshpool._masters), 2)
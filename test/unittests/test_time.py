@@ -22,3 +22,22 @@ def test_time_convert2():
     tm = time.localtime(utils.datetime_to_timestamp(utils.make_datetime_naive(datetime.datetime(2015, 6, 1, 10, 0, 0).replace(tzinfo=loctz))))
     ts = time.localtime(utils.parse_to_timestamp('Jun 01, 2015 10:00:00'))
     eq_(time.strftime('%Y-%m-%d %H:%M:%S', ts), time.strftime('%Y-%m-%d %H:%M:%S', tm))
+
+
+def test_timestamp_parser():
+    logtime.set_year(utils.parse_to_timestamp('Jun 01, 2015 10:00:00'))
+    lines = ["Jun 01 10:00:00 node1 crmd[1]: notice: a\n",
+             "Jun 01 10:00:00 node1 crmd[1]: notice: b\n",
+             "    continued\n",
+             "Jun 01 10:00:01 [123] node2 crmd: notice: c\n",
+             "2015-06-01T10:00:02.500+00:00 node3 crmd[1]: notice: d\n"]
+    tsp = logtime.TimestampParser()
+    eq_(tsp.parse_lines(lines), [logtime.syslog_ts(l) for l in lines])
+    ts = tsp.parse_lines(lines)
+    eq_(ts[0], ts[1])
+    eq_(ts[1], ts[2])
+    eq_(ts[3] - ts[1], 1.0)
+    eq_(tsp.ts_node(lines[3]), (ts[3], 'node2'))
+    eq_(tsp.ts_node(lines[2]), (ts[3], 'node2'))
+    eq_(tsp.ts_node(lines[4])[1], 'node3')
+    eq_(tsp.ts(lines[4]) - tsp.ts_node(lines[4])[0], 0.5)
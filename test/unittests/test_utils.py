@@ -7,6 +7,8 @@ import os
 from itertools import chain
 from crmsh import utils
 from crmsh import config
+from crmsh import cache
+from crmsh import constants
 
 
 def test_systeminfo():
@@ -120,3 +122,133 @@ def test_msec():
     assert utils.crm_msec('1') == 1000
     assert utils.crm_msec('1m') == 60*1000
     assert utils.crm_msec('1h') == 60*60*1000
+
+
+def test_remote_diff_this():
+    "Only the copies with a different digest are fetched"
+    local = utils.str2tmp("a\nb\n")
+    other = utils.str2tmp("a\nc\n")
+    slurped = []
+    pages = []
+
+    def remote_diff_slurp(nodes, filename):
+        slurped.extend(nodes)
+        return [(n, (0, '', '', other)) for n in nodes]
+    saved = utils.remote_digests, utils.remote_diff_slurp, utils.page_string
+    utils.remote_digests = lambda nodes, filename: {'node1': utils.file_digest(local),
+                                                    'node2': utils.file_digest(other)}
+    utils.remote_diff_slurp = remote_diff_slurp
+    utils.page_string = pages.append
+    try:
+        utils.remote_diff_this(local, ['node1', 'node2', 'node3'], 'node0')
+        assert slurped == ['node2', 'node3']
+        assert len(pages) == 2 and '+b' in pages[0]
+        del slurped[:]
+        utils.remote_diff(local, ['node1', 'node2'])
+        assert slurped == ['node1', 'node2']
+        del slurped[:]
+        utils.remote_digests = lambda nodes, filename: {'node1': 'x', 'node2': 'x'}
+        utils.remote_diff(local, ['node1', 'node2'])
+        assert slurped == []
+    finally:
+        utils.remote_digests, utils.remote_diff_slurp, utils.page_string = saved
+        os.unlink(local)
+        os.unlink(other)
+
+
+def test_remote_digests():
+    "The file name is quoted, and errors are kept with strict"
+    import parallax
+    from crmsh import sshpool
+    calls = []
+
+    def call(nodes, cmd, opts):
+        calls.append(cmd)
+        return {'node1': (0, 'abc  /tmp/x\n', ''),
+                'node2': parallax.Error("Connection refused", None)}
+    saved = parallax.call, sshpool.ssh_options
+    parallax.call = call
+    sshpool.ssh_options = lambda hosts, options=(): []
+    try:
+        digests = utils.remote_digests(['node1', 'node2'], "/tmp/it's; rm -rf x")
+        assert calls == ["sha1sum '/tmp/it'\"'\"'s; rm -rf x'"]
+        assert digests == {'node1': 'abc'}
+        try:
+            utils.remote_checksum("/tmp/x", ['node1', 'node2'], 'node1')
+            assert False, "no error"
+        except ValueError, e:
+            assert str(e) == "Failed on node2: Connection refused"
+    finally:
+        parallax.call, sshpool.ssh_options = saved
+
+
+def test_probed():
+    "Probe results are kept until the programs change"
+    import shutil
+    import tempfile
+    calls = []
+
+    def probe():
+        calls.append(1)
+        return "1.1.14"
+    cache_dir = tempfile.mkdtemp()
+    saved = utils.probe_cache_file, utils._probes, utils._probe_key
+    utils.probe_cache_file = lambda: os.path.join(cache_dir, "probes")
+    key = [["crmd", "/usr/sbin/crmd", 1.0]]
+    utils._probe_key = lambda: key
+    try:
+        utils._probes = None
+        assert utils.probed("version", probe) == "1.1.14"
+        assert utils.probed("version", probe) == "1.1.14"
+        utils._probes = None  # next invocation
+        assert utils.probed("version", probe) == "1.1.14"
+        assert len(calls) == 1
+        key[0][2] = 2.0
+        utils._probes = None
+        assert utils.probed("version", probe) == "1.1.14"
+        assert len(calls) == 2
+        key[0][1] = "/usr/lib/pacemaker/crmd"
+        utils._probes = None
+        assert utils.probed("version", probe) == "1.1.14"
+        assert len(calls) == 3
+        assert utils.probed("nothing", lambda: None) is None
+        assert "nothing" not in utils._probes["probes"]
+    finally:
+        utils.probe_cache_file, utils._probes, utils._probe_key = saved
+        shutil.rmtree(cache_dir)
+
+
+def test_cibadmin_can_patch():
+    "Patches are used only with Pacemaker versions which can apply them"
+    saved = constants.pcmk_version
+    try:
+        for version, can_patch in (("1.1.10", False), ("1.1.11", False),
+                                   ("1.1.12", True), ("1.1.13-3.1", True)):
+            constants.pcmk_version = version
+            cache.region("crmsh.utils.cibadmin_can_patch").invalidate()
+            assert utils.cibadmin_can_patch() == can_patch
+    finally:
+        constants.pcmk_version = saved
+        cache.region("crmsh.utils.cibadmin_can_patch").invalidate()
+
+
+def test_atomic_write():
+    "The file is replaced only once written completely"
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    fname = os.path.join(tmpdir, "sub", "file")
+    try:
+        with utils.atomic_write(fname) as f:
+            f.write("one")
+        assert open(fname).read() == "one"
+        try:
+            with utils.atomic_write(fname) as f:
+                f.write("two")
+                raise IOError("disk full")
+        except IOError:
+            pass
+        assert open(fname).read() == "one"
+        assert os.listdir(os.path.dirname(fname)) == ["file"]
+    finally:
+        shutil.rmtree(tmpdir)
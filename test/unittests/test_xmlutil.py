@@ -0,0 +1,143 @@
+# See COPYING for license information.
+#
+# unit tests for xmlutil.py
+
+import copy
+from lxml import etree
+from nose.tools import eq_
+from crmsh import xmlutil
+
+
+def apply_patch(cib, diff, by_position=False):
+    '''
+    Apply a v2 patch like Pacemaker does: in order, or (newer
+    versions) deletes and modifies first, then creates and
+    moves sorted by position.
+    '''
+    changes = list(diff.iterchildren("change"))
+    if by_position:
+        first = [c for c in changes if c.get("operation") in ("delete", "modify")]
+        rest = [c for c in changes if c not in first]
+        changes = first + sorted(rest, key=lambda c: int(c.get("position")))
+    for c in changes:
+        op = c.get("operation")
+        match = cib.xpath(c.get("path"))
+        eq_(len(match), 1)
+        match = match[0]
+        if op == "delete":
+            match.getparent().remove(match)
+        elif op == "create":
+            match.insert(int(c.get("position")), copy.deepcopy(c[0]))
+        elif op == "move":
+            parent = match.getparent()
+            parent.remove(match)
+            parent.insert(int(c.get("position")), match)
+        elif op == "modify":
+            match.attrib.clear()
+            for name, value in c.find("change-result")[0].items():
+                match.set(name, value)
+    return cib
+
+
+def check_patch(old, new, unchanged=()):
+    old, new = etree.fromstring(old), etree.fromstring(new)
+    diff = xmlutil.cib_patch(old, new, unchanged)
+    for by_position in (False, True):
+        patched = apply_patch(copy.deepcopy(old), diff, by_position)
+        eq_(etree.tostring(patched), etree.tostring(new))
+    return diff
+
+
+def ops(diff):
+    return [c.get("operation") for c in diff.iterchildren("change")]
+
+
+_OLD = """<cib a="1"><configuration><resources>
+<primitive id="p1" type="Dummy"><meta_attributes id="p1-m">
+<nvpair id="p1-m-1" name="target-role" value="Stopped"/></meta_attributes></primitive>
+<primitive id="p2" type="Dummy"/>
+<group id="g1"><!--# a group--><primitive id="p3" type="Dummy"/><primitive id="p4" type="Dummy"/></group>
+</resources><constraints/></configuration></cib>"""
+
+
+def test_patch_none():
+    eq_(ops(check_patch(_OLD, _OLD)), [])
+
+
+def test_patch_modify():
+    diff = check_patch(_OLD, _OLD.replace('value="Stopped"', 'value="Started"').replace(' a="1"', ''))
+    eq_(ops(diff), ["modify", "modify"])
+    eq_(diff[1].get("path"), "/cib")
+    eq_(diff[2].get("path"),
+        "/cib/configuration/resources/primitive[@id='p1']/meta_attributes[@id='p1-m']/nvpair[@id='p1-m-1']")
+
+
+def test_patch_create_delete():
+    new = _OLD.replace('<primitive id="p2" type="Dummy"/>', '<primitive id="p5" type="Dummy"/>')
+    new = new.replace('<constraints/>', '<constraints><rsc_order id="o1" first="p1" then="p5"/></constraints>')
+    eq_(ops(check_patch(_OLD, new)), ["delete", "create", "create"])
+
+
+def test_patch_move():
+    new = _OLD.replace('<primitive id="p3" type="Dummy"/><primitive id="p4" type="Dummy"/>',
+                       '<primitive id="p4" type="Dummy"/><primitive id="p6" type="Dummy"/><primitive id="p3" type="Dummy"/>')
+    eq_(ops(check_patch(_OLD, new)), ["move", "create"])
+
+
+def test_patch_comment():
+    "Changed comments are replaced together with their element"
+    new = _OLD.replace('# a group', '# the group')
+    eq_(ops(check_patch(_OLD, new)), ["delete", "create"])
+
+
+def test_patch_unchanged():
+    old = etree.fromstring(_OLD)
+    new = copy.deepcopy(old)
+    new.find(".//primitive[@id='p2']").set("type", "Stateful")
+    eq_(ops(xmlutil.cib_patch(old, new)), ["modify"])
+    eq_(ops(xmlutil.cib_patch(old, new, set(new.iter("primitive")))), [])
+
+
+_CRM_MON = """<crm_mon version="1.1.14"><resources>
+<resource id="p1" role="Started" active="true" nodes_running_on="1"><node name="node1" id="1"/></resource>
+<resource id="p2" role="Stopped" active="false" nodes_running_on="0"/>
+<group id="g1" number_resources="2">
+<resource id="p3" role="Started" active="true" nodes_running_on="1"><node name="node2" id="2"/></resource>
+<resource id="p4" role="Stopped" active="false" nodes_running_on="0"/></group>
+<clone id="c1" multi_state="false" unique="true">
+<resource id="p5:0" role="Started" active="true" nodes_running_on="1"><node name="node1" id="1"/></resource>
+<resource id="p5:1" role="Started" active="true" nodes_running_on="1"><node name="node2" id="2"/></resource>
+</clone></resources></crm_mon>"""
+
+_RESOURCES = """<configuration><resources>
+<primitive id="p1" type="Dummy"/><primitive id="p2" type="Dummy"/>
+<group id="g1"><primitive id="p3" type="Dummy"/><primitive id="p4" type="Dummy"/></group>
+<clone id="c1"><primitive id="p5" type="Dummy"/></clone>
+</resources></configuration>"""
+
+
+def test_rsc_state():
+    "Resource state comes from one status snapshot"
+    calls = []
+
+    def get_stdout(cmd, stderr_on=True):
+        calls.append(cmd)
+        return 0, _CRM_MON
+    saved = xmlutil.get_stdout, xmlutil.is_live_cib, xmlutil.cibdump2elem
+    xmlutil.get_stdout = get_stdout
+    xmlutil.is_live_cib = lambda: True
+    xmlutil.cibdump2elem = lambda section=None: etree.fromstring(_RESOURCES)
+    try:
+        rscstat = xmlutil.RscState()
+        eq_([rscstat.is_running(x) for x in ("p1", "p2", "p3", "p4", "p5", "g1", "c1", "nosuch")],
+            [True, False, True, False, True, True, True, False])
+        eq_(rscstat.running_on("p5"), ["node1", "node2"])
+        eq_(rscstat.running_on("g1"), ["node2"])
+        eq_(rscstat.can_delete("p2"), True)
+        eq_(rscstat.can_delete("p1"), False)
+        eq_(calls, [xmlutil.RscState.status_snapshot])
+        rscstat.refresh()
+        rscstat.is_running("p1")
+        eq_(len(calls), 2)
+    finally:
+        xmlutil.get_stdout, xmlutil.is_live_cib, xmlutil.cibdump2elem = saved